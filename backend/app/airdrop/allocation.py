@@ -0,0 +1,200 @@
+"""
+Converts a snapshot (see app/airdrop/snapshot.py) into token allocations.
+
+    python -m app.airdrop.allocation --snapshot snapshot.csv.gz --output allocations.npz
+
+Every user is a row in a set of NumPy columns and every rule in
+ALLOCATION_CONFIG is applied to whole columns at once, so 10M users take
+seconds. Allocations are integers (token base units) and always add up to
+the total supply, minus what the per-user cap makes impossible to give out;
+`allocate` checks this before anything is written.
+
+The output is an uncompressed .npz with two aligned columns, `telegram_id`
+and `allocation` (sorted by telegram_id), plus a JSON `summary`.
+"""
+import argparse
+import gzip
+import json
+import logging
+import time
+
+import numpy as np
+
+from app.airdrop.snapshot import SNAPSHOT_COLUMNS
+from app.core.config import ALLOCATION_CONFIG
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("airdrop_allocation")
+
+# Everything but digits, commas, minus signs and newlines, so NDJSON rows
+# reduce to the same "1,2,3" text as CSV rows
+_NON_NUMERIC = bytes(c for c in range(256) if chr(c) not in "0123456789,-\n")
+
+
+class AllocationError(Exception):
+    pass
+
+
+def _parse_block(block: bytes) -> np.ndarray:
+    text = block.translate(None, _NON_NUMERIC).replace(b"\n", b",").strip(b",")
+    if not text:
+        return np.empty((0, len(SNAPSHOT_COLUMNS)), dtype=np.int64)
+    values = np.fromstring(text, dtype=np.int64, sep=",")
+    return values.reshape(-1, len(SNAPSHOT_COLUMNS))
+
+
+def load_snapshot(path: str, block_size: int = 64 << 20) -> dict:
+    """Reads an NDJSON or CSV snapshot (gzipped or not) into one int64 array per column."""
+    opener = gzip.open if path.endswith(".gz") else open
+    blocks = []
+    with opener(path, "rb") as f:
+        first = f.readline()
+        # CSV header
+        if not first.startswith(b"telegram_id"):
+            blocks.append(_parse_block(first))
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            # Only parse whole lines
+            block += f.readline()
+            blocks.append(_parse_block(block))
+    table = np.concatenate(blocks) if blocks else _parse_block(b"")
+    return {name: np.ascontiguousarray(table[:, i]) for i, name in enumerate(SNAPSHOT_COLUMNS)}
+
+
+def compute_weights(columns: dict, config: dict) -> np.ndarray:
+    points = columns["points"].astype(np.float64)
+    eligible = columns["points"] >= config["min_points"]
+
+    base = np.sqrt(points) if config["weighting"] == "sqrt" else points.copy()
+
+    tier_mins = np.array([t[0] for t in config["tiers"]], dtype=np.float64)
+    tier_mults = np.array([t[1] for t in config["tiers"]], dtype=np.float64)
+    tier = np.searchsorted(tier_mins, points, side="right") - 1
+    base *= tier_mults[np.clip(tier, 0, None)]
+
+    bonus = np.minimum(
+        columns["friends_count"] * config["referral_bonus_per_friend"], config["referral_bonus_cap"]
+    )
+    bonus += columns["tasks_completed"] * config["task_bonus_per_task"]
+    base *= 1.0 + bonus
+    base *= np.where(columns["is_premium"] > 0, config["premium_multiplier"], 1.0)
+
+    return np.where(eligible, base, 0.0)
+
+
+def _capped_shares(weights: np.ndarray, supply: int, cap: int) -> np.ndarray:
+    """
+    Proportional split of `supply` with no share above `cap` (water-filling):
+    capped users are fixed at the cap and the rest is re-split among the others.
+    """
+    exact = np.zeros_like(weights)
+    free = weights > 0
+    remaining = float(supply)
+    while free.any() and remaining > 0:
+        exact[free] = weights[free] * (remaining / weights[free].sum())
+        over = free & (exact > cap)
+        if not over.any():
+            break
+        exact[over] = cap
+        free &= ~over
+        remaining = supply - float(cap) * np.count_nonzero(~free & (weights > 0))
+    return exact
+
+
+def allocate(columns: dict, config: dict = ALLOCATION_CONFIG) -> tuple:
+    """Returns (allocation array aligned with the columns, summary dict)."""
+    supply = int(config["total_supply"])
+    cap = int(supply * config["max_share"])
+    weights = compute_weights(columns, config)
+    eligible = weights > 0
+    n_eligible = int(np.count_nonzero(eligible))
+
+    # Caps may make it impossible to hand out everything
+    distributable = min(supply, cap * n_eligible)
+    exact = _capped_shares(weights, distributable, cap)
+
+    allocation = np.floor(exact).astype(np.int64)
+    np.minimum(allocation, cap, out=allocation)
+    # Largest-remainder rounding so the integers add up exactly
+    remainder = distributable - int(allocation.sum())
+    if remainder:
+        fraction = exact - np.floor(exact)
+        if remainder > 0:
+            fraction[(allocation >= cap) | ~eligible] = -1.0
+            picked = np.argpartition(-fraction, remainder - 1)[:remainder]
+            allocation[picked] += 1
+        else:
+            fraction[allocation <= 0] = 2.0
+            picked = np.argpartition(fraction, -remainder - 1)[:-remainder]
+            allocation[picked] -= 1
+
+    allocated = int(allocation.sum())
+    summary = {
+        "users": int(len(allocation)),
+        "eligible": n_eligible,
+        "total_supply": supply,
+        "allocated": allocated,
+        "unallocated": supply - allocated,
+        "capped": int(np.count_nonzero(allocation >= cap)) if n_eligible else 0,
+        "max_allocation": int(allocation.max()) if len(allocation) else 0,
+    }
+    verify_allocation(allocation, eligible, summary, cap)
+    return allocation, summary
+
+
+def verify_allocation(allocation: np.ndarray, eligible: np.ndarray, summary: dict, cap: int):
+    if summary["allocated"] + summary["unallocated"] != summary["total_supply"]:
+        raise AllocationError("allocations do not conserve the total supply")
+    if summary["unallocated"] and summary["unallocated"] != summary["total_supply"] - cap * summary["eligible"]:
+        raise AllocationError(f"{summary['unallocated']} units left unallocated below the caps")
+    if (allocation < 0).any() or (allocation > cap).any():
+        raise AllocationError("allocation outside [0, cap]")
+    if (allocation[~eligible] != 0).any():
+        raise AllocationError("ineligible users received tokens")
+
+
+def write_allocations(path: str, telegram_ids: np.ndarray, allocation: np.ndarray, summary: dict):
+    order = np.argsort(telegram_ids, kind="stable")
+    # Uncompressed, so the columns can be memory-mapped by readers
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            telegram_id=telegram_ids[order],
+            allocation=allocation[order],
+            summary=np.array(json.dumps(summary)),
+        )
+
+
+def load_allocations(path: str) -> tuple:
+    with np.load(path) as data:
+        return data["telegram_id"], data["allocation"], json.loads(str(data["summary"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute airdrop allocations from a snapshot")
+    parser.add_argument("--snapshot", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--config", help="JSON file overriding ALLOCATION_CONFIG entries")
+    args = parser.parse_args()
+
+    config = dict(ALLOCATION_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+
+    started = time.monotonic()
+    columns = load_snapshot(args.snapshot)
+    loaded = time.monotonic()
+    allocation, summary = allocate(columns, config)
+    write_allocations(args.output, columns["telegram_id"], allocation, summary)
+    logger.info(
+        f"Allocated {summary['allocated']} units to {summary['eligible']} of {summary['users']} users "
+        f"(load {loaded - started:.1f}s, allocate+write {time.monotonic() - loaded:.1f}s)"
+    )
+    logger.info(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
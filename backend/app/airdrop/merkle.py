@@ -0,0 +1,210 @@
+"""
+Merkle tree over the airdrop allocations, for on-chain claims.
+
+    python -m app.airdrop.merkle --allocations allocations.npz --output proofs.bin
+
+Leaves are sha256(uint64 telegram_id || uint256 amount), big-endian, in
+telegram_id order. Parents hash their two children in sorted order, so a
+proof is just the list of siblings (the OpenZeppelin MerkleProof layout,
+with sha256 for the hash). Leaves hash 40 bytes and parents 64, so a parent
+can never pass for a leaf. A node without a sibling is promoted unchanged.
+
+The whole tree goes in one file that is built in batches through a memory
+map and read the same way:
+
+    header   MAGIC, version, leaf count, level count, root
+    counts   nodes per level (uint64 each, leaves first)
+    ids      telegram_id per leaf (int64, sorted)
+    amounts  allocation per leaf (uint64)
+    levels   32-byte nodes, leaves first, root last
+
+A proof lookup is a binary search over `ids` plus one 32-byte read per
+level, so serving proofs needs neither the file in memory nor a per-user
+proof blob.
+"""
+import argparse
+import hashlib
+import logging
+import mmap
+import struct
+import time
+
+import numpy as np
+
+from app.airdrop.allocation import load_allocations
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("airdrop_merkle")
+
+MAGIC = b"MRKL"
+VERSION = 1
+# Padded to 64 bytes so the int64 columns that follow stay 8-byte aligned
+HEADER = struct.Struct("<4sIQI32s12x")
+
+BATCH = 1 << 18  # Nodes hashed per batch
+
+
+def _sha256_rows(rows: np.ndarray) -> np.ndarray:
+    """sha256 of every row of a 2-D uint8 array."""
+    width = rows.shape[1]
+    data = rows.tobytes()
+    sha256 = hashlib.sha256
+    digests = b"".join([sha256(data[o:o + width]).digest() for o in range(0, len(data), width)])
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32)
+
+
+def leaf_hashes(telegram_ids: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    n = len(telegram_ids)
+    packed = np.zeros((n, 40), dtype=np.uint8)
+    packed[:, :8] = telegram_ids.astype(">u8").view(np.uint8).reshape(n, 8)
+    packed[:, 32:] = amounts.astype(">u8").view(np.uint8).reshape(n, 8)
+    return _sha256_rows(packed)
+
+
+def hash_pairs(nodes: np.ndarray) -> np.ndarray:
+    """Parents of an even-length run of nodes: sha256(min(a, b) || max(a, b))."""
+    left, right = nodes[0::2], nodes[1::2]
+    # Lexicographic comparison of 32-byte rows via their big-endian words
+    lw = left.view(">u8").reshape(-1, 4)
+    rw = right.view(">u8").reshape(-1, 4)
+    differs = lw != rw
+    first = differs.argmax(axis=1)
+    rows = np.arange(len(lw))
+    swap = lw[rows, first] > rw[rows, first]
+    joined = np.concatenate([left, right], axis=1)
+    joined[swap] = np.concatenate([right[swap], left[swap]], axis=1)
+    return _sha256_rows(joined)
+
+
+def hash_pair(a: bytes, b: bytes) -> bytes:
+    return hashlib.sha256(a + b if a <= b else b + a).digest()
+
+
+def verify_proof(leaf: bytes, proof: list, root: bytes) -> bool:
+    node = leaf
+    for sibling in proof:
+        node = hash_pair(node, sibling)
+    return node == root
+
+
+def level_counts(leaves: int) -> list:
+    counts = [leaves]
+    while counts[-1] > 1:
+        counts.append((counts[-1] + 1) // 2)
+    return counts
+
+
+def build_tree(telegram_ids: np.ndarray, amounts: np.ndarray, output: str) -> bytes:
+    """Writes the proof file; ids must be sorted and unique. Returns the root."""
+    n = len(telegram_ids)
+    if n == 0:
+        raise ValueError("no allocations to build a tree from")
+    counts = level_counts(n)
+    base = HEADER.size + 8 * len(counts) + 16 * n
+    size = base + 32 * sum(counts)
+
+    out = np.memmap(output, dtype=np.uint8, mode="w+", shape=(size,))
+    out[HEADER.size:HEADER.size + 8 * len(counts)] = np.array(counts, dtype="<u8").view(np.uint8)
+    ids_at = HEADER.size + 8 * len(counts)
+    out[ids_at:ids_at + 8 * n] = telegram_ids.astype("<i8").view(np.uint8)
+    out[ids_at + 8 * n:base] = amounts.astype("<u8").view(np.uint8)
+
+    offset = base
+    levels = []
+    for count in counts:
+        levels.append(out[offset:offset + 32 * count].reshape(count, 32))
+        offset += 32 * count
+
+    for lo in range(0, n, BATCH):
+        hi = min(lo + BATCH, n)
+        levels[0][lo:hi] = leaf_hashes(telegram_ids[lo:hi], amounts[lo:hi])
+
+    for depth in range(1, len(counts)):
+        below, above = levels[depth - 1], levels[depth]
+        pairs = len(below) // 2
+        for lo in range(0, pairs, BATCH):
+            hi = min(lo + BATCH, pairs)
+            above[lo:hi] = hash_pairs(below[2 * lo:2 * hi])
+        if len(below) % 2:
+            above[-1] = below[-1]
+
+    root = bytes(levels[-1][0])
+    out[:HEADER.size] = np.frombuffer(HEADER.pack(MAGIC, VERSION, n, len(counts), root), dtype=np.uint8)
+    out.flush()
+    del out
+    return root
+
+
+class ProofFile:
+    """Read side of the proof file; everything stays memory-mapped."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, depth, root = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} proof file")
+        self.path = path
+        self.root = root
+        self.count = n
+
+        offset = HEADER.size
+        self.counts = list(struct.unpack_from(f"<{depth}Q", self._map, offset))
+        offset += 8 * depth
+        self.ids = np.frombuffer(self._map, dtype="<i8", count=n, offset=offset)
+        offset += 8 * n
+        self._amounts_at = offset
+        offset += 8 * n
+        # Byte offset of each level's first node
+        self._levels_at = []
+        for count in self.counts:
+            self._levels_at.append(offset)
+            offset += 32 * count
+
+    def _node(self, depth: int, index: int) -> bytes:
+        at = self._levels_at[depth] + 32 * index
+        return self._map[at:at + 32]
+
+    def lookup(self, telegram_id: int) -> dict | None:
+        index = int(self.ids.searchsorted(telegram_id))
+        if index >= self.count or int(self.ids[index]) != telegram_id:
+            return None
+
+        proof = []
+        position = index
+        for depth, count in enumerate(self.counts[:-1]):
+            sibling = position ^ 1
+            if sibling < count:
+                proof.append(self._node(depth, sibling))
+            position //= 2
+
+        amount_at = self._amounts_at + 8 * index
+        return {
+            "telegram_id": telegram_id,
+            "amount": int.from_bytes(self._map[amount_at:amount_at + 8], "little"),
+            "index": index,
+            "leaf": self._node(0, index),
+            "proof": proof,
+            "root": self.root,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the airdrop Merkle tree and proof file")
+    parser.add_argument("--allocations", required=True, help=".npz written by app.airdrop.allocation")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--include-zero", action="store_true", help="Also add users allocated nothing")
+    args = parser.parse_args()
+
+    telegram_ids, amounts, _ = load_allocations(args.allocations)
+    if not args.include_zero:
+        keep = amounts > 0
+        telegram_ids, amounts = telegram_ids[keep], amounts[keep]
+
+    started = time.monotonic()
+    root = build_tree(telegram_ids, amounts, args.output)
+    logger.info(f"{len(telegram_ids)} leaves in {time.monotonic() - started:.1f}s, root 0x{root.hex()}")
+
+
+if __name__ == "__main__":
+    main()
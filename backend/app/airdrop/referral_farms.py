@@ -0,0 +1,370 @@
+"""
+Finds referral farms: clusters of accounts that exist to collect referral
+rewards.
+
+    python -m app.airdrop.referral_farms --source postgres [--dry-run]
+    python -m app.airdrop.referral_farms --source redis
+
+Every referrer -> referee edge is loaded into NumPy columns (Postgres has
+every user's `friends` in raw_state; Redis has the resident users'
+`user:*:referrals`). Connected components are found with a vectorized
+union-find. Each component with at least `min_cluster_size` accounts is
+scored on the shares in REFERRAL_FARM_CONFIG:
+
+- burst: most referees that joined within `burst_window` of each other
+- zero_taps: referees that never tapped (users.total_clicks; in Redis, the
+  profile's total_taps)
+- names: referees sharing the most common name once digits and symbols are
+  dropped ("user123", "User_77")
+
+Everything after loading works on whole columns, so tens of millions of
+edges take seconds to score (see benchmarks/bench_referral_farms.py).
+Loading dominates.
+
+Clusters scoring at least `flag_score` replace the previous run's flags in
+Redis: FARM_CLUSTERS_KEY ranks them by score (member: the top referrer),
+a "referral_farm:<root>" hash describes each, and FARM_USERS_KEY maps every
+account in them to its cluster's root. Both sets are written under
+temporary names and renamed over the old ones, so readers see one run's
+flags or the next's, never a mix or none.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import zlib
+
+import numpy as np
+import psycopg2
+from redis.asyncio.cluster import RedisCluster
+
+from app.core.config import REFERRAL_FARM_CONFIG
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.services.base import RedisKeys
+from app.services.season_service import SeasonService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("referral_farms")
+
+# Tagged alike: on a cluster, RENAME needs both names in one slot
+FARM_CLUSTERS_KEY = "{referral_farms}:clusters"
+FARM_USERS_KEY = "{referral_farms}:users"
+
+EDGE_COLUMNS = ("referrer", "referee", "joined_at", "name", "taps")
+WRITE_BATCH = 10_000
+
+
+def farm_key(root: int | str) -> str:
+    return f"referral_farm:{root}"
+
+
+def name_pattern(name: str | None) -> int:
+    """CRC32 of the letters of a name, lowercased; 0 when nothing is left."""
+    letters = "".join(c for c in (name or "").lower() if c.isalpha())
+    return zlib.crc32(letters.encode()) if letters else 0
+
+
+def _batch(rows: list) -> dict:
+    """Column arrays of (referrer, referee, joined_at, name pattern, referee taps) rows."""
+    table = np.array(rows, dtype=np.int64).reshape(-1, len(EDGE_COLUMNS))
+    return {name: table[:, i] for i, name in enumerate(EDGE_COLUMNS)}
+
+
+def concat(batches: list) -> dict:
+    if not batches:
+        return {name: np.empty(0, dtype=np.int64) for name in EDGE_COLUMNS}
+    return {name: np.concatenate([b[name] for b in batches]) for name in EDGE_COLUMNS}
+
+
+def _lookup(ids: np.ndarray, values: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """values[ids == key] for each key (ids sorted); -1 for keys not in ids."""
+    if not len(ids):
+        return np.full(len(keys), -1, dtype=np.int64)
+    at = np.minimum(np.searchsorted(ids, keys), len(ids) - 1)
+    return np.where(ids[at] == keys, values[at], -1)
+
+
+# ----------------------------------------------------------------------
+# Sources: async generators of edge batches
+# ----------------------------------------------------------------------
+async def postgres_edges(batch_size: int):
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        with conn.cursor() as cur:
+            # Referees without a row yet get -1 taps: unknown, not zero
+            cur.execute("SELECT telegram_id, COALESCE(total_clicks, 0) FROM users ORDER BY telegram_id")
+            ids, clicks = np.array(await asyncio.to_thread(cur.fetchall), dtype=np.int64).reshape(-1, 2).T
+        # Named cursor: the result set stays on the server
+        with conn.cursor(name="referral_edges") as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                """
+                SELECT u.telegram_id, f.key::bigint,
+                       COALESCE((f.value::jsonb->>'joined_at')::bigint, 0), f.value::jsonb->>'first_name'
+                FROM users u, jsonb_each_text(u.raw_state->'friends') f
+                """
+            )
+            while True:
+                rows = await asyncio.to_thread(cur.fetchmany, batch_size)
+                if not rows:
+                    return
+                batch = _batch([(src, dst, joined, name_pattern(name), 0) for src, dst, joined, name in rows])
+                batch["taps"] = _lookup(ids, clicks, batch["referee"])
+                yield batch
+    finally:
+        conn.close()
+
+
+def _friend_fields(log: str) -> tuple[int, str]:
+    """joined_at and first_name of a referral log entry (see ReferralService.process_referral)."""
+    entry = json.loads(log)
+    return int(entry.get("joined_at", 0)), entry.get("first_name")
+
+
+async def redis_edges(client, batch_size: int):
+    """SCAN over every `user:*:referrals` hash; on a cluster, every primary in turn."""
+    nodes = sorted(client.get_primaries(), key=lambda n: n.name) if isinstance(client, RedisCluster) else [None]
+    pattern = RedisKeys.user_referrals("*")
+    for node in nodes:
+        cursor = None
+        while cursor != 0:
+            if node is None:
+                cursor, keys = await client.scan(cursor or 0, match=pattern, count=batch_size)
+            else:
+                cursors, keys = await client.scan(cursor or 0, match=pattern, count=batch_size, target_nodes=node)
+                cursor = cursors[node.name]
+            if not keys:
+                continue
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            friends = await pipe.execute()
+
+            rows = []
+            for key, entries in zip(keys, friends):
+                referrer = int(key.split(":")[1].strip("{}"))
+                for referee, log in entries.items():
+                    joined_at, name = _friend_fields(log)
+                    rows.append([referrer, int(referee), joined_at, name_pattern(name), 0])
+            if not rows:
+                continue
+            pipe = client.pipeline(transaction=False)
+            for row in rows:
+                pipe.hget(RedisKeys.user(row[1]), "total_taps")
+            for row, taps in zip(rows, await pipe.execute()):
+                # Evicted or unknown profiles, and ones from before the counter: -1, not counted either way
+                row[4] = -1 if taps is None else int(taps)
+            yield _batch(rows)
+
+
+async def load_edges(batches) -> dict:
+    loaded = []
+    async for batch in batches:
+        loaded.append(batch)
+    return concat(loaded)
+
+
+# ----------------------------------------------------------------------
+# Analysis
+# ----------------------------------------------------------------------
+def _unique(values: np.ndarray, counts: bool = False):
+    """
+    np.unique by sorting (in place: `values` is consumed); NumPy 2's
+    hash-based unique is far slower on big int arrays.
+    """
+    values.sort()
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    starts = np.flatnonzero(first)
+    del first
+    if not counts:
+        return values[starts]
+    return values[starts], np.diff(np.append(starts, len(values)))
+
+
+def connected_components(referrer: np.ndarray, referee: np.ndarray) -> tuple:
+    """
+    (nodes, node index of each edge's referrer, of its referee, component of
+    each node). Union-find over whole arrays: every round links each edge's
+    two roots (the larger under the smaller) and then compresses paths by
+    pointer jumping until every node points at its root. Components are
+    labelled by their smallest node index.
+    """
+    nodes = _unique(np.concatenate([referrer, referee]))
+    # int32 indices halve the memory of everything below
+    src = np.searchsorted(nodes, referrer).astype(np.int32)
+    dst = np.searchsorted(nodes, referee).astype(np.int32)
+    parent = np.arange(len(nodes), dtype=np.int32)
+    while True:
+        a, b = parent[src], parent[dst]
+        pending = a != b
+        if not pending.any():
+            return nodes, src, dst, parent
+        np.minimum.at(parent, np.maximum(a, b)[pending], np.minimum(a, b)[pending])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def score_clusters(edges: dict, config: dict = REFERRAL_FARM_CONFIG) -> dict:
+    """
+    Scores every component; returns the flagged ones as columns (root, size,
+    score and each share) plus `members` / `member_roots`, aligned.
+    """
+    nodes, src, dst, label = connected_components(edges["referrer"], edges["referee"])
+    # Components are labelled by a member's index; number them 0..clusters-1 instead
+    is_label = label == np.arange(len(label))
+    clusters = np.flatnonzero(is_label)
+    cluster_of = (np.cumsum(is_label, dtype=np.int32) - 1)[label]
+    del is_label, label
+    size = np.bincount(cluster_of, minlength=len(clusters))
+    edge_cluster = cluster_of[src]
+    referees = np.maximum(np.bincount(edge_cluster, minlength=len(clusters)), 1)
+
+    # Root: the one account in a referral tree nobody referred
+    is_referee = np.zeros(len(nodes), dtype=bool)
+    is_referee[dst] = True
+    root = nodes[clusters].copy()
+    root[cluster_of[~is_referee]] = nodes[~is_referee]
+
+    # Keys sort by cluster, then by join time / name within it
+    by_time = np.sort((edge_cluster.astype(np.int64) << 32) | (edges["joined_at"] & 0xFFFFFFFF))
+    in_window = np.searchsorted(by_time, by_time + config["burst_window"], side="left") - np.arange(len(by_time))
+    burst = np.zeros(len(clusters), dtype=np.int64)
+    np.maximum.at(burst, by_time >> 32, in_window)
+
+    known = edges["taps"] >= 0
+    zero_taps = np.bincount(edge_cluster[known], weights=edges["taps"][known] == 0, minlength=len(clusters))
+    tap_known = np.maximum(np.bincount(edge_cluster[known], minlength=len(clusters)), 1)
+
+    named = edges["name"] != 0
+    same_name, counts = _unique((edge_cluster[named].astype(np.int64) << 32) | edges["name"][named], counts=True)
+    names = np.zeros(len(clusters), dtype=np.int64)
+    np.maximum.at(names, same_name >> 32, counts)
+
+    shares = {
+        "burst": burst / referees,
+        "zero_taps": zero_taps / tap_known,
+        "names": names / referees,
+    }
+    score = sum(config["weights"][name] * share for name, share in shares.items())
+    flagged = (size >= config["min_cluster_size"]) & (score >= config["flag_score"])
+
+    member = flagged[cluster_of]
+    return {
+        "root": root[flagged],
+        "size": size[flagged],
+        "score": score[flagged],
+        **{name: share[flagged] for name, share in shares.items()},
+        "members": nodes[member],
+        "member_roots": root[cluster_of[member]],
+        "clusters": len(clusters),
+        "accounts": len(nodes),
+    }
+
+
+# ----------------------------------------------------------------------
+# Flags
+# ----------------------------------------------------------------------
+async def write_flags(client, result: dict):
+    """Replaces the previous run's flags with `result`'s."""
+    next_clusters, next_users = f"{FARM_CLUSTERS_KEY}:next", f"{FARM_USERS_KEY}:next"
+    # Left over by a run that died
+    await client.unlink(next_clusters, next_users)
+
+    flagged_at = int(time.time())
+    for lo in range(0, len(result["root"]), WRITE_BATCH):
+        pipe = client.pipeline(transaction=False)
+        for i in range(lo, min(lo + WRITE_BATCH, len(result["root"]))):
+            root = int(result["root"][i])
+            pipe.zadd(next_clusters, {root: round(float(result["score"][i]), 4)})
+            pipe.hset(farm_key(root), mapping={
+                "size": int(result["size"][i]),
+                "score": round(float(result["score"][i]), 4),
+                "burst": round(float(result["burst"][i]), 4),
+                "zero_taps": round(float(result["zero_taps"][i]), 4),
+                "names": round(float(result["names"][i]), 4),
+                "flagged_at": flagged_at,
+            })
+        await pipe.execute()
+    for lo in range(0, len(result["members"]), WRITE_BATCH):
+        members = result["members"][lo:lo + WRITE_BATCH].tolist()
+        roots = result["member_roots"][lo:lo + WRITE_BATCH].tolist()
+        # Ids below 2^53 are exact as scores
+        await client.zadd(next_users, dict(zip(map(str, members), roots)))
+
+    previous = await client.zrange(FARM_CLUSTERS_KEY, 0, -1)
+    pipe = client.pipeline()
+    if len(result["root"]):
+        pipe.rename(next_clusters, FARM_CLUSTERS_KEY)
+        pipe.rename(next_users, FARM_USERS_KEY)
+    else:
+        # Nothing flagged, so nothing was written to rename
+        pipe.unlink(FARM_CLUSTERS_KEY, FARM_USERS_KEY)
+    await pipe.execute()
+
+    # Clusters of the previous run that are no longer flagged
+    flagged = set(map(str, result["root"].tolist()))
+    stale = [root for root in previous if root not in flagged]
+    for lo in range(0, len(stale), WRITE_BATCH):
+        pipe = client.pipeline(transaction=False)
+        for root in stale[lo:lo + WRITE_BATCH]:
+            pipe.unlink(farm_key(root))
+        await pipe.execute()
+
+
+async def run(source: str, batch_size: int, dry_run: bool, config: dict) -> dict:
+    client = new_redis_client()
+    try:
+        # Referees' profiles are read from the current season's keys
+        await SeasonService.refresh(client, force=True)
+        started = time.monotonic()
+        edges = await load_edges(
+            postgres_edges(batch_size) if source == "postgres" else redis_edges(client, batch_size)
+        )
+        loaded = time.monotonic()
+        result = score_clusters(edges, config)
+        scored = time.monotonic()
+        if not dry_run:
+            await write_flags(client, result)
+        summary = {
+            "edges": len(edges["referrer"]),
+            "accounts": result["accounts"],
+            "clusters": result["clusters"],
+            "flagged_clusters": len(result["root"]),
+            "flagged_accounts": len(result["members"]),
+            "load_seconds": round(loaded - started, 1),
+            "score_seconds": round(scored - loaded, 1),
+        }
+        for i in np.argsort(-result["score"])[:10]:
+            logger.info(
+                f"Cluster {result['root'][i]}: {result['size'][i]} accounts, score {result['score'][i]:.2f} "
+                f"(burst {result['burst'][i]:.2f}, zero taps {result['zero_taps'][i]:.2f}, "
+                f"names {result['names'][i]:.2f})"
+            )
+        return summary
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag referral farms")
+    parser.add_argument("--source", choices=("postgres", "redis"), default="postgres")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be flagged")
+    parser.add_argument("--config", help="JSON file overriding REFERRAL_FARM_CONFIG entries")
+    args = parser.parse_args()
+
+    config = dict(REFERRAL_FARM_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    summary = asyncio.run(run(args.source, args.batch_size, args.dry_run, config))
+    logger.info(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+End-of-season snapshot of every user, for the token distribution.
+
+    python -m app.airdrop.snapshot --source postgres --output snapshot.ndjson.gz
+    python -m app.airdrop.snapshot --source redis --format csv --output snapshot.csv
+
+Postgres is the complete source (run it after the sync queues have drained);
+Redis only holds resident users but needs no sync. Users are streamed in
+batches and the output is written in self-contained chunks (one gzip member
+each when compressed), so memory stays flat whatever the user count.
+
+After every chunk the file is fsynced and `{output}.checkpoint` records the
+source position and file offset. Running the same command again truncates
+the file to that offset and continues. When the export finishes,
+`{output}.manifest.json` records the row count and the SHA-256 of the file.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+import psycopg2
+from redis.asyncio.cluster import RedisCluster
+
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.services.base import RedisKeys, current_season
+from app.services.season_service import SeasonService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("airdrop_snapshot")
+
+SNAPSHOT_COLUMNS = (
+    "telegram_id", "points", "level", "friends_count", "tasks_completed", "is_premium",
+)
+
+# Tasks are stored as JSON strings; counting this marker avoids decoding each one
+CLAIMED_MARKER = '"status": "claimed"'
+
+PROGRESS_INTERVAL = 5  # Seconds between progress lines
+
+_NDJSON_ROW = "{" + ",".join(f'"{c}":%d' for c in SNAPSHOT_COLUMNS) + "}\n"
+_CSV_ROW = ",".join("%d" for _ in SNAPSHOT_COLUMNS) + "\n"
+
+
+def format_rows(rows: list, fmt: str) -> bytes:
+    """Rows are tuples of ints in SNAPSHOT_COLUMNS order."""
+    template = _NDJSON_ROW if fmt == "ndjson" else _CSV_ROW
+    return "".join([template % row for row in rows]).encode()
+
+
+class SnapshotCheckpoint:
+    """Source position, bytes and rows written as of the last complete chunk."""
+
+    def __init__(self, output: str):
+        self.path = f"{output}.checkpoint"
+
+    def load(self) -> dict | None:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: dict):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ----------------------------------------------------------------------
+# Sources: async generators of (rows, position after these rows)
+# ----------------------------------------------------------------------
+async def postgres_batches(position, batch_size: int, season: int):
+    """
+    Keyset order by telegram_id; `position` is the last exported id.
+    The running season is read from `users`, earlier ones from the archive.
+    """
+    if season == current_season():
+        table, season_filter = "users", "COALESCE((raw_state->>'season')::int, 0) = %s"
+    else:
+        table, season_filter = "user_seasons", "season = %s"
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        # Named cursor: the result set stays on the server
+        with conn.cursor(name="airdrop_snapshot") as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                """
+                SELECT
+                    telegram_id,
+                    points,
+                    level,
+                    COALESCE((raw_state->'referral_summary'->>'friends_count')::bigint, 0),
+                    (SELECT count(*) FROM jsonb_each_text(raw_state->'tasks') t
+                     WHERE t.value LIKE %s),
+                    COALESCE((raw_state->'profile'->>'is_premium')::int, 0)
+                FROM {table}
+                WHERE telegram_id > %s AND {season_filter}
+                ORDER BY telegram_id
+                """.format(table=table, season_filter=season_filter),
+                (f"%{CLAIMED_MARKER}%", position or 0, season),
+            )
+            while True:
+                rows = await asyncio.to_thread(cur.fetchmany, batch_size)
+                if not rows:
+                    return
+                yield rows, rows[-1][0]
+    finally:
+        conn.close()
+
+
+async def redis_batches(client, position, batch_size: int, season: int | None = None):
+    """
+    SCAN over profile hashes. `position` is the SCAN cursor to continue from;
+    on a cluster, where every primary is scanned in turn, [node index, cursor].
+    """
+    nodes = sorted(client.get_primaries(), key=lambda n: n.name) if isinstance(client, RedisCluster) else [None]
+    node_index, cursor = position if isinstance(position, list) else (0, int(position or 0))
+    pattern = RedisKeys.user_scan_pattern(season)
+    while True:
+        node = nodes[node_index]
+        if node is None:
+            cursor, keys = await client.scan(cursor, match=pattern, count=batch_size, _type="hash")
+        else:
+            cursors, keys = await client.scan(cursor, match=pattern, count=batch_size, _type="hash", target_nodes=node)
+            cursor = cursors[node.name]
+        user_ids = [uid for uid in (RedisKeys.profile_user_id(key, season) for key in keys) if uid]
+        rows = []
+        if user_ids:
+            pipe = client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.hmget(RedisKeys.user(user_id, season), "points", "level", "is_premium")
+                pipe.hget(RedisKeys.user_referral(user_id), "friends_count")
+                pipe.hvals(RedisKeys.user_tasks(user_id, season))
+            res = await pipe.execute()
+            for i, user_id in enumerate(user_ids):
+                (points, level, premium), friends, tasks = res[3 * i], res[3 * i + 1], res[3 * i + 2]
+                claimed = sum(1 for task in tasks if CLAIMED_MARKER in task)
+                rows.append((
+                    int(user_id), int(points or 0), int(level or 1), int(friends or 0), claimed,
+                    int(premium or 0),
+                ))
+        done = cursor == 0 and node_index == len(nodes) - 1
+        if cursor == 0 and not done:
+            node_index += 1
+        if rows or done:
+            yield rows, cursor if node is None else [node_index, cursor]
+        if done:
+            return
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def export_snapshot(
+    batches_for,
+    output: str,
+    fmt: str = "ndjson",
+    compress: bool = False,
+    chunk_rows: int = 100_000,
+    source_name: str = "",
+) -> dict:
+    """
+    `batches_for(position)` returns one of the source generators above,
+    started at `position` (None for a fresh export). Returns the manifest.
+    """
+    checkpoint = SnapshotCheckpoint(output)
+    state = checkpoint.load()
+    if state and state.get("done"):
+        state = None
+    if state:
+        logger.info(f"Resuming after {state['rows']} rows at offset {state['offset']}")
+        f = open(output, "r+b")
+        f.truncate(state["offset"])
+        f.seek(state["offset"])
+    else:
+        state = {"position": None, "offset": 0, "rows": 0}
+        f = open(output, "wb")
+
+    def write_chunk(data: bytes, position, rows: int):
+        if compress:
+            data = gzip.compress(data, compresslevel=4, mtime=0)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        state.update(position=position, offset=f.tell(), rows=state["rows"] + rows)
+        checkpoint.save(state)
+
+    started = time.monotonic()
+    last_report = started
+    exported_before = state["rows"]
+    try:
+        if state["offset"] == 0 and fmt == "csv":
+            write_chunk((",".join(SNAPSHOT_COLUMNS) + "\n").encode(), None, 0)
+
+        pending, pending_rows, position = [], 0, state["position"]
+        async for rows, position in batches_for(state["position"]):
+            if rows:
+                pending.append(format_rows(rows, fmt))
+                pending_rows += len(rows)
+            if pending_rows >= chunk_rows:
+                write_chunk(b"".join(pending), position, pending_rows)
+                pending, pending_rows = [], 0
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                rate = (state["rows"] + pending_rows - exported_before) / (now - started)
+                logger.info(f"exported={state['rows'] + pending_rows} rate={rate:,.0f} users/s")
+                last_report = now
+        if pending:
+            write_chunk(b"".join(pending), position, pending_rows)
+    finally:
+        f.close()
+
+    manifest = {
+        "file": os.path.basename(output),
+        "source": source_name,
+        "format": fmt,
+        "compression": "gzip" if compress else None,
+        "columns": list(SNAPSHOT_COLUMNS),
+        "rows": state["rows"],
+        "bytes": state["offset"],
+        "sha256": file_sha256(output),
+        "created_at": int(time.time()),
+    }
+    with open(f"{output}.manifest.json", "w") as mf:
+        json.dump(manifest, mf, indent=2)
+    checkpoint.save({**state, "done": True})
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Snapshot complete: {manifest['rows']} rows in {elapsed:.1f}s "
+        f"({(manifest['rows'] - exported_before) / max(elapsed, 1e-9):,.0f} users/s)"
+    )
+    return manifest
+
+
+async def _run(args):
+    client = new_redis_client()
+    try:
+        current = await SeasonService.refresh(client, force=True)
+        season = current if args.season is None else args.season
+        if args.source == "postgres":
+            return await export_snapshot(
+                lambda position: postgres_batches(position, args.batch_size, season),
+                args.output, args.format, args.compress, args.chunk_rows, f"postgres:season-{season}",
+            )
+        if season != current:
+            raise SystemExit("Redis only holds the running season; use --source postgres")
+        return await export_snapshot(
+            lambda position: redis_batches(client, position, args.batch_size),
+            args.output, args.format, args.compress, args.chunk_rows, f"redis:season-{season}",
+        )
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the airdrop snapshot of every user")
+    parser.add_argument("--source", choices=("postgres", "redis"), default="postgres")
+    parser.add_argument("--season", type=int, help="Default: the running season")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--compress", action="store_true", help="gzip the output")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Users per source read")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Users per checkpointed chunk")
+    args = parser.parse_args()
+
+    if args.source == "postgres" and not POSTGRES_URL:
+        parser.error("POSTGRES_URL is not set")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import hmac
+import os
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.services.activity_service import ActivityService
+from app.services.bot_detector import BotDetector
+
+router = APIRouter()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Without ADMIN_TOKEN configured the admin endpoints are closed entirely
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.get("/admin/analytics", dependencies=[Depends(require_admin)])
+async def get_analytics(day: Optional[date] = None):
+    """
+    DAU, new users, D1 / D7 retention and unique tappers for a UTC day (default today).
+    Everything is computed from the per-day bitmaps, so the cost doesn't grow with traffic.
+    """
+    return await ActivityService.day_report(day or ActivityService.today())
+
+
+@router.get("/admin/bots", dependencies=[Depends(require_admin)])
+async def get_flagged_bots(limit: int = Query(100, ge=1, le=1000)):
+    """Users flagged by the tap stream's bot detector, most recent first."""
+    return await BotDetector.review(limit)
+
+
+@router.delete("/admin/bots/{user_id}", dependencies=[Depends(require_admin)])
+async def clear_bot_flag(user_id: int):
+    if not await BotDetector.clear(user_id):
+        raise HTTPException(status_code=404, detail="User is not flagged")
+    return {"status": "cleared"}
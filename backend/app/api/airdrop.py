@@ -0,0 +1,37 @@
+import os
+
+from fastapi import APIRouter, HTTPException
+from app.airdrop.merkle import ProofFile
+from app.schemas import AirdropProof
+
+router = APIRouter()
+
+# Written by `python -m app.airdrop.merkle`; unset until the season's tree is built
+AIRDROP_PROOF_FILE = os.getenv("AIRDROP_PROOF_FILE", "")
+
+_proofs: ProofFile | None = None
+
+
+def get_proof_file() -> ProofFile:
+    global _proofs
+    if not AIRDROP_PROOF_FILE:
+        raise HTTPException(status_code=503, detail="Airdrop proofs are not published yet")
+    if _proofs is None or _proofs.path != AIRDROP_PROOF_FILE:
+        _proofs = ProofFile(AIRDROP_PROOF_FILE)
+    return _proofs
+
+
+@router.get("/airdrop/proof/{user_id}", response_model=AirdropProof)
+async def get_airdrop_proof(user_id: int):
+    """The user's allocation with the Merkle proof needed to claim it on-chain."""
+    entry = get_proof_file().lookup(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No allocation for this user")
+    return {
+        "telegram_id": entry["telegram_id"],
+        "amount": str(entry["amount"]),
+        "index": entry["index"],
+        "leaf": "0x" + entry["leaf"].hex(),
+        "proof": ["0x" + node.hex() for node in entry["proof"]],
+        "root": "0x" + entry["root"].hex(),
+    }
@@ -1,12 +1,33 @@
-from fastapi import APIRouter
-from app.schemas import UserData
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from app.core.responses import fast_json
+from app.core.sessions import issue_session, telegram_user
+from app.schemas import UserData, BootstrapResponse
+from app.services.bootstrap_service import BootstrapService
 from app.services.game_service import GameService
 from app.services.task_service import TaskService
 
 router = APIRouter()
 
+
+def verified_user(user: UserData, tg_user: Optional[dict]) -> UserData:
+    """Telegram's signed profile wins over whatever the body claims."""
+    if tg_user is None:
+        return user
+    return UserData(
+        id=tg_user["id"],
+        username=tg_user.get("username"),
+        first_name=tg_user.get("first_name", ""),
+        last_name=tg_user.get("last_name"),
+        is_premium=bool(tg_user.get("is_premium")),
+    )
+
+
 @router.post("/auth")
-async def login(user: UserData):
+async def login(user: UserData, tg_user: Optional[dict] = Depends(telegram_user)):
+    user = verified_user(user, tg_user)
+
     # 1. Ensure user exists
     await GameService.create_user_if_not_exists(user)
     
@@ -18,5 +39,14 @@ async def login(user: UserData):
     
     return {
         "user": user,
-        "gameState": state
+        "gameState": state,
+        "session": issue_session(user.id)[0] if tg_user else None,
     }
+
+@router.post("/bootstrap", response_model=BootstrapResponse)
+async def bootstrap(user: UserData, tg_user: Optional[dict] = Depends(telegram_user)):
+    """Everything the app shows on open (game state, passive income, tasks, referrals) in one call."""
+    user = verified_user(user, tg_user)
+    data = await BootstrapService.bootstrap(user)
+    data["session"] = issue_session(user.id)[0] if tg_user else None
+    return fast_json(data, BootstrapResponse)
@@ -0,0 +1,34 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request
+from app.core.sessions import authorize, session_user
+from fastapi.responses import StreamingResponse
+from app.services.event_hub import event_hub, EventHub
+
+router = APIRouter()
+
+# Comment lines keep proxies from closing idle streams
+KEEPALIVE_SECONDS = 15
+
+@router.get("/events/{user_id}")
+async def stream_events(user_id: int, request: Request, session: Optional[int] = Depends(session_user)):
+    """
+    Server-Sent Events stream of the user's balance and leaderboard rank.
+    Pushes are coalesced: at most one `state` event per push interval.
+    EventSource can't send headers, so the session comes as `?session=`.
+    """
+    authorize(session, user_id)
+    async def stream():
+        client = event_hub.connect(user_id)
+        try:
+            while not await request.is_disconnected():
+                state = await client.next_state(KEEPALIVE_SECONDS)
+                yield EventHub.format_sse(state) if state else ": keepalive\n\n"
+        finally:
+            event_hub.disconnect(client)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,23 +1,86 @@
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from app.core import wire
+from app.core.responses import fast_json
+from app.core.sessions import authorize, session_user
 # Add PassiveEarnResponse to imports
 from app.schemas import TapPayload, TapResponse, UpgradePayload, UserPayload, PassiveEarnResponse
 from app.services.game_service import GameService
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 router = APIRouter()
 
+
+# --- Content negotiation: JSON or the binary frames of app/core/wire.py ---
+def _validate(model: type[BaseModel], body: bytes | None = None, data: dict | None = None):
+    try:
+        return model.model_validate_json(body) if body is not None else model.model_validate(data)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
+
+
+def _wire_decode(decode, body: bytes) -> tuple:
+    try:
+        return decode(body)
+    except wire.WireError as e:
+        raise HTTPException(400, f"Malformed request: {e}")
+
+
+async def tap_request(request: Request) -> tuple[TapPayload, Optional[int]]:
+    """(payload, acknowledged state version, or None for JSON clients)"""
+    body = await request.body()
+    if wire.is_wire_request(request.headers.get("content-type")):
+        user_id, taps, ack = _wire_decode(wire.decode_tap_request, body)
+        return _validate(TapPayload, data={"user_id": user_id, "taps": taps}), ack
+    return _validate(TapPayload, body), None
+
+
+async def passive_request(request: Request) -> tuple[UserPayload, Optional[int]]:
+    body = await request.body()
+    if wire.is_wire_request(request.headers.get("content-type")):
+        user_id, ack = _wire_decode(wire.decode_passive_request, body)
+        return _validate(UserPayload, data={"user_id": user_id}), ack
+    return _validate(UserPayload, body), None
+
+
+def _request_body(model: type[BaseModel]) -> dict:
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": model.model_json_schema()},
+        wire.WIRE_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+
+
 # --- Existing Endpoints ---
-@router.post("/tap", response_model=TapResponse)
-async def sync_taps(payload: TapPayload):
-    return await GameService.process_tap(payload.user_id, payload.taps)
+@router.post("/tap", response_model=TapResponse, openapi_extra=_request_body(TapPayload))
+async def sync_taps(
+    request: tuple[TapPayload, Optional[int]] = Depends(tap_request),
+    session: Optional[int] = Depends(session_user),
+):
+    payload, ack = request
+    authorize(session, payload.user_id)
+    state = await GameService.process_tap(payload.user_id, payload.taps)
+    if ack is not None:
+        return Response(wire.encode_tap_response(state, ack), media_type=wire.WIRE_MEDIA_TYPE)
+    return fast_json(state, TapResponse)
 
 @router.post("/upgrade")
-async def buy_upgrade(payload: UpgradePayload):
+async def buy_upgrade(payload: UpgradePayload, session: Optional[int] = Depends(session_user)):
+    authorize(session, payload.user_id)
     return await GameService.buy_upgrade(payload.user_id, payload.upgrade_type)
 
-@router.post("/sync-passive", response_model=PassiveEarnResponse)
-async def sync_passive_income(payload: UserPayload):
-    return await GameService.sync_passive_income(payload.user_id)
+@router.post("/sync-passive", response_model=PassiveEarnResponse, openapi_extra=_request_body(UserPayload))
+async def sync_passive_income(
+    request: tuple[UserPayload, Optional[int]] = Depends(passive_request),
+    session: Optional[int] = Depends(session_user),
+):
+    payload, ack = request
+    authorize(session, payload.user_id)
+    result = await GameService.sync_passive_income(payload.user_id)
+    if ack is not None:
+        return Response(wire.encode_passive_response(result, ack), media_type=wire.WIRE_MEDIA_TYPE)
+    return fast_json(result, PassiveEarnResponse)
 
 # --- NEW: Endpoint to Buy Profit Per Hour ---
 
@@ -27,11 +90,12 @@ class BuyCardPayload(BaseModel):
     profit_increase: int
 
 @router.post("/buy-card")
-async def buy_card(payload: BuyCardPayload):
+async def buy_card(payload: BuyCardPayload, session: Optional[int] = Depends(session_user)):
     """
     Test Endpoint: Buy an upgrade that increases Profit/Hour.
     In a real app, you would validate the card ID against a config file.
     """
+    authorize(session, payload.user_id)
     return await GameService.buy_mining_upgrade(
         user_id=payload.user_id, 
         cost=payload.cost, 
@@ -0,0 +1,21 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Query
+from app.core.responses import fast_json
+from app.schemas import LeaderboardResponse
+from app.services.leaderboard_service import LeaderboardService, LEADERBOARD_MAX_DEPTH
+
+router = APIRouter()
+
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    offset: int = Query(0, ge=0, lt=LEADERBOARD_MAX_DEPTH),
+    limit: int = Query(50, gt=0, le=100),
+    user_id: Optional[int] = None,
+    period: Literal["all", "daily", "weekly"] = "all",
+):
+    """
+    Top players plus the caller's own rank when user_id is given.
+    "all" ranks balances; "daily" / "weekly" rank points earned in the current UTC period.
+    """
+    return fast_json(await LeaderboardService.get_leaderboard(offset, limit, user_id, period), LeaderboardResponse)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.responses import fast_json
+from app.core.sessions import authorize, session_user
 from typing import Optional
 from .. import schemas
 from ..services.referral_service import ReferralService
@@ -7,11 +9,13 @@ router = APIRouter(prefix="/referral", tags=["referral"])
 
 @router.get("/", response_model=schemas.ReferralResponse)
 async def get_referral_info(
-    user_id: str
+    user_id: str,
+    session: Optional[int] = Depends(session_user),
 ):
     """Get referral information and friends list for the user."""
+    authorize(session, user_id)
     result = await ReferralService.get_referral_info(user_id)
-    return result
+    return fast_json(result, schemas.ReferralResponse)
 
 @router.post("/process")
 async def process_referral(
@@ -19,17 +23,22 @@ async def process_referral(
     new_user_id: str,
     first_name: str,
     last_name: Optional[str] = None,
-    username: Optional[str] = None
+    username: Optional[str] = None,
+    session: Optional[int] = Depends(session_user),
 ):
     """Process a referral when a new user joins."""
+    # Only the new user can claim they were referred
+    authorize(session, new_user_id)
     await ReferralService.process_referral(referrer_code, new_user_id, first_name, last_name, username)
     return {"message": "Referral processed successfully"}
 
 # Endpoint to get just the referral link (if needed separately)
 @router.get("/link")
 async def get_referral_link(
-    user_id: str
+    user_id: str,
+    session: Optional[int] = Depends(session_user),
 ):
     """Get referral link for the user."""
+    authorize(session, user_id)
     result = await ReferralService.get_referral_info(user_id)
     return {"link": result["referral_info"]["link"]}
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from app.schemas import GlobalStats
+from app.services.stats_service import StatsService
+
+router = APIRouter()
+
+@router.get("/stats", response_model=GlobalStats)
+async def get_global_stats():
+    """Game-wide totals, refreshed every few seconds."""
+    return await StatsService.get_summary()
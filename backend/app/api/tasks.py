@@ -1,20 +1,27 @@
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from app.core.responses import fast_json
+from app.core.sessions import authorize, session_user
 from app.schemas import UserTasksResponse
 from app.services.task_service import TaskService
 
 router = APIRouter()
 
 @router.get("/tasks/{user_id}", response_model=UserTasksResponse)
-async def get_user_tasks(user_id: str):
-    return await TaskService.get_overview(user_id)
+async def get_user_tasks(user_id: str, session: Optional[int] = Depends(session_user)):
+    authorize(session, user_id)
+    return fast_json(await TaskService.get_overview(user_id), UserTasksResponse)
 
 @router.post("/tasks/{user_id}/{task_id}/complete")
-async def complete_task(user_id: str, task_id: str):
+async def complete_task(user_id: str, task_id: str, session: Optional[int] = Depends(session_user)):
+    authorize(session, user_id)
     task = await TaskService.complete_task(user_id, task_id)
     return {"success": True, "task": task}
 
 @router.post("/tasks/{user_id}/{task_id}/claim")
-async def claim_task_reward(user_id: str, task_id: str):
+async def claim_task_reward(user_id: str, task_id: str, session: Optional[int] = Depends(session_user)):
+    authorize(session, user_id)
     task, new_coins = await TaskService.claim_task(user_id, task_id)
     return {
         "success": True,
@@ -24,7 +31,8 @@ async def claim_task_reward(user_id: str, task_id: str):
     }
 
 @router.post("/tasks/{user_id}/daily-reward/{day}/claim")
-async def claim_daily_reward(user_id: str, day: int):
+async def claim_daily_reward(user_id: str, day: int, session: Optional[int] = Depends(session_user)):
+    authorize(session, user_id)
     reward, new_coins = await TaskService.claim_daily_reward(user_id, day)
     return {
         "success": True,
@@ -1,3 +1,5 @@
+import os
+
 # Game Configuration Constants
 
 UPGRADE_CONFIG = {
@@ -7,6 +9,29 @@ UPGRADE_CONFIG = {
     "tap_bot": {"base_cost": 10000, "coeff": 3},
 }
 
+# Additive tap counters are buffered in this many Redis hashes (by user id)
+# and drained to Postgres in parallel by redis_offload.py
+CLICK_BUFFER_SHARDS = int(os.getenv("CLICK_BUFFER_SHARDS", "16"))
+
+# Dirty users are queued for the Postgres sync in this many sorted sets (by
+# user id); each sync worker process owns a subset of them
+SYNC_SHARDS = int(os.getenv("SYNC_SHARDS", "16"))
+
+# Points ledger entries are buffered in this many Redis lists (by user id)
+# before app/core/ledger_worker.py COPYs them into Postgres
+LEDGER_SHARDS = int(os.getenv("LEDGER_SHARDS", "16"))
+
+# The global referral indexes (code -> user id, user id -> code) are each
+# split into this many small hashes, so every one keeps Redis' compact
+# listpack encoding (hash-max-listpack-entries, 128 by default). Keep it
+# above users / 80; see app/services/referral_index.py
+REFERRAL_INDEX_BUCKETS = int(os.getenv("REFERRAL_INDEX_BUCKETS", str(1 << 17)))
+
+# Redis Cluster key layout: each user's keys carry a {user_id} hash tag so they
+# share a slot (see RedisKeys). Existing single-node data must be converted
+# first with `python -m app.core.key_migration`
+REDIS_HASH_TAGS = os.getenv("REDIS_HASH_TAGS", "") == "1"
+
 LEVELS = [
     {"min": 100000, "val": 10, "lvl": 9},
     {"min": 50000, "val": 15, "lvl": 8},
@@ -154,3 +179,31 @@ DAILY_TASK_POOL = [
     #     "status": "pending",
     # },
 ]
+
+# Airdrop allocation (see app/airdrop/allocation.py). Amounts are in token base units.
+ALLOCATION_CONFIG = {
+    "total_supply": 100_000_000 * 10**9,
+    # Users below this many points get nothing
+    "min_points": 1000,
+    # "sqrt" dampens whales: 4x the points earns 2x the weight
+    "weighting": "sqrt",
+    # [min_points, multiplier], ascending
+    "tiers": [[0, 1.0], [100_000, 1.1], [1_000_000, 1.25], [10_000_000, 1.5]],
+    "referral_bonus_per_friend": 0.02,
+    "referral_bonus_cap": 0.5,
+    "task_bonus_per_task": 0.01,
+    "premium_multiplier": 1.2,
+    # No user receives more than this share of the supply
+    "max_share": 0.0005,
+}
+
+# Referral farm detection (see app/airdrop/referral_farms.py). Each signal is a
+# share in [0, 1]; a cluster's score is their weighted sum.
+REFERRAL_FARM_CONFIG = {
+    # Smaller referral trees are never flagged
+    "min_cluster_size": 5,
+    # Joins within this many seconds of each other count as one burst
+    "burst_window": 3600,
+    "weights": {"burst": 0.4, "zero_taps": 0.4, "names": 0.2},
+    "flag_score": 0.6,
+}
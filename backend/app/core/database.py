@@ -1,11 +1,45 @@
 import redis.asyncio as redis
 import os
 
+from psycopg2.pool import ThreadedConnectionPool
+
+from app.core.config import REDIS_HASH_TAGS
+
 # 1. Get URL from environment (Docker) or default to localhost (Local)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# REDIS_URL is then any node of a Redis Cluster; the others are discovered
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "") == "1"
+
+# Comma-separated replicas of the primary, for read-only endpoints (see app/core/replicas.py)
+REDIS_REPLICA_URLS = [url.strip() for url in os.getenv("REDIS_REPLICA_URLS", "").split(",") if url.strip()]
+
+if REDIS_CLUSTER and not REDIS_HASH_TAGS:
+    raise RuntimeError("REDIS_CLUSTER needs the hash-tagged key layout (REDIS_HASH_TAGS=1)")
+if REDIS_CLUSTER and REDIS_REPLICA_URLS:
+    raise RuntimeError("REDIS_REPLICA_URLS is for a single primary; a cluster has its own replicas")
+
 
-# 2. CRITICAL: decode_responses=True makes Redis return Strings, not Bytes
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+def new_redis_client(url: str = REDIS_URL):
+    """A client for REDIS_URL. On a cluster, pipelines are split per node and not transactional."""
+    # CRITICAL: decode_responses=True makes Redis return Strings, not Bytes
+    if REDIS_CLUSTER:
+        return redis.RedisCluster.from_url(url, decode_responses=True)
+    return redis.from_url(url, decode_responses=True)
+
+
+redis_client = new_redis_client()
+redis_replicas = [new_redis_client(url) for url in REDIS_REPLICA_URLS]
 
 
 POSTGRES_URL = os.getenv("POSTGRES_URL")
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "4"))
+
+_pg_pool = None
+
+
+def get_pg_pool() -> ThreadedConnectionPool | None:
+    """Lazily created Postgres pool. None when POSTGRES_URL is not configured."""
+    global _pg_pool
+    if _pg_pool is None and POSTGRES_URL:
+        _pg_pool = ThreadedConnectionPool(1, POSTGRES_POOL_SIZE, POSTGRES_URL)
+    return _pg_pool
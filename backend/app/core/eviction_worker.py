@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import os
+
+from app.services.season_service import SeasonService
+from app.services.tiering_service import TieringService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("eviction_worker")
+
+# Users idle for longer than this are moved out of Redis (default: 7 days)
+EVICTION_IDLE_SECONDS = int(os.getenv("EVICTION_IDLE_SECONDS", str(7 * 24 * 3600)))
+EVICTION_BATCH_SIZE = int(os.getenv("EVICTION_BATCH_SIZE", "500"))
+EVICTION_INTERVAL = int(os.getenv("EVICTION_INTERVAL", "300"))
+
+
+async def cold_user_eviction_loop():
+    added = await TieringService.backfill_last_seen()
+    if added:
+        logger.info(f"Backfilled last-seen scores for {added} users")
+
+    while True:
+        try:
+            await SeasonService.refresh()
+            examined = evicted = offset = 0
+            while True:
+                batch, removed = await TieringService.evict_idle_users(
+                    EVICTION_IDLE_SECONDS, EVICTION_BATCH_SIZE, offset
+                )
+                examined += batch
+                evicted += removed
+                # Skipped users (dirty / not yet synced) keep their place in the set
+                offset += batch - removed
+                # A partial batch means we've reached users that are still active
+                if batch < EVICTION_BATCH_SIZE:
+                    break
+
+            resident = await TieringService.record_resident_size()
+            logger.info(
+                f"Eviction pass done: examined={examined} evicted={evicted} resident={resident}"
+            )
+        except Exception as e:
+            logger.error(f"Eviction Worker Error: {e}")
+
+        await asyncio.sleep(EVICTION_INTERVAL)
+
+
+if __name__ == "__main__":
+    asyncio.run(cold_user_eviction_loop())
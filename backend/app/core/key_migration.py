@@ -0,0 +1,108 @@
+"""
+One-off conversion of a single Redis node to the hash-tagged key layout
+(REDIS_HASH_TAGS=1, see RedisKeys), the step before moving to Redis Cluster:
+
+    python -m app.core.key_migration [--dry-run]
+
+Stop the API first and let the sync, ledger and click workers drain their
+buffers (their key names change too; the migration refuses to start while
+any are left). Per-user and activity keys are renamed in place, and the
+global referral indexes are moved into their buckets. Running it again skips
+keys that are already converted. Then start everything with
+REDIS_HASH_TAGS=1; `redis-cli --cluster import` can move the data to a
+cluster, after which the app runs there with REDIS_CLUSTER=1.
+"""
+import argparse
+import asyncio
+import logging
+
+from app.core.database import REDIS_CLUSTER, new_redis_client
+from app.services.base import LEGACY_REFERRAL_CODES_KEY, LEGACY_REFERRAL_LINKS_KEY, RedisKeys, set_hash_tags
+from app.services.referral_index import ReferralIndex
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("key_migration")
+
+BATCH_SIZE = 1000
+
+# Legacy names of worker buffers, which must be empty before migrating
+BUFFER_PATTERNS = (
+    "ledger:buffer:[0-9]*", "ledger:processing:[0-9]*",
+    "user_clicks_buffer:[0-9]*", "user_clicks_processing:[0-9]*",
+)
+
+
+async def undrained_buffers(client) -> list:
+    found = []
+    for pattern in BUFFER_PATTERNS:
+        found += [key async for key in client.scan_iter(match=pattern, count=BATCH_SIZE)]
+    return found
+
+
+async def rename_keys(client, pattern: str, dry_run: bool) -> tuple[int, int]:
+    """Renames legacy keys matching `pattern` to their tagged names. Returns (renamed, conflicts)."""
+    renamed = conflicts = 0
+    batch = []
+
+    async def flush():
+        nonlocal renamed, conflicts, batch
+        if not dry_run:
+            pipe = client.pipeline(transaction=False)
+            for key in batch:
+                pipe.renamenx(key, RedisKeys.tagged(key))
+            for key, ok in zip(batch, await pipe.execute()):
+                if not ok:
+                    logger.warning(f"{RedisKeys.tagged(key)} already exists; left {key} in place")
+                renamed += ok
+                conflicts += not ok
+        else:
+            renamed += len(batch)
+        batch = []
+
+    async for key in client.scan_iter(match=pattern, count=BATCH_SIZE):
+        # SCAN may return keys renamed earlier in this pass
+        if "{" not in key:
+            batch.append(key)
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return renamed, conflicts
+
+
+async def migrate(dry_run: bool) -> dict:
+    client = new_redis_client()
+    try:
+        pending = await undrained_buffers(client)
+        if pending:
+            raise SystemExit(f"Drain the worker buffers first; still present: {pending[:5]}")
+
+        summary = {}
+        for name, pattern in (("user", "user:[0-9]*"), ("activity", "activity:*")):
+            summary[f"{name}_keys"], summary[f"{name}_conflicts"] = await rename_keys(client, pattern, dry_run)
+        if dry_run:
+            summary["referral_index"] = (
+                await client.hlen(LEGACY_REFERRAL_CODES_KEY) + await client.hlen(LEGACY_REFERRAL_LINKS_KEY)
+            )
+        else:
+            summary["referral_index"] = await ReferralIndex.migrate_legacy(client)
+        return summary
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Redis to the hash-tagged key layout")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the keys to convert")
+    args = parser.parse_args()
+
+    if REDIS_CLUSTER:
+        parser.error("Run against the single node holding the data, without REDIS_CLUSTER")
+    # New names are built with hash tags whatever REDIS_HASH_TAGS says
+    set_hash_tags(True)
+    summary = asyncio.run(migrate(args.dry_run))
+    logger.info(f"{'Would convert' if args.dry_run else 'Converted'}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
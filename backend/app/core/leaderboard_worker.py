@@ -0,0 +1,115 @@
+"""
+Freezes closed daily / weekly leaderboards into Postgres.
+
+    python -m app.core.leaderboard_worker
+
+Periodic boards live in Redis until LEADERBOARD_PERIOD_RETENTION after their
+period ends. Once a period is over (plus a short grace for in-flight writes)
+its standings are streamed out with ZREVRANGE in chunks and COPY'd into
+`leaderboard_results`. A marker key makes sure each period is frozen once.
+"""
+import asyncio
+import io
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+from app.core.database import redis_client, POSTGRES_URL
+from app.services.base import RedisKeys
+from app.services.leaderboard_service import (
+    LeaderboardService, PERIODS, LEADERBOARD_PERIOD_RETENTION,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("leaderboard_worker")
+
+CLOSE_GRACE_SECONDS = int(os.getenv("LEADERBOARD_CLOSE_GRACE", "120"))
+CLOSE_INTERVAL = int(os.getenv("LEADERBOARD_CLOSE_INTERVAL", "60"))
+CHUNK_SIZE = 10_000
+
+
+def closed_periods(now: datetime) -> list:
+    """Periods that ended within the retention window and are past the grace period."""
+    periods = []
+    for kind in PERIODS:
+        step = timedelta(days=1) if kind == "daily" else timedelta(weeks=1)
+        at = now - step
+        while True:
+            period, _, end = LeaderboardService.period_bounds(kind, at)
+            if (now - end).total_seconds() > LEADERBOARD_PERIOD_RETENTION:
+                break
+            if (now - end).total_seconds() >= CLOSE_GRACE_SECONDS:
+                periods.append(period)
+            at -= step
+    return periods
+
+
+def copy_standings(conn, period: str, rows: list):
+    buf = io.StringIO()
+    for rank, user_id, points in rows:
+        buf.write(f"{period}\t{rank}\t{user_id}\t{points}\n")
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(
+            "COPY leaderboard_results (period, rank, telegram_id, points) FROM STDIN", buf
+        )
+
+
+async def freeze_period(conn, period: str) -> int:
+    key = RedisKeys.leaderboard(period)
+    # Reruns after a failure start from scratch
+    await asyncio.to_thread(_delete_period, conn, period)
+
+    frozen = 0
+    while True:
+        chunk = await redis_client.zrevrange(key, frozen, frozen + CHUNK_SIZE - 1, withscores=True)
+        if not chunk:
+            break
+        rows = [(frozen + i + 1, user_id, int(score)) for i, (user_id, score) in enumerate(chunk)]
+        await asyncio.to_thread(copy_standings, conn, period, rows)
+        frozen += len(chunk)
+
+    await asyncio.to_thread(conn.commit)
+    return frozen
+
+
+def _delete_period(conn, period: str):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM leaderboard_results WHERE period = %s", (period,))
+
+
+async def close_periods(conn):
+    for period in closed_periods(datetime.now(timezone.utc)):
+        marker = f"leaderboard:frozen:{period}"
+        if not await redis_client.exists(RedisKeys.leaderboard(period)):
+            continue
+        if not await redis_client.set(marker, 1, nx=True, ex=LEADERBOARD_PERIOD_RETENTION * 2):
+            continue
+        try:
+            frozen = await freeze_period(conn, period)
+            logger.info(f"Froze {period}: {frozen} players")
+        except Exception:
+            conn.rollback()
+            await redis_client.delete(marker)
+            raise
+
+
+async def leaderboard_close_loop():
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        while True:
+            try:
+                await close_periods(conn)
+            except Exception:
+                logger.exception("Leaderboard Worker Error")
+                if conn.closed:
+                    conn = psycopg2.connect(POSTGRES_URL)
+            await asyncio.sleep(CLOSE_INTERVAL)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(leaderboard_close_loop())
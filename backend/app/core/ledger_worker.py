@@ -0,0 +1,239 @@
+"""
+Points ledger persistence and reconciliation.
+
+    python -m app.core.ledger_worker                  # write buffered entries, forever
+    python -m app.core.ledger_worker reconcile        # compare ledger sums with users.points
+    python -m app.core.ledger_worker seed-opening     # once, when enabling the ledger
+
+Entries are buffered per shard in Redis lists (see LedgerService). Each pass
+renames a buffer to a processing key named after a fresh batch id and COPYs
+it into `points_ledger`. The batch id is recorded in `points_ledger_batches`
+in the same transaction, so a processing key left behind by a crash is
+written exactly once when it is retried.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+
+import psycopg2
+from redis.exceptions import ResponseError
+
+from app.core import metrics
+from app.core.config import LEDGER_SHARDS
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.services.base import RedisKeys
+from app.services.ledger_service import LEDGER_REASONS
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("ledger_worker")
+
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "1"))
+# Users touched this recently may have a balance or ledger write in flight
+RECONCILE_GRACE_SECONDS = int(os.getenv("LEDGER_RECONCILE_GRACE", "600"))
+
+BATCH_SEQ_KEY = "ledger:batch_seq"
+
+ENTRIES_WRITTEN = metrics.counter("ledger_entries_written_total", "Ledger entries COPY'd to Postgres")
+BATCH_SECONDS = metrics.histogram("ledger_batch_seconds", "Time to persist one buffer batch")
+MISMATCHES = metrics.gauge("ledger_mismatched_users", "Users whose ledger sum differs from users.points")
+
+
+def ensure_partitions(cur):
+    """Creates the monthly partitions the staged entries fall into."""
+    cur.execute(
+        "SELECT DISTINCT date_trunc('month', to_timestamp(ts) AT TIME ZONE 'UTC') FROM ledger_staging"
+    )
+    for (month,) in cur.fetchall():
+        end = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS points_ledger_{month:%Y%m} PARTITION OF points_ledger
+            FOR VALUES FROM ('{month:%Y-%m-%d} 00:00+00') TO ('{end:%Y-%m-%d} 00:00+00')
+            """
+        )
+
+
+def insert_staged_entries(cur) -> int:
+    """Moves the rows of the `ledger_staging` temp table into points_ledger."""
+    ensure_partitions(cur)
+    cur.execute(
+        """
+        INSERT INTO points_ledger (telegram_id, delta, reason, ref, created_at)
+        SELECT telegram_id, delta, reason, ref, to_timestamp(ts) FROM ledger_staging
+        """
+    )
+    return cur.rowcount
+
+
+def persist_batch(conn, batch_id: int, shard: int, lines: list) -> bool:
+    """Writes one batch; returns False if it had already been written."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO points_ledger_batches (batch_id, shard, entries) VALUES (%s, %s, %s) "
+                "ON CONFLICT DO NOTHING",
+                (batch_id, shard, len(lines)),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False
+
+            cur.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS ledger_staging (
+                    telegram_id BIGINT, delta BIGINT, reason SMALLINT, ref TEXT, ts BIGINT
+                ) ON COMMIT DELETE ROWS
+                """
+            )
+            cur.copy_expert("COPY ledger_staging FROM STDIN", io.StringIO("\n".join(lines) + "\n"))
+            insert_staged_entries(cur)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def pending_key(shard: int) -> str:
+    """Processing keys of a shard that haven't been written yet."""
+    return f"ledger:pending:{shard}"
+
+
+async def write_processing_key(client, conn, shard: int, key: str) -> int:
+    batch_id = int(key.rsplit(":", 1)[1])
+    lines = await client.lrange(key, 0, -1)
+    written = 0
+    if lines:
+        started = time.perf_counter()
+        if await asyncio.to_thread(persist_batch, conn, batch_id, shard, lines):
+            written = len(lines)
+            ENTRIES_WRITTEN.inc(written)
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+    pipe = client.pipeline()
+    pipe.delete(key)
+    pipe.srem(pending_key(shard), key)
+    await pipe.execute()
+    return written
+
+
+async def flush_shard(client, conn, shard: int) -> int:
+    written = 0
+    # Batches left behind by a crash go first
+    for key in await client.smembers(pending_key(shard)):
+        written += await write_processing_key(client, conn, shard, key)
+
+    buffer = RedisKeys.ledger_buffer(shard)
+    if not await client.exists(buffer):
+        return written
+    processing = RedisKeys.ledger_processing(shard, await client.incr(BATCH_SEQ_KEY))
+    # Registered before the rename, so a crash in between can't lose the key
+    await client.sadd(pending_key(shard), processing)
+    try:
+        await client.rename(buffer, processing)
+    except ResponseError:
+        await client.srem(pending_key(shard), processing)
+        return written
+    return written + await write_processing_key(client, conn, shard, processing)
+
+
+async def ledger_write_loop():
+    client = new_redis_client()
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        while True:
+            for shard in range(LEDGER_SHARDS):
+                try:
+                    await flush_shard(client, conn, shard)
+                except Exception:
+                    logger.exception(f"Ledger flush failed for shard {shard}")
+                    if conn.closed:
+                        conn = psycopg2.connect(POSTGRES_URL)
+            await asyncio.sleep(LEDGER_FLUSH_INTERVAL)
+    finally:
+        conn.close()
+        await client.aclose()
+
+
+def reconcile(conn, grace_seconds: int = RECONCILE_GRACE_SECONDS, sample: int = 20) -> dict:
+    """
+    One pass over all users comparing users.points with the ledger sum.
+    Users with a sync or ledger entry within `grace_seconds` are skipped:
+    one side may simply not have caught up yet.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            WITH sums AS (
+                SELECT telegram_id, SUM(delta) AS total, MAX(created_at) AS last_at
+                FROM points_ledger GROUP BY telegram_id
+            )
+            SELECT u.telegram_id, u.points, COALESCE(s.total, 0)
+            FROM users u LEFT JOIN sums s USING (telegram_id)
+            WHERE u.points <> COALESCE(s.total, 0)
+              AND u.last_db_sync < NOW() - make_interval(secs => %s)
+              AND (s.last_at IS NULL OR s.last_at < NOW() - make_interval(secs => %s))
+            ORDER BY abs(u.points - COALESCE(s.total, 0)) DESC
+            """,
+            (grace_seconds, grace_seconds),
+        )
+        mismatches = cur.fetchall()
+    conn.rollback()
+
+    MISMATCHES.set(len(mismatches))
+    return {
+        "mismatched_users": len(mismatches),
+        "sample": [
+            {"telegram_id": uid, "points": points, "ledger_sum": int(total)}
+            for uid, points, total in mismatches[:sample]
+        ],
+    }
+
+
+def seed_opening_balances(conn) -> int:
+    """
+    Gives users without any ledger entry an opening entry equal to their
+    synced balance. Run once after deploying, when the ledger starts out empty.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TEMP TABLE ledger_staging ON COMMIT DROP AS
+            SELECT u.telegram_id, u.points AS delta, %s::smallint AS reason, NULL::text AS ref,
+                   extract(epoch FROM NOW())::bigint AS ts
+            FROM users u
+            WHERE u.points <> 0
+              AND NOT EXISTS (SELECT 1 FROM points_ledger l WHERE l.telegram_id = u.telegram_id)
+            """,
+            (LEDGER_REASONS["opening_balance"],),
+        )
+        seeded = insert_staged_entries(cur)
+    conn.commit()
+    return seeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Points ledger writer and checks")
+    parser.add_argument("command", nargs="?", default="write", choices=("write", "reconcile", "seed-opening"))
+    parser.add_argument("--grace", type=int, default=RECONCILE_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    if args.command == "write":
+        asyncio.run(ledger_write_loop())
+        return
+
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        if args.command == "reconcile":
+            logger.info(json.dumps({"event": "ledger_reconcile", **reconcile(conn, args.grace)}))
+        else:
+            logger.info(f"Seeded {seed_opening_balances(conn)} opening balances")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Every process (uvicorn worker, sync worker, ...) keeps its own values.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def _label_str(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_str(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_str(labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield f"{self.name}{key} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.values[_label_str(labels)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # label string -> [per-bucket counts..., sum, count]
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_str(labels)
+        with _lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def summary(self, **labels) -> dict:
+        row = self.values.get(_label_str(labels))
+        if not row:
+            return {"count": 0, "avg": 0.0}
+        return {"count": row[-1], "avg": row[-2] / row[-1]}
+
+    def samples(self):
+        for key, row in self.values.items():
+            base = key[1:-1] + "," if key else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                yield f'{self.name}_bucket{{{base}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{base}le="+Inf"}} {row[-1]}'
+            yield f"{self.name}_sum{key} {row[-2]}"
+            yield f"{self.name}_count{key} {row[-1]}"
+
+
+def _register(metric):
+    with _lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _register(Counter(name, help_text))
+
+
+def gauge(name: str, help_text: str) -> Gauge:
+    return _register(Gauge(name, help_text))
+
+
+def histogram(name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, buckets))
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Serves `render_prometheus()` on http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
@@ -0,0 +1,188 @@
+"""
+Token-bucket rate limits for the endpoints scripts like to hammer.
+
+Each limited route has a bucket per session user and one per client IP
+(requests without a session, only served with TELEGRAM_AUTH_REQUIRED off,
+get the IP bucket alone). A bucket holds up to `burst` tokens and refills at
+`rate` per second; a request takes one token from each of its buckets, or
+none if any is empty. Buckets live in Redis so every API worker shares them,
+and one script call checks and takes the tokens atomically, in one round
+trip. A denied request writes nothing.
+
+A denial also comes back with how long until the bucket has a token again.
+Until then the worker answers that bucket's requests itself, so a flood
+costs Redis one call per bucket per refill instead of one per request.
+That can't refuse anything Redis would allow: other workers only ever take
+tokens, never add them.
+
+Denied requests get a 429 with Retry-After. If Redis fails, requests are let
+through rather than refused.
+
+Limits are RATE_LIMITS below; the RATE_LIMITS env var (JSON of the same
+shape) overrides routes or scopes, e.g. {"/api/tap": {"user": [10, 40]}}.
+"""
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from app.core import database, metrics
+from app.core.sessions import verify_session
+
+logger = logging.getLogger("rate_limit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Behind a reverse proxy: the client IP is the last X-Forwarded-For entry
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "") == "1"
+# Buckets remembered as empty by each worker
+LOCAL_CACHE_SIZE = 65536
+
+# path -> scope -> (tokens per second, burst). The client syncs taps every 2s.
+RATE_LIMITS = {
+    "/api/tap": {"user": (5, 20), "ip": (100, 300)},
+    "/api/buy-card": {"user": (5, 20), "ip": (50, 150)},
+    "/api/referral/process": {"user": (1, 5), "ip": (1, 10)},
+}
+for _path, _scopes in json.loads(os.getenv("RATE_LIMITS", "{}")).items():
+    RATE_LIMITS[_path] = {**RATE_LIMITS.get(_path, {}), **{s: tuple(v) for s, v in _scopes.items()}}
+
+# KEYS: the buckets. ARGV: now (ms), then rate and burst of each bucket.
+# Returns 0 when the tokens were taken, else {ms until one is back, index of the bucket}.
+TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait, blocking = 0, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    levels[i] = {math.min(burst, tokens + math.max(0, now - ts) * rate / 1000), math.max(ts, now)}
+    if levels[i][1] < 1 then
+        local needed = math.ceil((1 - levels[i][1]) * 1000 / rate)
+        if needed > wait then
+            wait, blocking = needed, i
+        end
+    end
+end
+if wait > 0 then
+    return {wait, blocking}
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i][1] - 1), 'ts', levels[i][2])
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate))
+end
+return 0
+"""
+
+LIMITED = metrics.counter("rate_limited_requests_total", "Requests refused by RateLimiter, by route and where")
+LIMIT_ERRORS = metrics.counter("rate_limit_errors_total", "Rate limit checks skipped because Redis failed")
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def session_id(request: Request) -> Optional[int]:
+    """Telegram id of a valid session; a forged one is refused later by the endpoint."""
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.startswith("Bearer ") else request.query_params.get("session")
+    return verify_session(token) if token else None
+
+
+class RateLimiter:
+    def __init__(self, limits: dict):
+        self.limits = limits
+        # bucket key -> time.time() until which it is known to be empty
+        self._empty_until = OrderedDict()
+        self._script = None
+
+    def buckets(self, request: Request) -> list:
+        """[(key, rate, burst)] of the request; empty for routes without limits."""
+        path = request.url.path
+        scopes = self.limits.get(path)
+        if not scopes:
+            return []
+        found = []
+        if "user" in scopes:
+            user_id = session_id(request)
+            if user_id is not None:
+                found.append((f"ratelimit:{path}:user:{user_id}", *scopes["user"]))
+        if "ip" in scopes:
+            found.append((f"ratelimit:{path}:ip:{client_ip(request)}", *scopes["ip"]))
+        return found
+
+    def _known_empty(self, buckets: list, now: float) -> float:
+        """Seconds until the emptiest bucket has a token, from this worker's own memory."""
+        wait = 0.0
+        for key, _, _ in buckets:
+            until = self._empty_until.get(key)
+            if until is None:
+                continue
+            if until <= now:
+                del self._empty_until[key]
+            else:
+                wait = max(wait, until - now)
+        return wait
+
+    def _remember_empty(self, key: str, until: float):
+        self._empty_until[key] = until
+        self._empty_until.move_to_end(key)
+        if len(self._empty_until) > LOCAL_CACHE_SIZE:
+            self._empty_until.popitem(last=False)
+
+    async def _take(self, buckets: list, now: float) -> tuple[float, Optional[str]]:
+        if self._script is None:
+            self._script = database.redis_client.register_script(TAKE_TOKENS)
+        # Cluster scripts can only touch one slot: each bucket is then checked on its own
+        groups = [[b] for b in buckets] if database.REDIS_CLUSTER else [buckets]
+        for group in groups:
+            args = [int(now * 1000)]
+            for _, rate, burst in group:
+                args += [rate, burst]
+            result = await self._script(keys=[key for key, _, _ in group], args=args, client=database.redis_client)
+            if result:
+                wait_ms, blocking = result
+                return wait_ms / 1000, group[blocking - 1][0]
+        return 0.0, None
+
+    async def check(self, request: Request) -> Optional[JSONResponse]:
+        """A 429 response if the request is over its limits, else None."""
+        buckets = self.buckets(request)
+        if not buckets:
+            return None
+        now = time.time()
+        wait = self._known_empty(buckets, now)
+        where = "local"
+        if not wait:
+            try:
+                wait, blocking = await self._take(buckets, now)
+            except RedisError as e:
+                LIMIT_ERRORS.inc()
+                logger.warning(f"Rate limit check failed, letting the request through: {e}")
+                return None
+            if not wait:
+                return None
+            self._remember_empty(blocking, now + wait)
+            where = "redis"
+        LIMITED.inc(route=request.url.path, where=where)
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests"},
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+rate_limiter = RateLimiter(RATE_LIMITS if RATE_LIMIT_ENABLED else {})
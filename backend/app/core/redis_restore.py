@@ -0,0 +1,211 @@
+"""
+Bulk warm-up of Redis from the Postgres `users` table.
+
+Run after Redis lost its data or when moving to a new instance, before the API
+takes traffic (restored hashes overwrite whatever is already there):
+
+    python -m app.core.redis_restore --processes 4 --writers 8
+
+Each process streams its own partition of users (telegram_id % processes)
+with a server-side cursor and rebuilds every key family with large pipelines.
+Progress is checkpointed per partition, so an interrupted restore continues
+where it stopped when run again with the same --processes value.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import psycopg2
+
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.services.activity_service import ActivityService
+from app.services.base import LAST_SEEN_KEY, RedisKeys, queue_user_index
+from app.services.referral_index import ReferralIndex
+from app.services.season_service import SeasonService
+from app.services.tiering_service import TieringService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("redis_restore")
+
+PROGRESS_INTERVAL = 5  # Seconds between progress lines
+
+
+class Checkpoint:
+    """Last fully restored telegram_id per partition, kept in a small JSON file."""
+
+    def __init__(self, path: str, partition: int):
+        self.path = f"{path}.{partition}"
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as f:
+                return int(json.load(f)["last_id"])
+        except FileNotFoundError:
+            return 0
+
+    def save(self, last_id: int):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"last_id": last_id, "saved_at": int(time.time())}, f)
+        os.replace(tmp, self.path)
+
+
+def stream_users(partition: int, partitions: int, after_id: int, batch_size: int, out: queue.Queue):
+    """Reader thread: pushes lists of (telegram_id, raw_state) onto `out`, then None."""
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        # A named cursor keeps the result set on the server; we only hold one batch
+        with conn.cursor(name=f"redis_restore_{partition}") as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                """
+                SELECT telegram_id, raw_state FROM users
+                WHERE telegram_id > %s AND telegram_id %% %s = %s AND raw_state IS NOT NULL
+                ORDER BY telegram_id
+                """,
+                (after_id, partitions, partition),
+            )
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                out.put(rows)
+    finally:
+        conn.close()
+        out.put(None)
+
+
+def queue_user_restore(pipe, user_id: int, state: dict) -> int:
+    """Returns the user's activity index (0 if the snapshot has none)."""
+    if TieringService.queue_snapshot_restore(pipe, user_id, state):
+        profile = state["profile"]
+        pipe.zadd(LAST_SEEN_KEY, {str(user_id): int(profile.get("last_sync_time", 0))})
+        pipe.zadd(RedisKeys.leaderboard(), {str(user_id): int(profile.get("points", 0))})
+
+    # Global referral indexes are derived from each user's referral summary
+    code = (state.get("referral_summary") or {}).get("referral_code")
+    if code:
+        ReferralIndex.queue_add(pipe, code, user_id)
+
+    # Kept even from an earlier season's profile, so the user keeps their index
+    uidx = int((state.get("profile") or {}).get("uidx") or 0)
+    if uidx:
+        queue_user_index(pipe, user_id, uidx)
+    return uidx
+
+
+async def restore_partition(partition: int, partitions: int, writers: int, batch_size: int, checkpoint_path: str):
+    checkpoint = Checkpoint(checkpoint_path, partition)
+    start_after = checkpoint.load()
+    if start_after:
+        logger.info(f"[partition {partition}] resuming after telegram_id={start_after}")
+
+    rows_q = queue.Queue(maxsize=writers * 2)
+    reader = threading.Thread(
+        target=stream_users,
+        args=(partition, partitions, start_after, batch_size, rows_q),
+        daemon=True,
+    )
+    reader.start()
+
+    client = new_redis_client()
+    # Snapshots from earlier seasons only restore what carries over
+    await SeasonService.refresh(client, force=True)
+    batches = asyncio.Queue(maxsize=writers * 2)
+
+    # Batches finish out of order; the checkpoint only advances over the
+    # contiguous prefix of finished sequence numbers.
+    done = {}
+    next_seq = 0
+    restored = 0
+    started = time.monotonic()
+    last_report = started
+
+    async def writer():
+        nonlocal restored
+        while True:
+            item = await batches.get()
+            if item is None:
+                return
+            seq, rows = item
+            pipe = client.pipeline(transaction=False)
+            top_index = max(queue_user_restore(pipe, user_id, state) for user_id, state in rows)
+            # New users must not get an index a restored user holds
+            if top_index:
+                ActivityService.queue_raise_index(pipe, top_index)
+            await pipe.execute()
+            restored += len(rows)
+            done[seq] = rows[-1][0]
+
+    tasks = [asyncio.create_task(writer()) for _ in range(writers)]
+
+    seq = 0
+    last_id = start_after
+    while True:
+        rows = await asyncio.to_thread(rows_q.get)
+        if rows is None:
+            break
+        await batches.put((seq, rows))
+        seq += 1
+
+        while next_seq in done:
+            last_id = done.pop(next_seq)
+            next_seq += 1
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            checkpoint.save(last_id)
+            rate = restored / (now - started)
+            logger.info(
+                f"[partition {partition}] restored={restored} rate={rate:,.0f} users/s checkpoint={last_id}"
+            )
+            last_report = now
+
+    for _ in tasks:
+        await batches.put(None)
+    await asyncio.gather(*tasks)
+    while next_seq in done:
+        last_id = done.pop(next_seq)
+        next_seq += 1
+    checkpoint.save(last_id)
+    await client.aclose()
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"[partition {partition}] finished: restored={restored} in {elapsed:.1f}s "
+        f"({restored / max(elapsed, 1e-9):,.0f} users/s)"
+    )
+    return restored
+
+
+def _run_partition(partition, partitions, writers, batch_size, checkpoint_path):
+    return asyncio.run(restore_partition(partition, partitions, writers, batch_size, checkpoint_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild Redis user state from Postgres")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent pipelines per process")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Users per pipeline")
+    parser.add_argument("--checkpoint", default="redis_restore.checkpoint")
+    args = parser.parse_args()
+
+    if not POSTGRES_URL:
+        parser.error("POSTGRES_URL is not set")
+
+    started = time.monotonic()
+    jobs = [(p, args.processes, args.writers, args.batch_size, args.checkpoint) for p in range(args.processes)]
+    with multiprocessing.Pool(args.processes) as pool:
+        total = sum(pool.starmap(_run_partition, jobs))
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Restore complete: {total} users in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} users/s)")
+
+
+if __name__ == "__main__":
+    main()
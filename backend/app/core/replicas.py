@@ -0,0 +1,125 @@
+"""
+Read replicas for the read-heavy endpoints (task overview, referral info).
+
+With REDIS_REPLICA_URLS set, `replica_set.read(user_id, fn)` runs a read on
+a replica when the replica can't be older than what the user has seen:
+
+- Every REPLICA_CHECK_INTERVAL, each API worker writes the time to
+  HEARTBEAT_KEY on the primary and reads it back from every replica.
+  Replication is ordered, so a replica showing heartbeat `h` has applied
+  every write made before `h`.
+- Every write to a user's keys refreshes their last-seen score
+  (track_user_write). A replica only serves a user if its heartbeat is past
+  their last write, so users read their own writes; everyone else's data
+  is at most REPLICA_MAX_LAG old.
+
+Replicas that fail the check or fall more than REPLICA_MAX_LAG behind get no
+reads until a later check succeeds. When no replica qualifies, or the read
+fails, `read` returns None and the caller reads the primary as before.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from redis.exceptions import RedisError
+
+from app.core import database, metrics
+from app.services.base import LAST_SEEN_KEY
+
+logger = logging.getLogger("replicas")
+
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "0.5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+# Checks and reads slower than this count as a failed replica
+REPLICA_TIMEOUT = float(os.getenv("REPLICA_TIMEOUT", "0.5"))
+
+HEARTBEAT_KEY = "replica:heartbeat"
+
+REPLICA_LAG = metrics.gauge(
+    "redis_replica_lag_seconds", "Age of the heartbeat last read from each replica (-1: unavailable)"
+)
+ROUTED_READS = metrics.counter("redis_routed_reads_total", "Reads routed by ReplicaSet, by where they went")
+
+
+class Replica:
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        # Heartbeat the replica had caught up to at the last check; None while unhealthy
+        self.heartbeat: Optional[float] = None
+
+
+class ReplicaSet:
+    def __init__(self, clients: list):
+        self.replicas = [Replica(f"replica-{i}", client) for i, client in enumerate(clients)]
+        self._rotation = itertools.count()
+        self._task = None
+
+    def start(self):
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._check_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _check_loop(self):
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Replica check failed")
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    async def check(self):
+        await database.redis_client.set(HEARTBEAT_KEY, f"{time.time():.6f}")
+        await asyncio.gather(*(self._check_one(replica) for replica in self.replicas))
+
+    async def _check_one(self, replica: Replica):
+        try:
+            value = await asyncio.wait_for(replica.client.get(HEARTBEAT_KEY), REPLICA_TIMEOUT)
+        except (RedisError, OSError, asyncio.TimeoutError):
+            value = None
+        lag = time.time() - float(value) if value else None
+        healthy = lag is not None and lag <= REPLICA_MAX_LAG
+        if replica.heartbeat is not None and not healthy:
+            logger.warning(f"{replica.name} taken out of rotation (lag: {lag})")
+        replica.heartbeat = float(value) if healthy else None
+        REPLICA_LAG.set(-1 if lag is None else lag, replica=replica.name)
+
+    async def reader_for(self, user_id: int | str) -> Optional[Replica]:
+        """A healthy replica that has every write of the user, or None for the primary."""
+        candidates = [r for r in self.replicas if r.heartbeat is not None]
+        if not candidates:
+            return None
+        last_write = await database.redis_client.zscore(LAST_SEEN_KEY, str(user_id))
+        if last_write is not None:
+            # Scores are whole seconds, so the write may be up to one second later
+            candidates = [r for r in candidates if r.heartbeat > last_write + 1]
+        if not candidates:
+            return None
+        return candidates[next(self._rotation) % len(candidates)]
+
+    async def read(self, user_id: int | str, fn: Callable[..., Awaitable]):
+        """`await fn(client)` on a suitable replica; None if the caller should use the primary."""
+        self.start()
+        replica = await self.reader_for(user_id)
+        if replica is None:
+            ROUTED_READS.inc(served_by="primary")
+            return None
+        try:
+            result = await asyncio.wait_for(fn(replica.client), REPLICA_TIMEOUT)
+        except (RedisError, OSError, asyncio.TimeoutError):
+            logger.warning(f"Read on {replica.name} failed, using the primary")
+            replica.heartbeat = None
+            result = None
+        ROUTED_READS.inc(served_by="fallback" if result is None else "replica")
+        return result
+
+
+replica_set = ReplicaSet(database.redis_replicas)
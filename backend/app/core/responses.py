@@ -0,0 +1,85 @@
+"""
+Fast JSON responses for hot endpoints.
+
+By default FastAPI validates every returned dict against the route's
+`response_model` and then serializes it with the stdlib encoder. For
+service outputs we build ourselves that validation never fails, yet it is
+most of the per-request cost of /tap. With FAST_JSON_RESPONSES=1, routes
+that wrap their result in `fast_json(data, Model)` skip both:
+
+- the result is projected onto the model's fields (so the payload has the
+  same shape as before, extra keys dropped) by a function compiled once
+  per model, without type checks;
+- it is encoded with orjson, or compact stdlib json when orjson isn't
+  installed (`pip install .[fast]`).
+
+The response_model stays on the route for the OpenAPI schema.
+"""
+import json
+import os
+import types
+from functools import lru_cache
+from typing import Any, Callable, Optional, Union, get_args, get_origin
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "") == "1"
+
+
+def _dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+
+def _compile(annotation) -> Optional[Callable]:
+    """Projection for a field's value; None when it passes through as is."""
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        return _compile(args[0]) if len(args) == 1 else None
+    if origin is list:
+        item = _compile(get_args(annotation)[0])
+        return None if item is None else (lambda values: [item(v) for v in values])
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compile_model(annotation)
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_model(model: type[BaseModel]) -> Callable[[Any], dict]:
+    plan = [
+        (name, _compile(field.annotation), field.is_required(), field.default)
+        for name, field in model.model_fields.items()
+    ]
+
+    def project(data) -> dict:
+        if isinstance(data, BaseModel):
+            data = data.__dict__
+        out = {}
+        for name, convert, required, default in plan:
+            value = data[name] if required else data.get(name, default)
+            out[name] = value if convert is None or value is None else convert(value)
+        return out
+
+    return project
+
+
+def fast_json(data, model: type[BaseModel]):
+    """`data` as a pre-encoded response in fast mode, else unchanged for FastAPI to validate."""
+    if not FAST_JSON_RESPONSES:
+        return data
+    return FastJSONResponse(compile_model(model)(data))
@@ -0,0 +1,263 @@
+"""
+Season rollover.
+
+    python -m app.core.season_worker start              # begin the next season now
+    python -m app.core.season_worker archive --rate 2000
+
+`start` only bumps the season number (see SeasonService): players get fresh
+keys within seconds, whatever the number of users.
+
+`archive` then retires the previous season in the background. It waits
+ARCHIVE_GRACE_SECONDS after the bump for in-flight requests to finish. It
+then SCANs the old season's profiles, upserts each user's final state into
+`user_seasons` and deletes their old keys, at no more than --rate users/s.
+Finally it handles users who were evicted to Postgres:
+  - keeps their activity index in Redis, so they are not new players next season
+  - archives them from `users`
+  - writes a season_reset ledger entry for every archived balance
+  - resets their `users` row to the new season, keeping the referral graph.
+Rerunning after an interruption is safe.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.core.ledger_worker import insert_staged_entries
+from app.services.base import RedisKeys, SEASON_FAMILIES, queue_user_index
+from app.services.ledger_service import LEDGER_REASONS
+from app.services.season_service import SeasonService
+from app.services.tiering_service import TieringService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("season_worker")
+
+ARCHIVE_GRACE_SECONDS = int(os.getenv("ARCHIVE_GRACE_SECONDS", "60"))
+ARCHIVE_BATCH_SIZE = 500
+
+# Season of a `users` row; rows written before seasons existed are season 0
+SEASON_OF = "COALESCE((raw_state->>'season')::int, 0)"
+
+
+def write_archive_rows(conn, rows: list):
+    """rows: (season, telegram_id, points, level, raw_state json)"""
+    try:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """
+                INSERT INTO user_seasons (season, telegram_id, points, level, raw_state)
+                VALUES %s
+                ON CONFLICT (season, telegram_id) DO UPDATE SET
+                    points = EXCLUDED.points,
+                    level = EXCLUDED.level,
+                    raw_state = EXCLUDED.raw_state,
+                    archived_at = NOW()
+                """,
+                rows,
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def archive_redis_batch(client, conn, season: int, user_ids: list):
+    pipe = client.pipeline(transaction=False)
+    for uid in user_ids:
+        TieringService.queue_snapshot_reads(pipe, uid, season)
+    res = await pipe.execute()
+
+    families = len(RedisKeys.user_families(0))
+    rows = []
+    indexes = []
+    for i, uid in enumerate(user_ids):
+        state = TieringService.build_snapshot(res[i * families:(i + 1) * families], season)
+        profile = state["profile"]
+        if profile.get("uidx"):
+            indexes.append((uid, profile["uidx"]))
+        rows.append((
+            season, int(uid), int(profile.get("points", 0)), int(profile.get("level", 1)), json.dumps(state)
+        ))
+    await asyncio.to_thread(write_archive_rows, conn, rows)
+
+    # Only the season's own keys go; the referral graph and activity index carry over
+    pipe = client.pipeline(transaction=False)
+    for uid, uidx in indexes:
+        queue_user_index(pipe, uid, uidx, nx=True)
+    for uid in user_ids:
+        families = RedisKeys.user_families(uid, season)
+        pipe.unlink(*(families[name] for name in SEASON_FAMILIES))
+    await pipe.execute()
+
+
+async def archive_redis_pass(client, conn, season: int, rate: float) -> int:
+    archived = 0
+    batch = []
+    started = time.monotonic()
+
+    async def flush():
+        nonlocal archived, batch
+        await archive_redis_batch(client, conn, season, batch)
+        archived += len(batch)
+        batch = []
+        # Throttle: stay at or below `rate` users per second overall
+        ahead = archived / rate - (time.monotonic() - started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+    pattern = RedisKeys.user_scan_pattern(season)
+    async for key in client.scan_iter(match=pattern, count=ARCHIVE_BATCH_SIZE, _type="hash"):
+        user_id = RedisKeys.profile_user_id(key, season)
+        if user_id is not None:
+            batch.append(user_id)
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    await client.unlink(RedisKeys.leaderboard(season=season))
+    return archived
+
+
+def load_evicted_indexes(conn, season: int) -> list:
+    """(telegram_id, uidx) of the users whose profile for `season` only exists in Postgres."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT telegram_id, raw_state->'profile'->>'uidx' FROM users
+            WHERE {SEASON_OF} = %s AND raw_state->'profile'->>'uidx' IS NOT NULL
+            """,
+            (season,),
+        )
+        return cur.fetchall()
+
+
+async def keep_evicted_indexes(client, conn, season: int) -> int:
+    """Runs before archive_postgres_pass resets those profiles."""
+    indexes = await asyncio.to_thread(load_evicted_indexes, conn, season)
+    for start in range(0, len(indexes), ARCHIVE_BATCH_SIZE):
+        pipe = client.pipeline(transaction=False)
+        for user_id, uidx in indexes[start:start + ARCHIVE_BATCH_SIZE]:
+            queue_user_index(pipe, user_id, uidx, nx=True)
+        await pipe.execute()
+    return len(indexes)
+
+
+def archive_postgres_pass(conn, season: int, new_season: int) -> dict:
+    try:
+        with conn.cursor() as cur:
+            # Users that were evicted: their last state only exists here
+            cur.execute(
+                f"""
+                INSERT INTO user_seasons (season, telegram_id, points, level, raw_state)
+                SELECT %s, telegram_id, points, level, raw_state FROM users WHERE {SEASON_OF} = %s
+                ON CONFLICT (season, telegram_id) DO NOTHING
+                """,
+                (season, season),
+            )
+            from_postgres = cur.rowcount
+
+            # Balances go back to zero; the ledger has to say so
+            cur.execute(
+                """
+                CREATE TEMP TABLE ledger_staging ON COMMIT DROP AS
+                SELECT s.telegram_id, -s.points AS delta, %s::smallint AS reason, %s::text AS ref,
+                       extract(epoch FROM NOW())::bigint AS ts
+                FROM user_seasons s
+                WHERE s.season = %s AND s.points <> 0
+                  AND NOT EXISTS (
+                      SELECT 1 FROM points_ledger l
+                      WHERE l.telegram_id = s.telegram_id AND l.reason = %s AND l.ref = %s
+                  )
+                """,
+                (LEDGER_REASONS["season_reset"], f"season:{season}", season,
+                 LEDGER_REASONS["season_reset"], f"season:{season}"),
+            )
+            ledger_entries = insert_staged_entries(cur)
+
+            cur.execute(
+                f"""
+                UPDATE users SET
+                    points = 0, energy = 1000, level = 1, profit_per_hour = 0,
+                    raw_state = jsonb_strip_nulls(jsonb_build_object(
+                        'season', %s,
+                        'referral_summary', raw_state->'referral_summary',
+                        'friends', raw_state->'friends'
+                    ))
+                WHERE {SEASON_OF} = %s
+                """,
+                (new_season, season),
+            )
+            reset = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"archived_from_postgres": from_postgres, "ledger_entries": ledger_entries, "users_reset": reset}
+
+
+async def archive_season(season: int, rate: float):
+    client = new_redis_client()
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        current = await SeasonService.refresh(client, force=True)
+        if season >= current:
+            raise SystemExit(f"Season {season} is still running (current: {current})")
+
+        started_at = int(await client.get(f"season:started:{current}") or 0)
+        wait = started_at + ARCHIVE_GRACE_SECONDS - time.time()
+        if wait > 0:
+            logger.info(f"Waiting {wait:.0f}s for requests still using season {season}")
+            await asyncio.sleep(wait)
+
+        archived = await archive_redis_pass(client, conn, season, rate)
+        logger.info(f"Archived {archived} resident users of season {season}")
+        kept = await keep_evicted_indexes(client, conn, season)
+        logger.info(f"Kept the activity index of {kept} evicted users")
+        summary = await asyncio.to_thread(archive_postgres_pass, conn, season, current)
+        logger.info(json.dumps({"event": "season_archived", "season": season, **summary}))
+    finally:
+        conn.close()
+        await client.aclose()
+
+
+async def start_season():
+    client = new_redis_client()
+    try:
+        season = await SeasonService.start_new_season(client)
+        logger.info(f"Season {season} started; archive season {season - 1} with `archive`")
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start seasons and archive finished ones")
+    parser.add_argument("command", choices=("start", "archive"))
+    parser.add_argument("--season", type=int, help="Season to archive (default: the previous one)")
+    parser.add_argument("--rate", type=float, default=2000, help="Users archived per second")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        asyncio.run(start_season())
+        return
+
+    async def run():
+        client = new_redis_client()
+        try:
+            current = await SeasonService.refresh(client, force=True)
+        finally:
+            await client.aclose()
+        await archive_season(current - 1 if args.season is None else args.season, args.rate)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
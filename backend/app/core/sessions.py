@@ -0,0 +1,153 @@
+"""
+Telegram Mini App authentication.
+
+The app proves who it is once, when it opens: /auth and /bootstrap take
+Telegram's signed `initData` (X-Telegram-Init-Data header) and, when its
+HMAC checks out, hand back a session token
+
+    {telegram_id}.{expires_at}.{mac}
+
+where mac is a truncated HMAC-SHA256 of the first two fields under
+SESSION_SECRET. Every later request sends `Authorization: Bearer <token>`
+(EventSource can't set headers, so SSE uses `?session=`). Checking a token
+is one local HMAC, skipped for tokens in the LRU of recently verified ones,
+with no Redis or Postgres lookup, so it adds nothing measurable to /tap.
+
+With TELEGRAM_AUTH_REQUIRED unset, requests without a session are still
+served (local development outside Telegram, tests). A session that is
+present is always checked.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from fastapi import Header, HTTPException, Query
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_AUTH_REQUIRED = os.getenv("TELEGRAM_AUTH_REQUIRED", "") == "1"
+# Defaults to a key derived from the bot token, so one secret is enough to deploy
+SESSION_SECRET = os.getenv("SESSION_SECRET", "") or (
+    hmac.new(b"session", BOT_TOKEN.encode(), hashlib.sha256).hexdigest() if BOT_TOKEN else ""
+)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+# initData older than this is refused, so a leaked one can't be replayed forever
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", str(24 * 3600)))
+SESSION_CACHE_SIZE = 65536
+
+MAC_BYTES = 16
+
+if TELEGRAM_AUTH_REQUIRED and not BOT_TOKEN:
+    raise RuntimeError("TELEGRAM_AUTH_REQUIRED is set but TELEGRAM_BOT_TOKEN is not")
+
+
+class InitDataError(ValueError):
+    pass
+
+
+def validate_init_data(init_data: str, bot_token: str, now: Optional[int] = None) -> dict:
+    """Checks Telegram's initData signature and age; returns its `user` object."""
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", "")
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    if not received or not hmac.compare_digest(received, expected):
+        raise InitDataError("bad signature")
+
+    now = int(time.time()) if now is None else now
+    if now - int(fields.get("auth_date", 0)) > INIT_DATA_MAX_AGE:
+        raise InitDataError("expired")
+    try:
+        user = json.loads(fields["user"])
+        int(user["id"])
+    except (KeyError, TypeError, ValueError):
+        raise InitDataError("no user")
+    return user
+
+
+def _mac(message: str, secret: str) -> str:
+    digest = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:MAC_BYTES]).rstrip(b"=").decode()
+
+
+def issue_session(telegram_id: int, now: Optional[int] = None) -> tuple[str, int]:
+    """Returns (token, expires_at)."""
+    expires_at = (int(time.time()) if now is None else now) + SESSION_TTL_SECONDS
+    message = f"{int(telegram_id)}.{expires_at}"
+    return f"{message}.{_mac(message, SESSION_SECRET)}", expires_at
+
+
+# LRU of tokens that passed the MAC check; forged ones never get in, so a
+# flood of them can't push out the sessions in use
+_verified: OrderedDict = OrderedDict()
+
+
+def _check_token(token: str, secret: str) -> Optional[tuple[int, int]]:
+    """(telegram_id, expires_at) of a correctly signed token, else None."""
+    key = (token, secret)
+    checked = _verified.get(key)
+    if checked is not None:
+        _verified.move_to_end(key)
+        return checked
+    message, _, mac = token.rpartition(".")
+    telegram_id, _, expires_at = message.partition(".")
+    if not (telegram_id.isdigit() and expires_at.isdigit()):
+        return None
+    if not hmac.compare_digest(mac, _mac(message, secret)):
+        return None
+    checked = _verified[key] = (int(telegram_id), int(expires_at))
+    if len(_verified) > SESSION_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return checked
+
+
+def verify_session(token: str, now: Optional[int] = None) -> Optional[int]:
+    """Telegram id the token was issued to, or None if it is forged or expired."""
+    if not SESSION_SECRET:
+        return None
+    checked = _check_token(token, SESSION_SECRET)
+    if checked is None or checked[1] < (int(time.time()) if now is None else now):
+        return None
+    return checked[0]
+
+
+# ----------------------------------------------------------------------
+# FastAPI dependencies (async, so they run inline rather than in the threadpool)
+# ----------------------------------------------------------------------
+async def telegram_user(x_telegram_init_data: Optional[str] = Header(None)) -> Optional[dict]:
+    """The verified Telegram user of /auth and /bootstrap, if initData was sent."""
+    if x_telegram_init_data and BOT_TOKEN:
+        try:
+            return validate_init_data(x_telegram_init_data, BOT_TOKEN)
+        except InitDataError as e:
+            raise HTTPException(status_code=401, detail=f"Invalid initData: {e}")
+    if TELEGRAM_AUTH_REQUIRED:
+        raise HTTPException(status_code=401, detail="Telegram initData required")
+    return None
+
+
+async def session_user(
+    authorization: Optional[str] = Header(None),
+    session: Optional[str] = Query(None, include_in_schema=False),
+) -> Optional[int]:
+    token = authorization[7:] if authorization and authorization.startswith("Bearer ") else session
+    if token:
+        telegram_id = verify_session(token)
+        if telegram_id is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+        return telegram_id
+    if TELEGRAM_AUTH_REQUIRED:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return None
+
+
+def authorize(session_telegram_id: Optional[int], user_id: int | str):
+    """Rejects requests acting on another user than the session's."""
+    if session_telegram_id is not None and str(session_telegram_id) != str(user_id):
+        raise HTTPException(status_code=403, detail="Session belongs to another user")
@@ -1,71 +1,69 @@
+"""
+Redis -> Postgres state sync.
+
+    python -m app.core.sync_worker --processes 4
+
+Dirty users are queued in SYNC_SHARDS sorted sets (see `track_user_write`).
+Process k of K owns every shard s with s % K == k and has its own Redis and
+Postgres connections, so sync capacity grows with the number of processes.
+SIGTERM / SIGINT stop a process after its in-flight batch has been written.
+
+Metrics are served in the Prometheus text format on
+127.0.0.1:(SYNC_METRICS_PORT + process index)/metrics, and summarized as one
+JSON log line per shard every SYNC_REPORT_INTERVAL seconds.
+"""
+import argparse
 import asyncio
 import json
 import logging
+import multiprocessing
+import os
+import signal
+import time
+
 import psycopg2
 from psycopg2.extras import execute_values
-from database import redis_client, POSTGRES_URL 
 
-logging.basicConfig(level=logging.INFO)
+from app.core import metrics
+from app.core.config import SYNC_SHARDS
+from app.core.database import POSTGRES_URL, new_redis_client
+from app.services.base import RedisKeys, LEGACY_SYNC_SET_KEY
+from app.services.referral_index import ReferralIndex
+from app.services.season_service import SeasonService
+from app.services.tiering_service import TieringService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("sync_worker")
 
-async def redis_to_postgres_sync_loop():
-    while True:
-        try:
-            # Pop 100 users who need syncing
-            user_ids = await redis_client.spop("users_to_sync", 100)
-            if not user_ids:
-                await asyncio.sleep(10)
-                continue
-
-            payloads = []
-            for uid in user_ids:
-                pipe = redis_client.pipeline()
-                # 1. Main Profile (Hash)
-                pipe.hgetall(f"user:{uid}")
-                # 2. Tasks (Hash)
-                pipe.hgetall(f"user:{uid}:tasks")
-                # 3. Stats (Hash)
-                pipe.hgetall(f"user:{uid}:stats")
-                # 4. Referral Summary (String/JSON)
-                pipe.get(f"user:{uid}:referral")
-                # 5. List of Friends (Hash)
-                pipe.hgetall(f"user:{uid}:referrals")
-                
-                res = await pipe.execute()
-                
-                profile, tasks, stats, referral_sum, friends = res
-                
-                if not profile: continue
-
-                # Build the complete snapshot
-                full_state = {
-                    "profile": profile,
-                    "tasks": tasks,
-                    "stats": stats,
-                    "referral_summary": json.loads(referral_sum) if referral_sum else {},
-                    "friends": friends
-                }
-
-                payloads.append((
-                    int(uid),
-                    int(profile.get("points", 0)),
-                    int(profile.get("energy", 0)),
-                    int(profile.get("level", 1)),
-                    int(profile.get("profit_per_hour", 0)),
-                    json.dumps(full_state) # Persisted in JSONB column
-                ))
-
-            if payloads:
-                await asyncio.to_thread(run_upsert, payloads)
-
-        except Exception as e:
-            print(f"Sync Worker Error: {e}")
-        
-        await asyncio.sleep(10)
-
-def run_upsert(payloads):
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "100"))
+SYNC_IDLE_SLEEP = float(os.getenv("SYNC_IDLE_SLEEP", "1"))
+SYNC_REPORT_INTERVAL = int(os.getenv("SYNC_REPORT_INTERVAL", "30"))
+SYNC_SAMPLE_INTERVAL = int(os.getenv("SYNC_SAMPLE_INTERVAL", "5"))
+SYNC_METRICS_PORT = int(os.getenv("SYNC_METRICS_PORT", "9101"))
+
+ROWS_SYNCED = metrics.counter("sync_rows_upserted_total", "Users written to Postgres, by shard")
+SYNC_BATCHES = metrics.counter("sync_batches_total", "Sync batches processed, by shard")
+SYNC_ERRORS = metrics.counter("sync_errors_total", "Failed sync batches, by shard")
+SYNC_RETRIES = metrics.counter(
+    "sync_retries_total", "Users put back on the queue after a failed batch, by shard"
+)
+SYNC_LAG = metrics.gauge(
+    "sync_lag_seconds", "Age of the oldest change in the last batch, by shard"
+)
+QUEUE_DEPTH = metrics.gauge("sync_queue_depth", "Users waiting to be synced, by shard")
+OLDEST_PENDING = metrics.gauge(
+    "sync_oldest_pending_seconds", "Age of the oldest unsynced change still queued, by shard"
+)
+READ_SECONDS = metrics.histogram(
+    "sync_read_phase_seconds", "Time to pop a batch and read its snapshots from Redis, by shard"
+)
+WRITE_SECONDS = metrics.histogram(
+    "sync_write_phase_seconds", "Time to upsert a batch into Postgres, by shard"
+)
+
+
+def run_upsert(conn, payloads):
     """Sync function to handle blocking Postgres IO"""
-    conn = psycopg2.connect(DATABASE_URL)
     try:
         with conn.cursor() as cur:
             upsert_query = """
@@ -80,6 +78,209 @@ def run_upsert(payloads):
                     last_db_sync = NOW();
             """
             execute_values(cur, upsert_query, payloads)
-            conn.commit()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def sync_batch(client, conn, shard: int) -> int:
+    """Pops one batch from a shard and upserts it. Returns the number of users popped."""
+    queue = RedisKeys.sync_queue(shard)
+    read_started = time.perf_counter()
+    popped = await client.zpopmin(queue, SYNC_BATCH_SIZE)
+    if not popped:
+        return 0
+
+    try:
+        # One round trip for the whole batch
+        pipe = client.pipeline(transaction=False)
+        for uid, _ in popped:
+            TieringService.queue_snapshot_reads(pipe, uid)
+        res = await pipe.execute()
+
+        families = len(RedisKeys.user_families(0))
+        payloads = []
+        for i, (uid, _) in enumerate(popped):
+            # Profile, tasks, daily rewards, stats, referral summary and
+            # friends list: everything needed to rebuild the user later
+            full_state = TieringService.build_snapshot(res[i * families:(i + 1) * families])
+            profile = full_state["profile"]
+            if not profile: continue
+
+            payloads.append((
+                int(uid),
+                int(profile.get("points", 0)),
+                int(profile.get("energy", 0)),
+                int(profile.get("level", 1)),
+                int(profile.get("profit_per_hour", 0)),
+                json.dumps(full_state) # Persisted in JSONB column
+            ))
+        READ_SECONDS.observe(time.perf_counter() - read_started, shard=shard)
+
+        if payloads:
+            write_started = time.perf_counter()
+            await asyncio.to_thread(run_upsert, conn, payloads)
+            WRITE_SECONDS.observe(time.perf_counter() - write_started, shard=shard)
+    except Exception:
+        # Put the users back with their original change time; LT keeps an
+        # older score if they were re-queued meanwhile.
+        await client.zadd(queue, dict(popped), lt=True)
+        SYNC_ERRORS.inc(shard=shard)
+        SYNC_RETRIES.inc(len(popped), shard=shard)
+        raise
+
+    SYNC_BATCHES.inc(shard=shard)
+    ROWS_SYNCED.inc(len(payloads), shard=shard)
+    SYNC_LAG.set(time.time() - popped[0][1], shard=shard)
+    return len(popped)
+
+
+async def sample_queues(client, shards: list):
+    """Records queue depth and the age of the oldest pending change per shard."""
+    pipe = client.pipeline(transaction=False)
+    for shard in shards:
+        pipe.zcard(RedisKeys.sync_queue(shard))
+        pipe.zrange(RedisKeys.sync_queue(shard), 0, 0, withscores=True)
+    res = await pipe.execute()
+
+    now = time.time()
+    for i, shard in enumerate(shards):
+        depth, oldest = res[2 * i], res[2 * i + 1]
+        QUEUE_DEPTH.set(depth, shard=shard)
+        OLDEST_PENDING.set(now - oldest[0][1] if oldest else 0, shard=shard)
+
+
+async def migrate_legacy_queue(client):
+    """Moves users queued in the pre-sharding `users_to_sync` set into the shards."""
+    moved = 0
+    now = int(time.time())
+    while True:
+        user_ids = await client.spop(LEGACY_SYNC_SET_KEY, 1000)
+        if not user_ids:
+            break
+        pipe = client.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.zadd(RedisKeys.sync_queue(RedisKeys.sync_shard(uid)), {uid: now}, nx=True)
+        await pipe.execute()
+        moved += len(user_ids)
+    if moved:
+        logger.info(f"Moved {moved} users from the legacy sync set into the shards")
+
+
+def report(shards: list, started: float):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    for shard in shards:
+        rows = ROWS_SYNCED.get(shard=shard)
+        read = READ_SECONDS.summary(shard=shard)
+        write = WRITE_SECONDS.summary(shard=shard)
+        logger.info(json.dumps({
+            "event": "sync_stats",
+            "shard": shard,
+            "rows": int(rows),
+            "rows_per_sec": round(rows / elapsed, 1),
+            "batches": int(SYNC_BATCHES.get(shard=shard)),
+            "queue_depth": int(QUEUE_DEPTH.get(shard=shard)),
+            "oldest_pending_sec": round(OLDEST_PENDING.get(shard=shard), 1),
+            "lag_sec": round(SYNC_LAG.get(shard=shard), 1),
+            "read_avg_ms": round(read["avg"] * 1000, 2),
+            "write_avg_ms": round(write["avg"] * 1000, 2),
+            "errors": int(SYNC_ERRORS.get(shard=shard)),
+            "retries": int(SYNC_RETRIES.get(shard=shard)),
+        }))
+
+
+async def redis_to_postgres_sync_loop(process_index: int = 0, processes: int = 1):
+    shards = [s for s in range(SYNC_SHARDS) if s % processes == process_index]
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    client = new_redis_client()
+    conn = psycopg2.connect(POSTGRES_URL)
+    metrics.start_http_server(SYNC_METRICS_PORT + process_index)
+    logger.info(
+        f"Sync process {process_index}/{processes} owns shards {shards}, "
+        f"metrics on :{SYNC_METRICS_PORT + process_index}"
+    )
+
+    if process_index == 0:
+        await migrate_legacy_queue(client)
+        await ReferralIndex.migrate_legacy(client)
+
+    started = last_report = time.monotonic()
+    last_sample = 0.0
+    try:
+        while not stop.is_set():
+            busy = False
+            await SeasonService.refresh(client)
+            for shard in shards:
+                if stop.is_set():
+                    break
+                try:
+                    busy |= await sync_batch(client, conn, shard) > 0
+                except Exception:
+                    logger.exception(f"Sync Worker Error (shard {shard})")
+                    if conn.closed:
+                        conn = psycopg2.connect(POSTGRES_URL)
+
+            if time.monotonic() - last_sample >= SYNC_SAMPLE_INTERVAL:
+                try:
+                    await sample_queues(client, shards)
+                except Exception:
+                    logger.exception("Failed to sample sync queues")
+                last_sample = time.monotonic()
+
+            if time.monotonic() - last_report >= SYNC_REPORT_INTERVAL:
+                report(shards, started)
+                last_report = time.monotonic()
+
+            if not busy:
+                try:
+                    await asyncio.wait_for(stop.wait(), SYNC_IDLE_SLEEP)
+                except asyncio.TimeoutError:
+                    pass
     finally:
+        report(shards, started)
         conn.close()
+        await client.aclose()
+        logger.info(f"Sync process {process_index} stopped")
+
+
+def _run_process(process_index: int, processes: int):
+    asyncio.run(redis_to_postgres_sync_loop(process_index, processes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis to Postgres sync worker")
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    if not POSTGRES_URL:
+        parser.error("POSTGRES_URL is not set")
+    if args.processes == 1:
+        _run_process(0, 1)
+        return
+
+    workers = [
+        multiprocessing.Process(target=_run_process, args=(i, args.processes), name=f"sync-{i}")
+        for i in range(args.processes)
+    ]
+    for p in workers:
+        p.start()
+
+    def shutdown(signum, frame):
+        # Children flush their in-flight batch on SIGTERM
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for p in workers:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compact binary encoding for /tap and /sync-passive.
+
+A client that sends `Content-Type: application/x-airdrop-tap` gets fixed
+little-endian struct frames instead of JSON, in both directions:
+
+    tap request        user_id u64, taps u16, ack_version u32          (14 B)
+    passive request    user_id u64, ack_version u32                    (12 B)
+
+    response header    flags u8, state_version u32
+    tap body           points i64, energy u32
+    passive body       earned i64, points i64
+    + state block      (only when flags & HAS_STATE)
+      tap              max_energy u32, level u16, multitap_level u16,
+                       energy_limit_level u16, recharge_speed_level u16,
+                       tap_bot_level u16, profit_per_hour i64
+      passive          profit_per_hour i64
+
+Points and energy change on every call and are always sent. The rest only
+changes on upgrades, so it is versioned (see GameService.state_version).
+The state block is left out when the client's ack_version already matches.
+A client acknowledges by echoing the last state_version it received, and
+sends 0 before it has one.
+"""
+import struct
+
+WIRE_MEDIA_TYPE = "application/x-airdrop-tap"
+
+TAP_REQUEST = struct.Struct("<QHI")
+PASSIVE_REQUEST = struct.Struct("<QI")
+
+RESPONSE_HEADER = struct.Struct("<BI")
+TAP_BODY = struct.Struct("<qI")
+PASSIVE_BODY = struct.Struct("<qq")
+TAP_STATE = struct.Struct("<IHHHHHq")
+PASSIVE_STATE = struct.Struct("<q")
+
+HAS_STATE = 0x01
+
+
+class WireError(ValueError):
+    pass
+
+
+def is_wire_request(content_type: str | None) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == WIRE_MEDIA_TYPE
+
+
+def _unpack(frame: struct.Struct, body: bytes) -> tuple:
+    if len(body) != frame.size:
+        raise WireError(f"expected {frame.size} bytes, got {len(body)}")
+    return frame.unpack(body)
+
+
+def decode_tap_request(body: bytes) -> tuple[int, int, int]:
+    """(user_id, taps, ack_version)"""
+    return _unpack(TAP_REQUEST, body)
+
+
+def decode_passive_request(body: bytes) -> tuple[int, int]:
+    """(user_id, ack_version)"""
+    return _unpack(PASSIVE_REQUEST, body)
+
+
+def encode_tap_response(state: dict, ack_version: int) -> bytes:
+    """`state` is what GameService.process_tap returns."""
+    version = state["stateVersion"]
+    send_state = ack_version != version
+    out = RESPONSE_HEADER.pack(HAS_STATE if send_state else 0, version)
+    out += TAP_BODY.pack(state["points"], state["energy"])
+    if send_state:
+        out += TAP_STATE.pack(
+            state["maxEnergy"], state["level"], state["multitapLevel"], state["energyLimitLevel"],
+            state["rechargeSpeedLevel"], state["tapBotLevel"], state["profitPerHour"],
+        )
+    return out
+
+
+def encode_passive_response(result: dict, ack_version: int) -> bytes:
+    """`result` is what GameService.sync_passive_income returns."""
+    version = result["stateVersion"]
+    send_state = ack_version != version
+    out = RESPONSE_HEADER.pack(HAS_STATE if send_state else 0, version)
+    out += PASSIVE_BODY.pack(result["earned"], result["points"])
+    if send_state:
+        out += PASSIVE_STATE.pack(result["profit_per_hour"])
+    return out
@@ -102,3 +102,59 @@ class PassiveEarnResponse(BaseModel):
     earned: int
     points: int
     profit_per_hour: int
+
+
+# --- App open ---
+class ReferralSummary(BaseModel):
+    # None until the user first opens the Friends page
+    referral_code: Optional[str] = None
+    link: Optional[str] = None
+    friends_count: int
+    total_earned: int
+
+
+class BootstrapResponse(BaseModel):
+    user: UserData
+    gameState: GameState
+    passive: PassiveEarnResponse
+    tasks: UserTasksResponse
+    referral: ReferralSummary
+    # Bearer token for later requests; only issued against verified initData
+    session: Optional[str] = None
+
+
+# --- Leaderboard ---
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    first_name: str
+    points: int
+
+
+class LeaderboardRank(BaseModel):
+    rank: int
+    points: int
+
+
+class LeaderboardResponse(BaseModel):
+    period: str
+    entries: List[LeaderboardEntry]
+    total: int
+    me: Optional[LeaderboardRank] = None
+
+
+class GlobalStats(BaseModel):
+    taps: int
+    points_minted: int
+    players: int
+    updated_at: int
+
+
+class AirdropProof(BaseModel):
+    telegram_id: int
+    # Token base units can exceed what JSON numbers hold exactly
+    amount: str
+    index: int
+    leaf: str
+    proof: List[str]
+    root: str
@@ -0,0 +1,166 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from app.core.config import REFERRAL_INDEX_BUCKETS
+from app.core.database import redis_client
+from app.services.base import RedisKeys, current_season, queue_user_index
+from app.services.tiering_service import TieringService
+
+# Per-day bitmaps / HyperLogLogs are kept this long
+ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "120"))
+
+USER_INDEX_SEQ = "user_index:seq"
+
+# Moves the index sequence up to ARGV[1], never down
+RAISE_INDEX = """
+if tonumber(ARGV[1]) > tonumber(redis.call('GET', KEYS[1]) or '0') then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+"""
+
+
+class ActivityService:
+    """
+    Daily activity analytics.
+
+    Each user gets a dense integer index ("uidx" in their profile), so a day of
+    activity is a bitmap of ~N/8 bytes: DAU is a BITCOUNT and retention is a
+    BITOP AND of a signup cohort with a later day, whatever the user count.
+    Unique tappers are estimated with a HyperLogLog per day.
+
+    The index outlives seasons (RedisKeys.user_index_bucket): a returning
+    player keeps theirs and is not counted as a signup again.
+    """
+
+    @staticmethod
+    def day_key(kind: str, day: date) -> str:
+        return RedisKeys.activity(kind, day)
+
+    @staticmethod
+    def today() -> date:
+        return datetime.now(timezone.utc).date()
+
+    @staticmethod
+    async def next_index() -> int:
+        return await redis_client.incr(USER_INDEX_SEQ)
+
+    @staticmethod
+    def queue_raise_index(pipe, uidx: int):
+        """After restoring users with their indexes, so new users don't get one of those."""
+        pipe.eval(RAISE_INDEX, 1, USER_INDEX_SEQ, int(uidx))
+
+    @staticmethod
+    async def assign_index(user_id: int | str) -> int:
+        """Gives an index to a user created before indexes existed."""
+        user_key = RedisKeys.user(user_id)
+        uidx = await ActivityService.next_index()
+        if await redis_client.hsetnx(user_key, "uidx", uidx):
+            pipe = redis_client.pipeline(transaction=False)
+            queue_user_index(pipe, user_id, uidx)
+            await pipe.execute()
+            return uidx
+        # A concurrent request won; use its index
+        return int(await redis_client.hget(user_key, "uidx"))
+
+    @staticmethod
+    async def previous_index(user_id: int | str) -> Optional[int]:
+        """
+        Index the user was given in an earlier season, None for new users.
+        Profiles of the previous season that the archiver has not reached
+        yet may be the only record of it.
+        """
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(RedisKeys.user_index_bucket(user_id), int(user_id) // REFERRAL_INDEX_BUCKETS)
+        if current_season():
+            pipe.hget(RedisKeys.user(user_id, current_season() - 1), "uidx")
+        uidx = next((value for value in await pipe.execute() if value), None)
+        return int(uidx) if uidx else None
+
+    @staticmethod
+    def _queue_bit(pipe, kind: str, uidx: int | str, day: date):
+        key = ActivityService.day_key(kind, day)
+        pipe.setbit(key, int(uidx), 1)
+        pipe.expire(key, ACTIVITY_RETENTION_DAYS * 86400)
+
+    @staticmethod
+    def queue_signup(pipe, uidx: int | str):
+        today = ActivityService.today()
+        ActivityService._queue_bit(pipe, "signups", uidx, today)
+        ActivityService._queue_bit(pipe, "dau", uidx, today)
+
+    @staticmethod
+    def queue_activity(pipe, uidx: int | str, user_id: int | str, tapped: bool = False):
+        today = ActivityService.today()
+        ActivityService._queue_bit(pipe, "dau", uidx, today)
+        if tapped:
+            key = ActivityService.day_key("tappers", today)
+            pipe.pfadd(key, str(user_id))
+            pipe.expire(key, ACTIVITY_RETENTION_DAYS * 86400)
+
+    @staticmethod
+    async def record_request(user_id: int | str) -> bool:
+        """
+        Marks the user active today, for endpoints that don't read the profile
+        themselves. Also reloads evicted users. Returns False for unknown users.
+        """
+        uidx = await redis_client.hget(RedisKeys.user(user_id), "uidx")
+        if uidx is None:
+            if not await TieringService.ensure_resident(user_id):
+                return False
+            uidx = await redis_client.hget(RedisKeys.user(user_id), "uidx")
+            if uidx is None:
+                uidx = await ActivityService.assign_index(user_id)
+
+        await ActivityService.mark_active(uidx, user_id)
+        return True
+
+    @staticmethod
+    async def mark_active(uidx: int | str, user_id: int | str):
+        pipe = redis_client.pipeline(transaction=False)
+        ActivityService.queue_activity(pipe, uidx, user_id)
+        await pipe.execute()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    @staticmethod
+    async def _cohort_retention(cohort_day: date, active_day: date) -> Dict[str, Any]:
+        signups = ActivityService.day_key("signups", cohort_day)
+        active = ActivityService.day_key("dau", active_day)
+        tmp = RedisKeys.activity(f"tmp:retention:{cohort_day:%Y-%m-%d}", active_day)
+
+        pipe = redis_client.pipeline()
+        pipe.bitcount(signups)
+        pipe.bitop("AND", tmp, signups, active)
+        pipe.bitcount(tmp)
+        pipe.delete(tmp)
+        cohort, _, retained, _ = await pipe.execute()
+
+        return {
+            "cohort": f"{cohort_day:%Y-%m-%d}",
+            "cohort_size": cohort,
+            "retained": retained,
+            "rate": round(retained / cohort, 4) if cohort else None,
+        }
+
+    @staticmethod
+    async def day_report(day: date) -> Dict[str, Any]:
+        week = [ActivityService.day_key("tappers", day - timedelta(days=i)) for i in range(7)]
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.bitcount(ActivityService.day_key("dau", day))
+        pipe.bitcount(ActivityService.day_key("signups", day))
+        pipe.pfcount(ActivityService.day_key("tappers", day))
+        pipe.pfcount(*week)
+        dau, new_users, tappers, weekly_tappers = await pipe.execute()
+
+        return {
+            "day": f"{day:%Y-%m-%d}",
+            "dau": dau,
+            "new_users": new_users,
+            "unique_tappers": tappers,
+            "unique_tappers_7d": weekly_tappers,
+            "d1_retention": await ActivityService._cohort_retention(day - timedelta(days=1), day),
+            "d7_retention": await ActivityService._cohort_retention(day - timedelta(days=7), day),
+        }
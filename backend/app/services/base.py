@@ -1,17 +1,208 @@
 # app/services/base.py
+import time
+import zlib
+
+from app.core.config import (
+    CLICK_BUFFER_SHARDS, LEDGER_SHARDS, REDIS_HASH_TAGS, REFERRAL_INDEX_BUCKETS, SYNC_SHARDS,
+)
+
+LAST_SEEN_KEY = "users_last_seen"
+# All-time board of season 0 (see RedisKeys.leaderboard)
+LEADERBOARD_KEY = "leaderboard:points"
+# Pub/sub channel carrying ids of users whose balance changed outside their own requests
+BALANCE_EVENTS_CHANNEL = "events:balance"
+# Pre-sharding sync queue (a plain set); drained into the shards by the sync worker
+LEGACY_SYNC_SET_KEY = "users_to_sync"
+# Number of the running season; bumping it starts a new one (see SeasonService)
+CURRENT_SEASON_KEY = "season:current"
+
+# Single-hash referral indexes, before they were bucketed (see ReferralIndex)
+LEGACY_REFERRAL_CODES_KEY = "referral_code_to_user"
+LEGACY_REFERRAL_LINKS_KEY = "referral_links"
+
+# Families that start empty every season; the referral graph carries over
+SEASON_FAMILIES = ("profile", "tasks", "daily_rewards", "stats")
+
+_current_season = 0
+_hash_tags = REDIS_HASH_TAGS
+
+
+def current_season() -> int:
+    """Season used by RedisKeys, as last read by SeasonService.refresh()."""
+    return _current_season
+
+
+def set_current_season(season: int):
+    global _current_season
+    _current_season = int(season)
+
+
+def set_hash_tags(enabled: bool):
+    global _hash_tags
+    _hash_tags = bool(enabled)
+
+
+def _tag(part: int | str) -> str:
+    """With hash tags, Redis Cluster hashes only the part in braces, so keys sharing it share a slot."""
+    return f"{{{part}}}" if _hash_tags else str(part)
+
+
 class RedisKeys:
+    """
+    The one place key names are built. With REDIS_HASH_TAGS the user id in
+    every per-user key is wrapped in braces ("user:{42}:tasks"), so a user's
+    keys share a cluster slot and their transactions stay on one node. Keys
+    renamed into each other are tagged by shard.
+    """
+
     @staticmethod
-    def user(user_id: int | str) -> str:
-        return f"user:{user_id}"
+    def user_prefix(season: int | None = None) -> str:
+        """
+        Season-scoped keys are "user:{season}:{id}..."; season 0 keeps the
+        original "user:{id}..." names, so no migration was needed.
+        """
+        season = current_season() if season is None else season
+        return f"user:{season}:" if season else "user:"
 
     @staticmethod
-    def user_tasks(user_id: int | str) -> str:
-        return f"user:{user_id}:tasks"
+    def user(user_id: int | str, season: int | None = None) -> str:
+        return f"{RedisKeys.user_prefix(season)}{_tag(user_id)}"
 
     @staticmethod
-    def user_daily_rewards(user_id: int | str) -> str:
-        return f"user:{user_id}:daily_rewards"
+    def user_tasks(user_id: int | str, season: int | None = None) -> str:
+        return f"{RedisKeys.user(user_id, season)}:tasks"
 
     @staticmethod
-    def user_stats(user_id: int | str) -> str:
-        return f"user:{user_id}:stats"
+    def user_daily_rewards(user_id: int | str, season: int | None = None) -> str:
+        return f"{RedisKeys.user(user_id, season)}:daily_rewards"
+
+    @staticmethod
+    def user_stats(user_id: int | str, season: int | None = None) -> str:
+        return f"{RedisKeys.user(user_id, season)}:stats"
+
+    @staticmethod
+    def user_referral(user_id: int | str) -> str:
+        return f"user:{_tag(user_id)}:referral"
+
+    @staticmethod
+    def user_referrals(user_id: int | str) -> str:
+        return f"user:{_tag(user_id)}:referrals"
+
+    @staticmethod
+    def user_scan_pattern(season: int | None = None) -> str:
+        """SCAN pattern matching the season's profile hashes (and, without hash tags, the other families)."""
+        return f"{RedisKeys.user_prefix(season)}{{*}}" if _hash_tags else f"{RedisKeys.user_prefix(season)}*"
+
+    @staticmethod
+    def profile_user_id(key: str, season: int | None = None) -> str | None:
+        """User id of a profile key found with user_scan_pattern(), None for other keys."""
+        user_id = key[len(RedisKeys.user_prefix(season)):]
+        if _hash_tags:
+            user_id = user_id[1:-1] if user_id[:1] == "{" and user_id[-1:] == "}" else ""
+        return user_id if user_id.isdigit() else None
+
+    @staticmethod
+    def tagged(legacy_key: str) -> str:
+        """Hash-tagged name of a legacy "user:[season:]id[:family]" or "activity:..." key (see app/core/key_migration.py)."""
+        parts = legacy_key.split(":")
+        if parts[0] == "activity":
+            return ":".join(["{activity}", *parts[1:]])
+        id_at = 2 if len(parts) > 2 and parts[1].isdigit() and parts[2].isdigit() else 1
+        parts[id_at] = f"{{{parts[id_at]}}}"
+        return ":".join(parts)
+
+    @staticmethod
+    def referral_code_bucket(code: str) -> str:
+        """One of the REFERRAL_INDEX_BUCKETS hashes of the code -> user id index."""
+        return f"refcode:{zlib.crc32(code.encode()) % REFERRAL_INDEX_BUCKETS}"
+
+    @staticmethod
+    def referral_link_bucket(user_id: int | str) -> str:
+        """One of the REFERRAL_INDEX_BUCKETS hashes of the user id -> code index."""
+        return f"reflink:{int(user_id) % REFERRAL_INDEX_BUCKETS}"
+
+    @staticmethod
+    def user_index_bucket(user_id: int | str) -> str:
+        """One of the REFERRAL_INDEX_BUCKETS hashes of the user id -> activity index (uidx); not per season."""
+        return f"uidx:{int(user_id) % REFERRAL_INDEX_BUCKETS}"
+
+    @staticmethod
+    def activity(kind: str, day) -> str:
+        """Daily activity bitmap/HyperLogLog; tagged together since reports combine several days."""
+        return f"{_tag('activity')}:{kind}:{day:%Y-%m-%d}"
+
+    @staticmethod
+    def leaderboard(period: str | None = None, season: int | None = None) -> str:
+        """The season's all-time board, or a periodic one such as "daily:2024-10-25" / "weekly:2024-W43"."""
+        if period:
+            return f"leaderboard:{period}"
+        season = current_season() if season is None else season
+        return f"leaderboard:{season}:points" if season else LEADERBOARD_KEY
+
+    @staticmethod
+    def sync_shard(user_id: int | str) -> int:
+        return int(user_id) % SYNC_SHARDS
+
+    @staticmethod
+    def sync_queue(shard: int) -> str:
+        return f"users_to_sync:{shard}"
+
+    @staticmethod
+    def click_buffer_shard(user_id: int | str) -> int:
+        return int(user_id) % CLICK_BUFFER_SHARDS
+
+    @staticmethod
+    def click_buffer(shard: int) -> str:
+        return f"user_clicks_buffer:{_tag(shard)}"
+
+    @staticmethod
+    def click_processing(shard: int) -> str:
+        """Renamed from click_buffer(shard), so tagged the same way."""
+        return f"user_clicks_processing:{_tag(shard)}"
+
+    @staticmethod
+    def ledger_shard(user_id: int | str) -> int:
+        return int(user_id) % LEDGER_SHARDS
+
+    @staticmethod
+    def ledger_buffer(shard: int) -> str:
+        return f"ledger:buffer:{_tag(shard)}"
+
+    @staticmethod
+    def ledger_processing(shard: int, batch_id: int | str) -> str:
+        """Renamed from ledger_buffer(shard), so tagged the same way."""
+        return f"ledger:processing:{_tag(shard)}:{batch_id}"
+
+    @staticmethod
+    def user_families(user_id: int | str, season: int | None = None) -> dict:
+        """Every per-user key, by the name it has in the Postgres raw_state snapshot."""
+        return {
+            "profile": RedisKeys.user(user_id, season),
+            "tasks": RedisKeys.user_tasks(user_id, season),
+            "daily_rewards": RedisKeys.user_daily_rewards(user_id, season),
+            "stats": RedisKeys.user_stats(user_id, season),
+            "referral_summary": RedisKeys.user_referral(user_id),
+            "friends": RedisKeys.user_referrals(user_id),
+        }
+
+
+def track_user_write(pipe, user_id: int | str, now: int | None = None):
+    """Queue the user for the Postgres sync and refresh their last-seen score.
+
+    Must be called on the same pipeline as the write itself so the eviction
+    job never sees a user as idle while one of their writes is in flight.
+    The sync queue score is the time of the first unsynced change (NX).
+    """
+    now = now or int(time.time())
+    queue = RedisKeys.sync_queue(RedisKeys.sync_shard(user_id))
+    pipe.zadd(queue, {str(user_id): now}, nx=True)
+    pipe.zadd(LAST_SEEN_KEY, {str(user_id): now})
+
+
+def queue_user_index(pipe, user_id: int | str, uidx: int | str, nx: bool = False):
+    """Remember the user's activity index, so they keep it in later seasons."""
+    field = int(user_id) // REFERRAL_INDEX_BUCKETS
+    if nx:
+        pipe.hsetnx(RedisKeys.user_index_bucket(user_id), field, uidx)
+    else:
+        pipe.hset(RedisKeys.user_index_bucket(user_id), field, uidx)
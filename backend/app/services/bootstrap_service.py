@@ -0,0 +1,91 @@
+import time
+
+from app.core.database import redis_client
+from app.schemas import UserData
+from app.services.activity_service import ActivityService
+from app.services.base import RedisKeys, track_user_write
+from app.services.game_service import GameService
+from app.services.points_service import PointsService
+from app.services.referral_service import ReferralService
+from app.services.task_service import TaskService
+from app.services.tiering_service import TieringService
+
+
+class BootstrapService:
+    """
+    Everything the Mini App needs when it opens, in two Redis round trips:
+    one pipeline reads all of the user's hashes and one MULTI applies user
+    creation, task / reward initialization, energy regen and passive income.
+
+    Does the work of /auth, /tasks, /sync-passive and the referral summary.
+    Only users seen for the first time (index allocation) and evicted users
+    (reload from Postgres) take extra round trips.
+    """
+
+    @staticmethod
+    async def _read(user_id: int) -> list:
+        keys = TaskService.get_keys(user_id)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hgetall(keys["user"])
+        pipe.hgetall(keys["tasks"])
+        pipe.hgetall(keys["rewards"])
+        pipe.hgetall(keys["stats"])
+        pipe.hgetall(RedisKeys.user_referral(user_id))
+        return await pipe.execute()
+
+    @staticmethod
+    async def bootstrap(user: UserData) -> dict:
+        user_id = user.id
+        profile, tasks, rewards, stats, referral = await BootstrapService._read(user_id)
+        # A hash without max_energy only holds increments made before the profile existed
+        if not profile.get("max_energy") and await TieringService.rehydrate(user_id):
+            profile, tasks, rewards, stats, referral = await BootstrapService._read(user_id)
+
+        now = int(time.time())
+        pipe = redis_client.pipeline()
+        if not profile.get("max_energy"):
+            credited = int(profile.get("points", 0))
+            profile, returning = await GameService.new_state(user, now)
+            GameService.queue_create(pipe, user, profile, returning)
+            profile["points"] = credited
+        elif not profile.get("uidx"):
+            profile["uidx"] = await ActivityService.assign_index(user_id)
+
+        # Tasks, daily rewards and streak stats, as initialize_tasks would create them
+        created = TaskService.queue_initialization(pipe, str(user_id), tasks, bool(rewards), bool(stats))
+        tasks = {**tasks, **created["tasks"]}
+        rewards = rewards or created["rewards"]
+        stats = stats or created["stats"]
+
+        # Energy regen (process_tap with no taps) and passive income
+        energy = GameService.regen_energy(profile, now)
+        earned, eligible_seconds = GameService.passive_earnings(profile, now)
+        points = int(profile.get("points", 0)) + earned
+        PointsService.credit(pipe, user_id, earned, "passive_income", ref=eligible_seconds, balance=points)
+        pipe.hset(GameService.get_user_key(user_id), mapping={
+            "energy": energy,
+            "last_sync_time": now,
+            "last_passive_sync": now,
+        })
+        track_user_write(pipe, user_id, now)
+        ActivityService.queue_activity(pipe, profile["uidx"], user_id)
+        await pipe.execute()
+
+        profile = {**profile, "points": points, "energy": energy, "last_passive_sync": now}
+        code = referral.get("referral_code")
+        return {
+            "user": user,
+            "gameState": GameService.format_state(profile),
+            "passive": {
+                "earned": earned,
+                "points": points,
+                "profit_per_hour": int(profile.get("profit_per_hour", 0)),
+            },
+            "tasks": TaskService.build_overview(tasks, rewards, stats, points, TaskService.get_today_iso()),
+            "referral": {
+                "referral_code": code,
+                "link": ReferralService.referral_link(code) if code else None,
+                "friends_count": int(referral.get("friends_count", 0)),
+                "total_earned": int(referral.get("total_earned", 0)),
+            },
+        }
@@ -0,0 +1,168 @@
+import bisect
+import math
+import os
+from typing import Optional
+
+from app.core.database import redis_client
+from app.services.base import RedisKeys
+
+# "0" stops collecting statistics and flagging
+BOT_DETECTION = os.getenv("BOT_DETECTION", "1") == "1"
+# Taps per second a flagged user is credited at most; 0 only flags them
+BOT_THROTTLE_TPS = float(os.getenv("BOT_THROTTLE_TPS", "0"))
+
+BOT_REVIEW_KEY = "bots:review"
+
+# Requests between which the player took a break; not counted as an inter-arrival time
+SESSION_GAP_SECONDS = 30
+# Smoothing of the inter-arrival mean and variance (about the last 1 / alpha requests)
+GAP_ALPHA = 0.05
+# Lower edges of the taps-per-second histogram buckets; the last one is beyond human speed
+TPS_EDGES = (0, 1, 2, 4, 6, 8, 11, 15)
+# Histograms are halved when a bucket reaches this, so they fit a byte each and favour recent play
+HISTOGRAM_CAP = 255
+
+MIN_SAMPLES = 50
+# Flag thresholds
+MAX_GAP_CV = 0.05
+MIN_REPEATS = 30
+MIN_SUPERHUMAN_SHARE = 0.5
+MIN_HOUR_SAMPLES = 200
+MAX_HOUR_ENTROPY = 4.3  # bits; log2(24) ~ 4.58 is the same activity every hour
+
+HOURS = 24
+STAT_FIELDS = (
+    "bot_last", "bot_samples", "bot_gap_mean", "bot_gap_var", "bot_tps", "bot_taps", "bot_repeats", "bot_hours",
+)
+
+
+def _histogram(value: Optional[str], size: int) -> list:
+    counts = list(bytes.fromhex(value)) if value else []
+    return counts if len(counts) == size else [0] * size
+
+
+def _add(counts: list, index: int) -> str:
+    counts[index] += 1
+    if counts[index] >= HISTOGRAM_CAP:
+        counts[:] = [c // 2 for c in counts]
+    return bytes(counts).hex()
+
+
+def _entropy(counts: list) -> float:
+    total = sum(counts)
+    return -sum(c / total * math.log2(c / total) for c in counts if c) if total else 0.0
+
+
+class BotDetector:
+    """
+    Streaming statistics of each user's taps, kept as a few short "bot_*"
+    fields of their profile hash: process_tap already reads the profile and
+    writes it back, so they cost no extra round trip, and no tap events are
+    stored.
+
+    - bot_last / bot_gap_mean / bot_gap_var: time of the last tap request and
+      the exponentially weighted mean and variance of the time between them
+    - bot_taps / bot_repeats: the last `taps` value and how many requests in
+      a row sent exactly it
+    - bot_tps: histogram of taps per second over TPS_EDGES (hex, a byte each)
+    - bot_hours: histogram of the UTC hour of day of tap requests (hex)
+
+    Auto-clickers send the same `taps` at a fixed interval, faster than a
+    thumb, or around the clock. A user matching any of those is flagged:
+    bot_flag lists the reasons, and the BOT_REVIEW_KEY sorted set holds them
+    by time of flagging for review (see the admin endpoints).
+    """
+
+    @staticmethod
+    def reasons(stats: dict) -> list:
+        reasons = []
+        samples = int(stats.get("bot_samples", 0))
+        if samples >= MIN_SAMPLES:
+            mean = float(stats.get("bot_gap_mean", 0))
+            variance = float(stats.get("bot_gap_var", 0))
+            repeats = int(stats.get("bot_repeats", 0))
+            if mean > 0 and math.sqrt(variance) / mean < MAX_GAP_CV and repeats >= MIN_REPEATS:
+                reasons.append("regular")
+            tps = _histogram(stats.get("bot_tps"), len(TPS_EDGES))
+            if sum(tps) and tps[-1] / sum(tps) >= MIN_SUPERHUMAN_SHARE:
+                reasons.append("superhuman")
+        hours = _histogram(stats.get("bot_hours"), HOURS)
+        if sum(hours) >= MIN_HOUR_SAMPLES and _entropy(hours) >= MAX_HOUR_ENTROPY:
+            reasons.append("around_the_clock")
+        return reasons
+
+    @staticmethod
+    def observe(data: dict, taps: int, now: float) -> tuple[dict, Optional[str]]:
+        """
+        Fields to write back to the profile for a tap request of `taps` at
+        `now` (seconds), and the reasons if this request gets the user flagged.
+        """
+        if not BOT_DETECTION:
+            return {}, None
+        fields = {"bot_last": int(now * 1000)}
+        hours = _histogram(data.get("bot_hours"), HOURS)
+        fields["bot_hours"] = _add(hours, int(now // 3600) % HOURS)
+
+        last = data.get("bot_last")
+        gap = now - int(last) / 1000 if last else None
+        if gap is not None and 0 < gap <= SESSION_GAP_SECONDS:
+            samples = int(data.get("bot_samples", 0))
+            mean = float(data.get("bot_gap_mean", gap))
+            variance = float(data.get("bot_gap_var", 0))
+            delta = gap - mean
+            mean += GAP_ALPHA * delta
+            variance = (1 - GAP_ALPHA) * (variance + GAP_ALPHA * delta * delta)
+
+            tps = _histogram(data.get("bot_tps"), len(TPS_EDGES))
+            bucket = bisect.bisect_right(TPS_EDGES, taps / gap) - 1
+            repeats = int(data.get("bot_repeats", 0)) + 1 if str(taps) == data.get("bot_taps") else 0
+            fields.update({
+                "bot_samples": samples + 1,
+                "bot_gap_mean": f"{mean:.4f}",
+                "bot_gap_var": f"{variance:.6f}",
+                "bot_tps": _add(tps, bucket),
+                "bot_taps": taps,
+                "bot_repeats": repeats,
+            })
+
+        if data.get("bot_flag"):
+            return fields, None
+        reasons = BotDetector.reasons({**data, **fields})
+        if reasons:
+            fields["bot_flag"] = ",".join(reasons)
+            return fields, fields["bot_flag"]
+        return fields, None
+
+    @staticmethod
+    def throttle(data: dict, taps: int, now: float) -> int:
+        """Taps credited to a flagged user: at most BOT_THROTTLE_TPS per second since their last request."""
+        if not (BOT_THROTTLE_TPS and data.get("bot_flag") and data.get("bot_last")):
+            return taps
+        elapsed = min(max(now - int(data["bot_last"]) / 1000, 0), SESSION_GAP_SECONDS)
+        return min(taps, int(BOT_THROTTLE_TPS * elapsed))
+
+    @staticmethod
+    def queue_flag(pipe, user_id: int | str, now: float):
+        pipe.zadd(BOT_REVIEW_KEY, {str(user_id): int(now)}, nx=True)
+
+    @staticmethod
+    async def review(limit: int = 100) -> list:
+        """The most recently flagged users with their reasons."""
+        flagged = await redis_client.zrevrange(BOT_REVIEW_KEY, 0, limit - 1, withscores=True)
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, _ in flagged:
+            pipe.hget(RedisKeys.user(user_id), "bot_flag")
+        reasons = await pipe.execute() if flagged else []
+        return [
+            {"user_id": int(user_id), "flagged_at": int(flagged_at), "reasons": why.split(",") if why else []}
+            for (user_id, flagged_at), why in zip(flagged, reasons)
+        ]
+
+    @staticmethod
+    async def clear(user_id: int | str) -> bool:
+        """Unflags a reviewed user and restarts their statistics."""
+        pipe = redis_client.pipeline()
+        pipe.zrem(BOT_REVIEW_KEY, str(user_id))
+        pipe.hdel(RedisKeys.user(user_id), "bot_flag", *STAT_FIELDS)
+        removed, _ = await pipe.execute()
+        return bool(removed)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Set
+
+from app.core import metrics
+from app.core.database import redis_client
+from app.services.base import RedisKeys, BALANCE_EVENTS_CHANNEL
+from app.services.season_service import SeasonService
+
+logger = logging.getLogger("event_hub")
+
+# A client gets at most one push per interval, however many events arrive
+EVENTS_PUSH_INTERVAL = float(os.getenv("EVENTS_PUSH_INTERVAL", "1"))
+# Ranks move without any event for the viewer; re-check them this often
+EVENTS_RANK_INTERVAL = float(os.getenv("EVENTS_RANK_INTERVAL", "10"))
+
+CONNECTED_CLIENTS = metrics.gauge("events_connected_clients", "Open SSE connections in this worker")
+PUSHES = metrics.counter("events_pushes_total", "State updates queued to SSE clients")
+FANOUT_SECONDS = metrics.histogram(
+    "events_fanout_seconds", "Time from receiving a pub/sub event to queueing the push"
+)
+
+
+class EventClient:
+    """One SSE connection. Holds only the latest unsent state (older ones are dropped)."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.pending = None
+        self.last_sent = None
+        self.ready = asyncio.Event()
+
+    def offer(self, state: dict) -> bool:
+        if state == self.last_sent:
+            return False
+        self.pending = state
+        self.ready.set()
+        return True
+
+    async def next_state(self, timeout: float) -> dict | None:
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.ready.clear()
+        state, self.pending = self.pending, None
+        self.last_sent = state
+        return state
+
+
+class EventHub:
+    """
+    Per-worker fan-out of balance / rank updates.
+
+    Each uvicorn worker holds a single Redis pub/sub subscription. Events only
+    carry a user id; the hub batches the ids of connected users and reads
+    their balances and ranks in one pipeline per push interval.
+    """
+
+    def __init__(self):
+        self.clients: Dict[str, Set[EventClient]] = {}
+        self._dirty: Dict[str, float] = {}
+        self._tasks = []
+        self._next_rank_check = 0.0
+
+    def connect(self, user_id: int | str) -> EventClient:
+        self.start()
+        client = EventClient(str(user_id))
+        self.clients.setdefault(client.user_id, set()).add(client)
+        # Send the current state right away
+        self._dirty.setdefault(client.user_id, time.perf_counter())
+        CONNECTED_CLIENTS.inc()
+        return client
+
+    def disconnect(self, client: EventClient):
+        peers = self.clients.get(client.user_id)
+        if peers is not None:
+            peers.discard(client)
+            if not peers:
+                del self.clients[client.user_id]
+        CONNECTED_CLIENTS.inc(-1)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._listen()),
+                asyncio.create_task(self._flush_loop()),
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def mark_dirty(self, user_id: str):
+        if user_id in self.clients:
+            self._dirty.setdefault(user_id, time.perf_counter())
+
+    async def _listen(self):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(BALANCE_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.mark_dirty(str(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event hub subscription failed, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(EVENTS_PUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Event hub flush failed")
+
+    async def flush(self):
+        await SeasonService.refresh()
+        dirty, self._dirty = self._dirty, {}
+        now = time.monotonic()
+        if now >= self._next_rank_check:
+            # Leaderboard movement: everyone connected gets a rank check
+            self._next_rank_check = now + EVENTS_RANK_INTERVAL
+            for user_id in self.clients:
+                dirty.setdefault(user_id, None)
+
+        user_ids = [uid for uid in dirty if uid in self.clients]
+        if not user_ids:
+            return
+
+        board = RedisKeys.leaderboard()
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hget(RedisKeys.user(user_id), "points")
+            pipe.zrevrank(board, user_id)
+        res = await pipe.execute()
+
+        for i, user_id in enumerate(user_ids):
+            points, rank = res[2 * i], res[2 * i + 1]
+            state = {
+                "points": int(points or 0),
+                "rank": rank + 1 if rank is not None else None,
+            }
+            for client in self.clients.get(user_id, ()):
+                if client.offer(state):
+                    PUSHES.inc()
+            if dirty[user_id] is not None:
+                FANOUT_SECONDS.observe(time.perf_counter() - dirty[user_id])
+
+    @staticmethod
+    def format_sse(state: dict) -> str:
+        return f"event: state\ndata: {json.dumps(state)}\n\n"
+
+
+event_hub = EventHub()
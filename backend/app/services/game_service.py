@@ -3,40 +3,131 @@ from fastapi import HTTPException
 from app.core.database import redis_client
 from app.core.config import LEVELS, UPGRADE_CONFIG
 from app.schemas import UserData
+from app.services.activity_service import ActivityService
+from app.services.base import RedisKeys, current_season, queue_user_index, track_user_write
+from app.services.bot_detector import BotDetector
+from app.services.points_service import PointsService
+from app.services.stats_service import StatsService
+from app.services.tiering_service import TieringService
+
+# Passive income stops accruing after this long offline
+MAX_OFFLINE_SECONDS = 3 * 3600
+
 
 class GameService:
     @staticmethod
     def get_user_key(user_id: int | str) -> str:
-        return f"user:{user_id}"
+        return RedisKeys.user(user_id)
+
+    @staticmethod
+    async def load_user(user_id: int) -> dict:
+        """HGETALL of the user hash, reloading evicted users from Postgres on a miss."""
+        user_key = GameService.get_user_key(user_id)
+        data = await redis_client.hgetall(user_key)
+        if not data and await TieringService.rehydrate(user_id):
+            data = await redis_client.hgetall(user_key)
+        return data
+
+    @staticmethod
+    def initial_state(user: UserData, uidx: int, current_time: int) -> dict:
+        return {
+            "points": 0, 
+            "energy": 1000, 
+            "max_energy": 1000, 
+            "level": 1,
+            "multitap_level": 1, 
+            "energy_limit_level": 1, 
+            "recharge_speed_level": 1,
+            "tap_bot_level": 0, 
+            "last_sync_time": current_time,
+            # --- PASSIVE EARN FIELDS ---
+            "profit_per_hour": 0,
+            "last_passive_sync": current_time,
+            # Shown on the leaderboard
+            "first_name": user.first_name or "",
+            # Weighs into the airdrop allocation
+            "is_premium": int(bool(user.is_premium)),
+            # Dense index into the activity bitmaps
+            "uidx": uidx,
+            # Taps credited this season (referral farm detection)
+            "total_taps": 0,
+        }
+
+    @staticmethod
+    async def new_state(user: UserData, current_time: int) -> tuple[dict, bool]:
+        """Initial state of a user without a profile this season, and whether they played an earlier one."""
+        uidx = await ActivityService.previous_index(user.id)
+        state = GameService.initial_state(user, uidx or await ActivityService.next_index(), current_time)
+        return state, uidx is not None
+
+    @staticmethod
+    def queue_create(pipe, user: UserData, state: dict, returning: bool = False):
+        user_key = GameService.get_user_key(user.id)
+        pipe.hset(user_key, mapping={k: v for k, v in state.items() if k != "points"})
+        # Keeps points credited before the profile existed
+        pipe.hsetnx(user_key, "points", state["points"])
+        track_user_write(pipe, user.id, state["last_sync_time"])
+        if returning:
+            # Counted, and in a signup cohort, since their first season
+            ActivityService.queue_activity(pipe, state["uidx"], user.id)
+            return
+        queue_user_index(pipe, user.id, state["uidx"])
+        ActivityService.queue_signup(pipe, state["uidx"])
+        StatsService.queue_increment(pipe, user.id, "players")
 
     @staticmethod
     async def create_user_if_not_exists(user: UserData):
+        # Not just EXISTS: an increment may have made a hash that is no profile
         user_key = GameService.get_user_key(user.id)
-        if not await redis_client.exists(user_key):
-            current_time = int(time.time())
-            initial_state = {
-                "points": 0, 
-                "energy": 1000, 
-                "max_energy": 1000, 
-                "level": 1,
-                "multitap_level": 1, 
-                "energy_limit_level": 1, 
-                "recharge_speed_level": 1,
-                "tap_bot_level": 0, 
-                "last_sync_time": current_time,
-                # --- PASSIVE EARN FIELDS ---
-                "profit_per_hour": 0,
-                "last_passive_sync": current_time
-            }
-            await redis_client.hset(user_key, mapping=initial_state)
+        if await redis_client.hexists(user_key, "max_energy"):
+            return
+        if await TieringService.rehydrate(user.id) and await redis_client.hexists(user_key, "max_energy"):
+            return
+        state, returning = await GameService.new_state(user, int(time.time()))
+        pipe = redis_client.pipeline()
+        GameService.queue_create(pipe, user, state, returning)
+        await pipe.execute()
+
+    @staticmethod
+    def regen_energy(data: dict, current_time: int) -> int:
+        """Stored energy plus what has recharged since the last sync."""
+        max_energy = int(data.get("max_energy", 1000))
+        regen_rate = 1 + (int(data.get("recharge_speed_level", 1)) - 1)
+        seconds_passed = current_time - int(data.get("last_sync_time", current_time))
+        return min(max_energy, int(data.get("energy", 0)) + (seconds_passed * regen_rate))
+
+    @staticmethod
+    def passive_earnings(data: dict, current_time: int) -> tuple[int, int]:
+        """(coins earned, seconds they were earned over) since the last passive sync."""
+        last_passive_sync = int(data.get("last_passive_sync", current_time))
+        profit_per_hour = int(data.get("profit_per_hour", 0))
+        eligible_seconds = min(current_time - last_passive_sync, MAX_OFFLINE_SECONDS)
+
+        # Avoid division by zero issues
+        earned_coins = 0
+        if profit_per_hour > 0 and eligible_seconds > 0:
+            earned_coins = int((profit_per_hour / 3600) * eligible_seconds)
+        return earned_coins, eligible_seconds
 
     @staticmethod
     async def get_user_state(user_id: int):
-        user_key = GameService.get_user_key(user_id)
-        data = await redis_client.hgetall(user_key)
+        data = await GameService.load_user(user_id)
         if not data:
             return None
             
+        return GameService.format_state(data)
+
+    @staticmethod
+    def state_version(data: dict) -> int:
+        """
+        Changes whenever a field other than points / energy may have (upgrades,
+        mining cards, a new season), so clients can skip resending those.
+        Never 0, which clients send before they have seen a version.
+        """
+        return ((current_season() << 24) | int(data.get("state_ver", 0))) + 1
+
+    @staticmethod
+    def format_state(data: dict) -> dict:
         # Convert Redis strings to ints
         return {
             "points": int(data.get("points", 0)),
@@ -58,26 +149,28 @@ class GameService:
             return await GameService.get_user_state(user_id)
 
         user_key = GameService.get_user_key(user_id)
-        data = await redis_client.hgetall(user_key)
+        data = await GameService.load_user(user_id)
         
         if not data:
             raise HTTPException(status_code=404, detail="User not found")
         
-        current_time = int(time.time())
-        
+        now = time.time()
+        current_time = int(now)
+        # Statistics use the taps as sent; flagged users may be credited fewer.
+        # /auth syncs regen with taps=0, which is not a tap sample
+        bot_fields, flagged = {}, None
+        if taps > 0:
+            bot_fields, flagged = BotDetector.observe(data, taps, now)
+            taps = BotDetector.throttle(data, taps, now)
+
         # 1. Parse Data
         multitap_level = int(data.get("multitap_level", 1))
-        stored_energy = int(data.get("energy", 0))
         max_energy = int(data.get("max_energy", 1000))
-        last_sync = int(data.get("last_sync_time", current_time))
         recharge_level = int(data.get("recharge_speed_level", 1))
         current_level = int(data.get("level", 1))
 
         # 2. Calculate Passive Energy Regen
-        regen_rate = 1 + (recharge_level - 1)
-        seconds_passed = current_time - last_sync
-        
-        energy_with_regen = min(max_energy, stored_energy + (seconds_passed * regen_rate))
+        energy_with_regen = GameService.regen_energy(data, current_time)
         
         # 3. Calculate Cost per Tap
         base_val = 1
@@ -100,22 +193,33 @@ class GameService:
         
         new_energy = int(energy_with_regen - total_energy_cost)
         
+        final_points = int(data.get("points", 0)) + points_gained
+
+        uidx = data.get("uidx") or await ActivityService.assign_index(user_id)
+
         # 5. Save State
         pipe = redis_client.pipeline()
-        pipe.hincrby(user_key, "points", points_gained)
+        PointsService.credit(pipe, user_id, points_gained, "tap", ref=actual_taps, balance=final_points)
         pipe.hset(user_key, mapping={
             "energy": new_energy,
-            "last_sync_time": current_time
+            "last_sync_time": current_time,
+            **bot_fields,
         })
-        pipe.sadd("users_to_sync", user_id)
+        if flagged:
+            BotDetector.queue_flag(pipe, user_id, now)
+        if actual_taps > 0:
+            shard = RedisKeys.click_buffer_shard(user_id)
+            pipe.hincrby(RedisKeys.click_buffer(shard), user_id, actual_taps)
+            pipe.hincrby(user_key, "total_taps", actual_taps)
+            StatsService.queue_increment(pipe, user_id, "taps", actual_taps)
+        track_user_write(pipe, user_id, current_time)
+        ActivityService.queue_activity(pipe, uidx, user_id, tapped=actual_taps > 0)
         await pipe.execute()
 
         
         # 6. Return Data
         # Re-fetch specific updated fields to ensure accuracy
         # But for speed, we can calculate local state to return
-        final_points = int(data.get("points", 0)) + points_gained
-        
         return {
             "points": final_points,
             "energy": new_energy, 
@@ -124,6 +228,8 @@ class GameService:
             "energyLimitLevel": int(data.get("energy_limit_level", 1)),
             "rechargeSpeedLevel": recharge_level,
             "level": current_level,
+            "tapBotLevel": int(data.get("tap_bot_level", 0)),
+            "stateVersion": GameService.state_version(data),
             "processed_taps": actual_taps,
             # Include passive fields in response to match schema if needed, 
             # or frontend can use cached values
@@ -137,7 +243,7 @@ class GameService:
         # If you add mining cards, create a separate method or expand this one.
         
         user_key = GameService.get_user_key(user_id)
-        data = await redis_client.hgetall(user_key)
+        data = await GameService.load_user(user_id)
         if not data: raise HTTPException(404, "User not found")
         
         field_map = {
@@ -164,15 +270,16 @@ class GameService:
         new_points = points - cost
         
         pipe = redis_client.pipeline()
-        pipe.hset(user_key, "points", new_points)
+        PointsService.debit(pipe, user_id, cost, "upgrade", ref=upgrade_type, balance=new_points)
         pipe.hset(user_key, db_field, new_level)
+        pipe.hincrby(user_key, "state_ver", 1)
         
         if upgrade_type == "energy_limit":
             new_max = 1000 + ((new_level - 1) * 500)
             pipe.hset(user_key, "max_energy", new_max)
             
 
-        pipe.sadd("users_to_sync", user_id)
+        track_user_write(pipe, user_id)
         await pipe.execute()
         
         updated_data = await redis_client.hgetall(user_key)
@@ -195,45 +302,37 @@ class GameService:
     @staticmethod
     async def sync_passive_income(user_id: int):
         user_key = GameService.get_user_key(user_id)
-        data = await redis_client.hgetall(user_key)
+        data = await GameService.load_user(user_id)
         
         if not data:
             raise HTTPException(status_code=404, detail="User not found")
 
         current_time = int(time.time())
-        last_passive_sync = int(data.get("last_passive_sync", current_time))
         profit_per_hour = int(data.get("profit_per_hour", 0))
 
-        # 1. Calculate Time Difference
-        seconds_passed = current_time - last_passive_sync
-
-        # 2. Config: Max offline time (3 hours)
-        MAX_OFFLINE_SECONDS = 3 * 3600
-        eligible_seconds = min(seconds_passed, MAX_OFFLINE_SECONDS)
+        # 1. Calculate Earned Amount (capped at MAX_OFFLINE_SECONDS)
+        earned_coins, eligible_seconds = GameService.passive_earnings(data, current_time)
 
-        # 3. Calculate Earned Amount
-        # Avoid division by zero issues
-        earned_coins = 0
-        if profit_per_hour > 0 and eligible_seconds > 0:
-            earned_coins = int((profit_per_hour / 3600) * eligible_seconds)
+        new_total_points = int(data.get("points", 0)) + earned_coins
 
         # 4. Update DB
         pipe = redis_client.pipeline()
         if earned_coins > 0:
-            pipe.hincrby(user_key, "points", earned_coins)
+            PointsService.credit(
+                pipe, user_id, earned_coins, "passive_income", ref=eligible_seconds, balance=new_total_points
+            )
         
         # Always update the sync time, even if 0 earned, 
         # so the timer resets for the next window.
         pipe.hset(user_key, "last_passive_sync", current_time)
-        pipe.sadd("users_to_sync", user_id)
+        track_user_write(pipe, user_id, current_time)
         await pipe.execute()
 
-        new_total_points = int(data.get("points", 0)) + earned_coins
-
         return {
             "earned": earned_coins,
             "points": new_total_points,
-            "profit_per_hour": profit_per_hour
+            "profit_per_hour": profit_per_hour,
+            "stateVersion": GameService.state_version(data),
         }
 
     # ------------------------------------------------------------------
@@ -259,10 +358,13 @@ class GameService:
 
         # 3. Apply Purchase
         pipe = redis_client.pipeline()
-        pipe.hincrby(user_key, "points", -cost)
+        PointsService.debit(
+            pipe, user_id, cost, "mining_card", ref=profit_increase, balance=current_points - cost
+        )
         pipe.hincrby(user_key, "profit_per_hour", profit_increase)
+        pipe.hincrby(user_key, "state_ver", 1)
         
-        pipe.sadd("users_to_sync", user_id)
+        track_user_write(pipe, user_id)
         await pipe.execute()
 
         return await GameService.get_user_state(user_id)
@@ -0,0 +1,104 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from app.core.database import redis_client
+from app.services.base import RedisKeys
+
+# Pages are cached per worker process; ranks move constantly anyway
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "5"))
+# Only the top of the board is paged (and therefore cached)
+LEADERBOARD_MAX_DEPTH = 1000
+# Periodic boards outlive their period by this long, so the close job can freeze them
+LEADERBOARD_PERIOD_RETENTION = int(os.getenv("LEADERBOARD_PERIOD_RETENTION", str(3 * 24 * 3600)))
+
+PERIODS = ("daily", "weekly")
+
+
+class LeaderboardService:
+    _page_cache: Dict[tuple, tuple] = {}
+
+    @staticmethod
+    def period_bounds(kind: str, at: datetime) -> tuple:
+        """(period id, start, end) of the UTC day / ISO week containing `at`."""
+        day = datetime(at.year, at.month, at.day, tzinfo=timezone.utc)
+        if kind == "daily":
+            return f"daily:{day:%Y-%m-%d}", day, day + timedelta(days=1)
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = start.isocalendar()
+        return f"weekly:{year}-W{week:02d}", start, start + timedelta(weeks=1)
+
+    @staticmethod
+    def current_period(kind: str) -> str:
+        return LeaderboardService.period_bounds(kind, datetime.now(timezone.utc))[0]
+
+    @staticmethod
+    def queue_period_credit(pipe, user_id: int | str, amount: int, now: float | None = None):
+        """Adds points *earned* to the current daily and weekly boards."""
+        at = datetime.fromtimestamp(now or time.time(), tz=timezone.utc)
+        for kind in PERIODS:
+            period, _, end = LeaderboardService.period_bounds(kind, at)
+            key = RedisKeys.leaderboard(period)
+            pipe.zincrby(key, amount, str(user_id))
+            pipe.expireat(key, int(end.timestamp()) + LEADERBOARD_PERIOD_RETENTION)
+
+    @staticmethod
+    async def get_page(offset: int, limit: int, period: str | None = None) -> Dict[str, Any]:
+        board = RedisKeys.leaderboard(period)
+        # By key name: the all-time board changes with the season
+        cache_key = (board, offset, limit)
+        now = time.monotonic()
+        cached = LeaderboardService._page_cache.get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrevrange(board, offset, offset + limit - 1, withscores=True)
+        pipe.zcard(board)
+        members, total = await pipe.execute()
+
+        names = []
+        if members:
+            pipe = redis_client.pipeline(transaction=False)
+            for user_id, _ in members:
+                pipe.hget(RedisKeys.user(user_id), "first_name")
+            names = await pipe.execute()
+
+        entries: List[Dict[str, Any]] = [
+            {
+                "rank": offset + i + 1,
+                "user_id": user_id,
+                "first_name": name or "Player",
+                "points": int(score),
+            }
+            for i, ((user_id, score), name) in enumerate(zip(members, names))
+        ]
+        page = {"entries": entries, "total": total}
+        cache = LeaderboardService._page_cache
+        if len(cache) > 256:
+            for key in [k for k, (expires, _) in cache.items() if expires <= now]:
+                del cache[key]
+        cache[cache_key] = (now + LEADERBOARD_CACHE_TTL, page)
+        return page
+
+    @staticmethod
+    async def get_rank(user_id: int | str, period: str | None = None) -> Dict[str, Any] | None:
+        """1-based rank of the user (O(log N) ZREVRANK), or None if they have no score yet."""
+        board = RedisKeys.leaderboard(period)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrevrank(board, str(user_id))
+        pipe.zscore(board, str(user_id))
+        rank, score = await pipe.execute()
+        if rank is None:
+            return None
+        return {"rank": rank + 1, "points": int(score)}
+
+    @staticmethod
+    async def get_leaderboard(
+        offset: int, limit: int, user_id: int | None = None, kind: str = "all"
+    ) -> Dict[str, Any]:
+        period = LeaderboardService.current_period(kind) if kind in PERIODS else None
+        page = await LeaderboardService.get_page(offset, limit, period)
+        me = await LeaderboardService.get_rank(user_id, period) if user_id is not None else None
+        return {**page, "me": me, "period": period or "all"}
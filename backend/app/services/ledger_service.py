@@ -0,0 +1,39 @@
+import time
+
+from app.services.base import RedisKeys
+
+# Stored as SMALLINT in points_ledger; never renumber
+LEDGER_REASONS = {
+    "opening_balance": 0,
+    "tap": 1,
+    "passive_income": 2,
+    "task_reward": 3,
+    "daily_reward": 4,
+    "referral_reward": 5,
+    "referral_welcome": 6,
+    "upgrade": 7,
+    "mining_card": 8,
+    "season_reset": 9,
+}
+
+_UNSAFE = str.maketrans("", "", "\t\n\r\\")
+
+
+class LedgerService:
+    """
+    Append-only record of every balance change.
+
+    Entries are queued on the same pipeline as the HINCRBY they describe, as
+    one line in Postgres COPY text format, so the ledger writer can stream a
+    buffer into the table without parsing it.
+    """
+
+    @staticmethod
+    def format_entry(user_id: int | str, delta: int, reason: str, ref=None, now: int | None = None) -> str:
+        ref = "\\N" if ref is None else str(ref).translate(_UNSAFE)
+        return f"{int(user_id)}\t{int(delta)}\t{LEDGER_REASONS[reason]}\t{ref}\t{now or int(time.time())}"
+
+    @staticmethod
+    def queue_entry(pipe, user_id: int | str, delta: int, reason: str, ref=None):
+        shard = RedisKeys.ledger_shard(user_id)
+        pipe.rpush(RedisKeys.ledger_buffer(shard), LedgerService.format_entry(user_id, delta, reason, ref))
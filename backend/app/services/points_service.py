@@ -0,0 +1,62 @@
+from app.services.base import RedisKeys, BALANCE_EVENTS_CHANNEL
+from app.services.leaderboard_service import LeaderboardService
+from app.services.ledger_service import LedgerService
+from app.services.stats_service import StatsService
+
+
+class PointsService:
+    """
+    Every change to a user's points goes through here, queued on the caller's
+    pipeline, so derived structures (the leaderboard, the ledger) are updated
+    in the same round trip as the balance itself.
+
+    Only credits count towards the daily / weekly boards, which rank points
+    earned in the period rather than balances, and towards the global
+    "points minted" total.
+
+    `reason` is a key of LEDGER_REASONS and `ref` identifies what caused the
+    change (a task id, the other side of a referral, ...).
+    """
+
+    @staticmethod
+    def _queue_board(pipe, user_id: int | str, delta: int, balance: int | None):
+        board = RedisKeys.leaderboard()
+        if balance is not None:
+            # Only for users not on the board yet, at their balance before this change
+            pipe.zadd(board, {str(user_id): balance - delta}, nx=True)
+        if delta:
+            pipe.zincrby(board, delta, str(user_id))
+
+    @staticmethod
+    def credit(
+        pipe,
+        user_id: int | str,
+        amount: int,
+        reason: str,
+        ref=None,
+        balance: int | None = None,
+        notify: bool = False,
+    ):
+        """
+        Adds `amount` points. Pass `balance` (the new total) when the caller
+        already knows it, to seed users that were created before the
+        leaderboard existed. The board itself only moves by increments: a
+        balance read before a concurrent credit would be stale.
+        `notify` pushes the new balance to the user's open SSE connections.
+        """
+        pipe.hincrby(RedisKeys.user(user_id), "points", amount)
+        PointsService._queue_board(pipe, user_id, amount, balance)
+        if amount:
+            LedgerService.queue_entry(pipe, user_id, amount, reason, ref)
+        if amount > 0:
+            LeaderboardService.queue_period_credit(pipe, user_id, amount)
+            StatsService.queue_increment(pipe, user_id, "points_minted", amount)
+        if notify:
+            pipe.publish(BALANCE_EVENTS_CHANNEL, str(user_id))
+
+    @staticmethod
+    def debit(pipe, user_id: int | str, amount: int, reason: str, ref=None, balance: int | None = None):
+        pipe.hincrby(RedisKeys.user(user_id), "points", -amount)
+        PointsService._queue_board(pipe, user_id, -amount, balance)
+        if amount:
+            LedgerService.queue_entry(pipe, user_id, -amount, reason, ref)
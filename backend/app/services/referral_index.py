@@ -0,0 +1,66 @@
+import logging
+from typing import Optional
+
+from app.core.config import REFERRAL_INDEX_BUCKETS
+from app.core.database import redis_client
+from app.services.base import LEGACY_REFERRAL_CODES_KEY, LEGACY_REFERRAL_LINKS_KEY, RedisKeys
+
+logger = logging.getLogger("referral_index")
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+class ReferralIndex:
+    """
+    The global referral indexes: code -> user id and user id -> code.
+
+    Each is spread over REFERRAL_INDEX_BUCKETS small hashes instead of one
+    hash with a field per user. Small hashes keep Redis' listpack encoding,
+    roughly a quarter of the memory of a hashtable entry, and any one of
+    them is cheap to delete or migrate. Codes are bucketed by CRC32. User ids
+    are bucketed by their low part (id % buckets) and stored under the high
+    part (id // buckets), a short integer field.
+
+    Lookups also check the single hashes used before, until the sync worker
+    has moved them into the buckets (`migrate_legacy`).
+    """
+
+    @staticmethod
+    def queue_add(pipe, code: str, user_id: int | str):
+        pipe.hset(RedisKeys.referral_code_bucket(code), code, user_id)
+        pipe.hset(RedisKeys.referral_link_bucket(user_id), int(user_id) // REFERRAL_INDEX_BUCKETS, code)
+
+    @staticmethod
+    async def lookup(code: str) -> Optional[str]:
+        """User id the referral code belongs to."""
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(RedisKeys.referral_code_bucket(code), code)
+        pipe.hget(LEGACY_REFERRAL_CODES_KEY, code)
+        bucketed, legacy = await pipe.execute()
+        return bucketed or legacy
+
+    @staticmethod
+    async def migrate_legacy(client, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+        """
+        Moves the single-hash indexes into the buckets a batch at a time
+        (HSCAN, then HDEL of the moved fields), so Redis never blocks on
+        one huge key. Safe to interrupt and run again.
+        """
+        moved = 0
+        for legacy_key in (LEGACY_REFERRAL_CODES_KEY, LEGACY_REFERRAL_LINKS_KEY):
+            while True:
+                _, fields = await client.hscan(legacy_key, 0, count=batch_size)
+                if not fields:
+                    break
+                pipe = client.pipeline(transaction=False)
+                for field, value in fields.items():
+                    if legacy_key == LEGACY_REFERRAL_CODES_KEY:
+                        ReferralIndex.queue_add(pipe, field, value)
+                    else:
+                        ReferralIndex.queue_add(pipe, value, field)
+                pipe.hdel(legacy_key, *fields)
+                await pipe.execute()
+                moved += len(fields)
+        if moved:
+            logger.info(f"Moved {moved} referral index entries into {REFERRAL_INDEX_BUCKETS} buckets")
+        return moved
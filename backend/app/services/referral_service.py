@@ -8,6 +8,13 @@ from typing import Any, Dict, List, Optional
 from fastapi import HTTPException
 
 from app.core.database import redis_client
+from app.core.replicas import replica_set
+from app.schemas import UserData
+from app.services.base import RedisKeys, track_user_write
+from app.services.game_service import GameService
+from app.services.points_service import PointsService
+from app.services.referral_index import ReferralIndex
+from app.services.tiering_service import TieringService
 
 BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "YourBotName")
 
@@ -17,24 +24,42 @@ class ReferralService:
     @staticmethod
     def get_keys(user_id: str):
         return {
-            "referral_stats": f"user:{user_id}:referral",
-            "referrals_list": f"user:{user_id}:referrals",
-            "code_to_id": "referral_code_to_user",
-            "id_to_code": "referral_links",
-            "sync_set": "users_to_sync",
+            "referral_stats": RedisKeys.user_referral(user_id),
+            "referrals_list": RedisKeys.user_referrals(user_id),
         }
 
     @staticmethod
-    async def get_referral_info(user_id: str) -> Dict[str, Any]:
+    def referral_link(code: str) -> str:
+        return f"https://t.me/{BOT_USERNAME}?start={code}"
+
+    @staticmethod
+    async def read_referral(client, user_id: str) -> list:
+        """[referral summary, friends] of the user, read from `client`."""
         keys = ReferralService.get_keys(user_id)
-        stats = await redis_client.hgetall(keys["referral_stats"])
+        pipe = client.pipeline(transaction=False)
+        pipe.hgetall(keys["referral_stats"])
+        pipe.hgetall(keys["referrals_list"])
+        return await pipe.execute()
 
-        # Auto-initialize if user doesn't exist (safety)
+    @staticmethod
+    async def get_referral_info(user_id: str) -> Dict[str, Any]:
+        stats, friends_raw = (
+            await replica_set.read(user_id, lambda client: ReferralService.read_referral(client, user_id))
+            or ({}, {})
+        )
         if not stats:
-            # Note: In production, fetch actual name from DB/Telegram context
-            stats = await ReferralService.initialize_referral(user_id, "User")
+            # Not on the replica (or none in use): the primary, creating what is missing
+            stats, friends_raw = await ReferralService.read_referral(redis_client, user_id)
+
+            # The user may have been evicted to Postgres
+            if not stats and await TieringService.rehydrate(user_id):
+                stats, friends_raw = await ReferralService.read_referral(redis_client, user_id)
+
+            # Auto-initialize if user doesn't exist (safety)
+            if not stats:
+                # Note: In production, fetch actual name from DB/Telegram context
+                stats = await ReferralService.initialize_referral(user_id, "User")
 
-        friends_raw = await redis_client.hgetall(keys["referrals_list"])
         friends_list = []
         for f_json in friends_raw.values():
             friends_list.append(json.loads(f_json))
@@ -47,7 +72,7 @@ class ReferralService:
         return {
             "referral_info": {
                 "referral_code": code,
-                "link": f"https://t.me/{BOT_USERNAME}?start={code}",
+                "link": ReferralService.referral_link(code),
             },
             "friends": friends_list,
             "total_earned": int(stats.get("total_earned", 0)),
@@ -61,8 +86,7 @@ class ReferralService:
         while True:
             code = "".join(random.choices(characters, k=length))
             # Check if code exists
-            exists = await redis_client.hexists("referral_code_to_user", code)
-            if not exists:
+            if not await ReferralIndex.lookup(code):
                 return code
 
     @staticmethod
@@ -91,9 +115,8 @@ class ReferralService:
 
         pipe = redis_client.pipeline()
         pipe.hset(keys["referral_stats"], mapping=referral_data)
-        pipe.hset(keys["code_to_id"], referral_code, user_id)
-        pipe.hset(keys["id_to_code"], user_id, referral_code)
-        pipe.sadd(keys["sync_set"], user_id)
+        ReferralIndex.queue_add(pipe, referral_code, user_id)
+        track_user_write(pipe, user_id)
         await pipe.execute()
 
         return referral_data
@@ -109,15 +132,27 @@ class ReferralService:
         keys_new_user = ReferralService.get_keys(new_user_id)
 
         # 1. Validate Referrer
-        referrer_user_id = await redis_client.hget(
-            "referral_code_to_user", referrer_code
-        )
+        referrer_user_id = await ReferralIndex.lookup(referrer_code)
         if not referrer_user_id:
             raise HTTPException(400, "Invalid referral code")
 
         if str(referrer_user_id) == str(new_user_id):
             raise HTTPException(400, "You cannot refer yourself")
 
+        # Both sides get written below; reload them first if they were evicted,
+        # and create this season's profile of one who last played an earlier
+        # season, otherwise the increments would create partial hashes.
+        await TieringService.ensure_resident(referrer_user_id)
+        referrer_name = await redis_client.hget(
+            RedisKeys.user_referral(referrer_user_id), "first_name"
+        )
+        await GameService.create_user_if_not_exists(
+            UserData(id=int(referrer_user_id), first_name=referrer_name or "")
+        )
+        await GameService.create_user_if_not_exists(
+            UserData(id=int(new_user_id), first_name=first_name or "", last_name=last_name, username=username)
+        )
+
         # 2. Check if new user is already referred to prevent double claiming
         already_referred = await redis_client.hget(
             keys_new_user["referral_stats"], "referred_by"
@@ -150,14 +185,18 @@ class ReferralService:
         pipe.hset(
             referrer_keys["referrals_list"], new_user_id, json.dumps(referral_log)
         )
-        pipe.hincrby(f"user:{referrer_user_id}", "points", reward_amount)
+        PointsService.credit(
+            pipe, referrer_user_id, reward_amount, "referral_reward", ref=new_user_id, notify=True
+        )
 
         # Update New User (Set who referred them)
         pipe.hset(keys_new_user["referral_stats"], "referred_by", referrer_code)
-        pipe.hincrby(f"user:{new_user_id}", "points", reward_amount)
+        PointsService.credit(
+            pipe, new_user_id, reward_amount, "referral_welcome", ref=referrer_user_id, notify=True
+        )
 
         # Trigger Sync
-        pipe.sadd("users_to_sync", referrer_user_id)
-        pipe.sadd("users_to_sync", new_user_id)
+        track_user_write(pipe, referrer_user_id)
+        track_user_write(pipe, new_user_id)
 
         await pipe.execute()
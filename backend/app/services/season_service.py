@@ -0,0 +1,43 @@
+import logging
+import os
+import time
+
+from app.core.database import redis_client
+from app.services.base import CURRENT_SEASON_KEY, current_season, set_current_season
+
+logger = logging.getLogger("season")
+
+# How stale a process' idea of the current season may get
+SEASON_REFRESH_INTERVAL = float(os.getenv("SEASON_REFRESH_INTERVAL", "2"))
+
+
+class SeasonService:
+    """
+    Seasons are a number in Redis that every season-scoped key embeds (see
+    RedisKeys). Starting a season is a single INCR: every process picks the
+    new number up within SEASON_REFRESH_INTERVAL and from then on reads and
+    writes fresh, empty keys. The previous season's keys are left untouched
+    for the archiver (app/core/season_worker.py) to move to Postgres.
+    """
+
+    _checked_at = 0.0
+
+    @staticmethod
+    async def refresh(client=None, force: bool = False) -> int:
+        now = time.monotonic()
+        if force or now - SeasonService._checked_at >= SEASON_REFRESH_INTERVAL:
+            value = await (client or redis_client).get(CURRENT_SEASON_KEY)
+            SeasonService._checked_at = now
+            season = int(value or 0)
+            if season != current_season():
+                logger.info(f"Now in season {season}")
+                set_current_season(season)
+        return current_season()
+
+    @staticmethod
+    async def start_new_season(client=None) -> int:
+        season = await (client or redis_client).incr(CURRENT_SEASON_KEY)
+        await (client or redis_client).set(f"season:started:{season}", int(time.time()))
+        set_current_season(season)
+        SeasonService._checked_at = time.monotonic()
+        return season
@@ -0,0 +1,60 @@
+import json
+import os
+import time
+from typing import Any, Dict
+
+from app.core.database import redis_client
+
+# Writes to the global counters are spread over this many hashes (by user id)
+STATS_COUNTER_SHARDS = int(os.getenv("STATS_COUNTER_SHARDS", "32"))
+# The summary is re-aggregated from the shards at most this often
+STATS_SUMMARY_TTL = int(os.getenv("STATS_SUMMARY_TTL", "10"))
+
+STATS_SUMMARY_KEY = "stats:global:summary"
+STATS_FIELDS = ("taps", "points_minted", "players")
+
+
+class StatsService:
+    """
+    Game-wide totals (taps, points minted, players).
+
+    A single counter key bumped on every tap would put the whole tap load on
+    one Redis slot, so each user increments a shard chosen by their id, in the
+    pipeline the request already sends. Readers get a summary that is summed
+    over the shards at most once per STATS_SUMMARY_TTL.
+    """
+
+    @staticmethod
+    def shard_key(shard: int) -> str:
+        return f"stats:global:{shard}"
+
+    @staticmethod
+    def queue_increment(pipe, user_id: int | str, field: str, amount: int = 1):
+        if amount:
+            shard = int(user_id) % STATS_COUNTER_SHARDS
+            pipe.hincrby(StatsService.shard_key(shard), field, amount)
+
+    @staticmethod
+    async def aggregate() -> Dict[str, Any]:
+        pipe = redis_client.pipeline(transaction=False)
+        for shard in range(STATS_COUNTER_SHARDS):
+            pipe.hgetall(StatsService.shard_key(shard))
+        shards = await pipe.execute()
+
+        summary: Dict[str, Any] = {field: 0 for field in STATS_FIELDS}
+        for counters in shards:
+            for field, value in counters.items():
+                if field in summary:
+                    summary[field] += int(value)
+        summary["updated_at"] = int(time.time())
+
+        await redis_client.set(STATS_SUMMARY_KEY, json.dumps(summary), ex=STATS_SUMMARY_TTL)
+        return summary
+
+    @staticmethod
+    async def get_summary() -> Dict[str, Any]:
+        cached = await redis_client.get(STATS_SUMMARY_KEY)
+        if cached:
+            return json.loads(cached)
+        # Concurrent misses may both aggregate; the result is the same
+        return await StatsService.aggregate()
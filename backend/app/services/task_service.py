@@ -4,17 +4,21 @@ import random
 from datetime import datetime, timezone
 from fastapi import HTTPException
 from app.core.database import redis_client
+from app.core.replicas import replica_set
 from app.core.config import ONE_TIME_TASKS, DAILY_TASK_POOL, DAILY_REWARDS_DB
+from app.services.activity_service import ActivityService
+from app.services.base import RedisKeys, track_user_write
+from app.services.points_service import PointsService
 
 class TaskService:
     
     @staticmethod
     def get_keys(user_id: str):
         return {
-            "user": f"user:{user_id}",
-            "tasks": f"user:{user_id}:tasks",
-            "rewards": f"user:{user_id}:daily_rewards",
-            "stats": f"user:{user_id}:stats"
+            "user": RedisKeys.user(user_id),
+            "tasks": RedisKeys.user_tasks(user_id),
+            "rewards": RedisKeys.user_daily_rewards(user_id),
+            "stats": RedisKeys.user_stats(user_id)
         }
 
     @staticmethod
@@ -23,53 +27,93 @@ class TaskService:
         return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
     @staticmethod
-    async def initialize_tasks(user_id: str):
-        keys = TaskService.get_keys(user_id)
-        today = TaskService.get_today_iso()
-
-        # 1. Initialize ONE-TIME Tasks (If not exists)
-        # We check specific IDs to avoid overwriting completed status
+    def missing_tasks(existing: dict, today: str) -> dict:
+        """Task hash fields (id -> JSON) to add to a user's tasks, given the ones they have."""
+        missing = {}
+        # One-time tasks: only add absent ones, to avoid overwriting completed status
         for task in ONE_TIME_TASKS:
-            if not await redis_client.hexists(keys["tasks"], task["id"]):
-                await redis_client.hset(keys["tasks"], task["id"], json.dumps(task))
-        
-        # 2. Initialize DAILY Tasks (Rotated Daily)
-        # Use the date string as a seed so everyone gets the same "Random" tasks today
-        random.seed(today) 
-        todays_selection = random.sample(DAILY_TASK_POOL, k=3) # Pick 3 tasks
-        
-        for task in todays_selection:
+            if task["id"] not in existing:
+                missing[task["id"]] = json.dumps(task)
+
+        # Daily tasks (rotated daily): the date string is the seed, so everyone
+        # gets the same "random" tasks today
+        for task in random.Random(today).sample(DAILY_TASK_POOL, k=3):
             # Create a unique ID for today: "daily_watch_1:2024-10-25"
             daily_id = f"{task['id']}:{today}"
-            
-            # If this specific daily instance doesn't exist, create it
-            if not await redis_client.hexists(keys["tasks"], daily_id):
+            if daily_id not in existing:
                 # Copy task to not mutate config
                 new_task = task.copy()
-                new_task["id"] = daily_id 
-                await redis_client.hset(keys["tasks"], daily_id, json.dumps(new_task))
-
-        # 3. Init Daily Rewards (Streak)
-        if not await redis_client.exists(keys["rewards"]):
-            for reward in DAILY_REWARDS_DB:
-                await redis_client.hset(keys["rewards"], str(reward["day"]), json.dumps(reward))
-                
-        # 4. Init Stats
-        if not await redis_client.exists(keys["stats"]):
-            await redis_client.hset(keys["stats"], mapping={"current_streak": 0, "last_check_in": "null"})
+                new_task["id"] = daily_id
+                missing[daily_id] = json.dumps(new_task)
+        return missing
 
     @staticmethod
-    async def get_overview(user_id: str):
-        await TaskService.initialize_tasks(user_id)
+    def queue_initialization(pipe, user_id: str, tasks, has_rewards: bool, has_stats: bool) -> dict:
+        """
+        Queues whatever `initialize_tasks` would create, given the task ids the
+        user already has. Returns the created hash fields, by key name.
+        """
+        keys = TaskService.get_keys(user_id)
+        created = {"tasks": TaskService.missing_tasks(tasks, TaskService.get_today_iso())}
+        if not has_rewards:
+            created["rewards"] = {str(reward["day"]): json.dumps(reward) for reward in DAILY_REWARDS_DB}
+        if not has_stats:
+            created["stats"] = {"current_streak": 0, "last_check_in": "null"}
+        for name, fields in created.items():
+            if fields:
+                pipe.hset(keys[name], mapping=fields)
+        return created
+
+    @staticmethod
+    async def initialize_tasks(user_id: str):
         keys = TaskService.get_keys(user_id)
+
+        # 0. Bring evicted users back before we (re)create anything for them,
+        # and count the visit towards today's active users
+        await ActivityService.record_request(user_id)
+
+        # 1. Read what exists, 2. create one-time / today's tasks, rewards and stats that don't
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hkeys(keys["tasks"])
+        pipe.exists(keys["rewards"])
+        pipe.exists(keys["stats"])
+        task_ids, has_rewards, has_stats = await pipe.execute()
+
+        pipe = redis_client.pipeline()
+        TaskService.queue_initialization(pipe, user_id, set(task_ids), has_rewards, has_stats)
+        if len(pipe):
+            await pipe.execute()
+
+    @staticmethod
+    async def read_overview(client, user_id: str) -> list:
+        """[tasks, rewards, stats, points, uidx] of the user, read from `client`."""
+        keys = TaskService.get_keys(user_id)
+        pipe = client.pipeline(transaction=False)
+        pipe.hgetall(keys["tasks"])
+        pipe.hgetall(keys["rewards"])
+        pipe.hgetall(keys["stats"])
+        pipe.hmget(keys["user"], "points", "uidx")
+        tasks_raw, rewards_raw, stats, (user_points, uidx) = await pipe.execute()
+        return [tasks_raw, rewards_raw, stats, user_points, uidx]
+
+    @staticmethod
+    async def get_overview(user_id: str):
         today = TaskService.get_today_iso()
-        
-        # Fetch all tasks from Redis
-        tasks_raw = await redis_client.hgetall(keys["tasks"])
-        rewards_raw = await redis_client.hgetall(keys["rewards"])
-        stats = await redis_client.hgetall(keys["stats"])
-        user_points = await redis_client.hget(keys["user"], "points")
-        
+
+        # A replica will do when there is nothing to initialize
+        replica = await replica_set.read(user_id, lambda client: TaskService.read_overview(client, user_id))
+        if replica is not None:
+            tasks_raw, rewards_raw, stats, user_points, uidx = replica
+            if uidx is not None and rewards_raw and stats and not TaskService.missing_tasks(tasks_raw, today):
+                await ActivityService.mark_active(uidx, user_id)
+                return TaskService.build_overview(tasks_raw, rewards_raw, stats, user_points, today)
+
+        await TaskService.initialize_tasks(user_id)
+        tasks_raw, rewards_raw, stats, user_points, _ = await TaskService.read_overview(redis_client, user_id)
+        return TaskService.build_overview(tasks_raw, rewards_raw, stats, user_points, today)
+
+    @staticmethod
+    def build_overview(tasks_raw: dict, rewards_raw: dict, stats: dict, user_points, today: str) -> dict:
         # Filter Tasks
         # We only want to show:
         # 1. One-time tasks (always)
@@ -114,9 +158,10 @@ class TaskService:
         if task["status"] == "claimed": raise HTTPException(400, "Task already completed")
         
         task["status"] = "completed"
-        await redis_client.hset(keys["tasks"], task_id, json.dumps(task))
-
-        redis_client.sadd("users_to_sync", user_id) 
+        pipe = redis_client.pipeline()
+        pipe.hset(keys["tasks"], task_id, json.dumps(task))
+        track_user_write(pipe, user_id)
+        await pipe.execute()
         return task
 
     @staticmethod
@@ -131,10 +176,11 @@ class TaskService:
         if task["status"] != "completed": raise HTTPException(400, "Task not completed yet")
         
         task["status"] = "claimed"
-        await redis_client.hset(keys["tasks"], task_id, json.dumps(task))
-        
-        new_points = await redis_client.hincrby(keys["user"], "points", task["reward"])
-        redis_client.sadd("users_to_sync", user_id) 
+        pipe = redis_client.pipeline()
+        pipe.hset(keys["tasks"], task_id, json.dumps(task))
+        PointsService.credit(pipe, user_id, task["reward"], "task_reward", ref=task_id, notify=True)
+        track_user_write(pipe, user_id)
+        _, new_points, *_ = await pipe.execute()
         return task, new_points
 
     @staticmethod
@@ -161,13 +207,14 @@ class TaskService:
         if reward["is_claimed"]: raise HTTPException(400, "Reward already claimed")
         
         reward["is_claimed"] = True
-        await redis_client.hset(keys["rewards"], str(day), json.dumps(reward))
-        
-        new_points = await redis_client.hincrby(keys["user"], "points", reward["reward"])
-        await redis_client.hset(keys["stats"], mapping={
+        now = int(time.time())
+        pipe = redis_client.pipeline()
+        pipe.hset(keys["rewards"], str(day), json.dumps(reward))
+        PointsService.credit(pipe, user_id, reward["reward"], "daily_reward", ref=day, notify=True)
+        pipe.hset(keys["stats"], mapping={
             "current_streak": day,
-            "last_check_in": str(int(time.time()))
+            "last_check_in": str(now)
         })
-        
-        redis_client.sadd("users_to_sync", user_id) 
+        track_user_write(pipe, user_id, now)
+        _, new_points, *_ = await pipe.execute()
         return reward, new_points
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+
+from redis.exceptions import WatchError
+
+from app.core import metrics
+from app.core.database import redis_client, get_pg_pool
+from app.services.base import RedisKeys, LAST_SEEN_KEY, SEASON_FAMILIES, current_season, queue_user_index
+
+logger = logging.getLogger("tiering")
+
+RESIDENT_USERS = metrics.gauge(
+    "tiering_resident_users", "Users currently resident in Redis (size of the last-seen set)"
+)
+REHYDRATIONS = metrics.counter(
+    "tiering_rehydrations_total", "Rehydration attempts from Postgres, by result"
+)
+REHYDRATION_SECONDS = metrics.histogram(
+    "tiering_rehydration_seconds", "Latency of reloading one user from Postgres into Redis"
+)
+EVICTIONS = metrics.counter(
+    "tiering_evictions_total", "Idle users considered for eviction, by outcome"
+)
+
+
+class TieringService:
+    """
+    Keeps only recently active users in Redis.
+
+    Idle users whose Redis state is identical to the `raw_state` snapshot in
+    Postgres are evicted, and are transparently reloaded from that snapshot
+    the next time any service touches them.
+    """
+
+    # ------------------------------------------------------------------
+    # Snapshot helpers (shared with the sync worker and bulk restore)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def queue_snapshot_reads(pipe, user_id: int | str, season: int | None = None):
+        for key in RedisKeys.user_families(user_id, season).values():
+            pipe.hgetall(key)
+
+    @staticmethod
+    def build_snapshot(results: list, season: int | None = None) -> dict:
+        """Turns the results of `queue_snapshot_reads` into a raw_state dict."""
+        snapshot = dict(zip(RedisKeys.user_families(0).keys(), results))
+        snapshot["season"] = current_season() if season is None else season
+        return snapshot
+
+    @staticmethod
+    def queue_snapshot_restore(pipe, user_id: int | str, state: dict) -> bool:
+        """
+        Snapshots taken in an earlier season only restore the families that
+        carry over between seasons. Returns whether the profile was restored.
+        """
+        same_season = state.get("season", 0) == current_season()
+        for family, key in RedisKeys.user_families(user_id).items():
+            values = state.get(family)
+            if values and (same_season or family not in SEASON_FAMILIES):
+                pipe.hset(key, mapping=values)
+        return same_season and bool(state.get("profile"))
+
+    # ------------------------------------------------------------------
+    # Postgres access (blocking, run in a thread)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def load_raw_states(user_ids: list) -> dict:
+        pool = get_pg_pool()
+        if pool is None or not user_ids:
+            return {}
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT telegram_id, raw_state FROM users WHERE telegram_id = ANY(%s)",
+                    ([int(uid) for uid in user_ids],),
+                )
+                return {str(uid): state for uid, state in cur.fetchall() if state}
+        finally:
+            pool.putconn(conn)
+
+    # ------------------------------------------------------------------
+    # Rehydration
+    # ------------------------------------------------------------------
+    @staticmethod
+    async def rehydrate(user_id: int | str) -> bool:
+        """Reloads an evicted user from Postgres. Returns False if there is nothing to load."""
+        start = time.perf_counter()
+        states = await asyncio.to_thread(TieringService.load_raw_states, [user_id])
+        state = states.get(str(user_id))
+        if not state or not state.get("profile"):
+            REHYDRATIONS.inc(result="miss")
+            return False
+
+        user_key = RedisKeys.user(user_id)
+        async with redis_client.pipeline() as pipe:
+            try:
+                # Another request may have rehydrated (or written) meanwhile
+                await pipe.watch(user_key)
+                if await pipe.exists(user_key):
+                    return True
+                # Only the user's own keys: one slot with REDIS_HASH_TAGS
+                pipe.multi()
+                restored = TieringService.queue_snapshot_restore(pipe, user_id, state)
+                await pipe.execute()
+            except WatchError:
+                return True
+
+        if not restored:
+            # Left over from an earlier season: the user starts this one fresh,
+            # with the activity index they had (snapshots from before the index
+            # was kept outside the profile)
+            uidx = (state.get("profile") or {}).get("uidx")
+            if uidx:
+                pipe = redis_client.pipeline(transaction=False)
+                queue_user_index(pipe, user_id, uidx, nx=True)
+                await pipe.execute()
+            REHYDRATIONS.inc(result="previous_season")
+            return False
+
+        await redis_client.zadd(LAST_SEEN_KEY, {str(user_id): int(time.time())})
+        REHYDRATIONS.inc(result="hit")
+        REHYDRATION_SECONDS.observe(time.perf_counter() - start)
+        return True
+
+    @staticmethod
+    async def ensure_resident(user_id: int | str) -> bool:
+        if await redis_client.exists(RedisKeys.user(user_id)):
+            return True
+        return await TieringService.rehydrate(user_id)
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+    @staticmethod
+    async def evict_idle_users(
+        idle_seconds: int, batch_size: int = 500, offset: int = 0
+    ) -> tuple[int, int]:
+        """
+        Evicts one batch of idle users, starting `offset` entries into the idle
+        range (users skipped by earlier batches stay in the set).
+        Returns (examined, evicted).
+        """
+        cutoff = int(time.time()) - idle_seconds
+        candidates = await redis_client.zrangebyscore(
+            LAST_SEEN_KEY, "-inf", cutoff, start=offset, num=batch_size
+        )
+        if not candidates:
+            return 0, 0
+
+        persisted = await asyncio.to_thread(TieringService.load_raw_states, candidates)
+
+        evicted = 0
+        for uid in candidates:
+            outcome = await TieringService._evict_one(uid, cutoff, persisted.get(uid))
+            EVICTIONS.inc(result=outcome)
+            evicted += outcome == "evicted"
+
+        return len(candidates), evicted
+
+    @staticmethod
+    async def _evict_one(user_id: str, cutoff: int, persisted: dict | None) -> str:
+        keys = list(RedisKeys.user_families(user_id).values())
+        async with redis_client.pipeline() as pipe:
+            try:
+                # Any write to the user's keys after this point aborts the EXEC.
+                # The global sets are read outside the watched connection, which
+                # on a cluster may only touch the user's slot.
+                await pipe.watch(*keys)
+                score = await redis_client.zscore(LAST_SEEN_KEY, user_id)
+                if score is None or score > cutoff:
+                    return "active"
+                queue = RedisKeys.sync_queue(RedisKeys.sync_shard(user_id))
+                if await redis_client.zscore(queue, user_id) is not None:
+                    return "dirty"
+
+                current = TieringService.build_snapshot(
+                    [await pipe.hgetall(key) for key in keys]
+                )
+                if persisted is None:
+                    return "unsynced"
+                # Snapshots written before seasons existed are season 0
+                persisted = {"season": 0, **persisted}
+                if current["profile"] and current != persisted:
+                    return "unsynced"
+                # Without a profile this season the sync worker skips the user,
+                # so referral data written since their last sync only lives here
+                if any(
+                    values and values != persisted.get(family)
+                    for family, values in current.items() if family != "season"
+                ):
+                    return "unsynced"
+
+                pipe.multi()
+                pipe.delete(*keys)
+                await pipe.execute()
+            except WatchError:
+                return "raced"
+
+        await redis_client.zrem(LAST_SEEN_KEY, user_id)
+        # A request that rehydrated the user since the EXEC must stay tracked
+        if await redis_client.exists(RedisKeys.user(user_id)):
+            await redis_client.zadd(LAST_SEEN_KEY, {user_id: int(time.time())}, nx=True)
+        return "evicted"
+
+    @staticmethod
+    async def backfill_last_seen(scan_count: int = 1000) -> int:
+        """Seeds the last-seen set for users created before it existed."""
+        added = 0
+        async for key in redis_client.scan_iter(match=RedisKeys.user_scan_pattern(), count=scan_count):
+            user_id = RedisKeys.profile_user_id(key)
+            if user_id is None:
+                continue
+            last_sync = await redis_client.hget(key, "last_sync_time")
+            added += await redis_client.zadd(
+                LAST_SEEN_KEY, {user_id: int(last_sync or 0)}, nx=True
+            )
+        return added
+
+    @staticmethod
+    async def record_resident_size() -> int:
+        size = await redis_client.zcard(LAST_SEEN_KEY)
+        RESIDENT_USERS.set(size)
+        return size
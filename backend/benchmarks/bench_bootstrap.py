@@ -0,0 +1,89 @@
+"""
+App-open latency: the separate calls the Mini App used to make on open
+(/auth, /tasks, /referral, /sync-passive) against the single /bootstrap.
+
+Requests go through the ASGI app in-process, so the numbers are server time
+plus Redis round trips. --rtt-ms adds a delay to every round trip to stand
+in for the network between the API and Redis. Needs a disposable Redis:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_bootstrap --users 500 --rtt-ms 0.5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from httpx import ASGITransport, AsyncClient
+from redis.asyncio.connection import Connection
+
+from main import app
+
+ROUND_TRIPS = 0
+
+
+def instrument(rtt: float):
+    """Counts commands / pipelines sent to Redis, delaying each by `rtt` seconds."""
+    send = Connection.send_packed_command
+
+    async def send_packed_command(self, command, check_health=True):
+        global ROUND_TRIPS
+        ROUND_TRIPS += 1
+        if rtt:
+            await asyncio.sleep(rtt)
+        return await send(self, command, check_health)
+
+    Connection.send_packed_command = send_packed_command
+
+
+async def separate_calls(client, user: dict):
+    await client.post("/api/auth", json=user)
+    await client.get(f"/api/tasks/{user['id']}")
+    await client.get("/api/referral/", params={"user_id": user["id"]})
+    await client.post("/api/sync-passive", json={"user_id": user["id"]})
+
+
+async def bootstrap_call(client, user: dict):
+    await client.post("/api/bootstrap", json=user)
+
+
+async def measure(client, flow, users: list) -> tuple[list, float]:
+    global ROUND_TRIPS
+    ROUND_TRIPS = 0
+    latencies = []
+    for user in users:
+        started = time.perf_counter()
+        await flow(client, user)
+        latencies.append(time.perf_counter() - started)
+    return latencies, ROUND_TRIPS / len(users)
+
+
+def report(name: str, latencies: list, trips: float):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<20} {trips:>12.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    instrument(args.rtt_ms / 1000)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'flow':<20} {'round trips':>12} {'p50 ms':>10} {'p99 ms':>10}")
+        for opening in ("first open", "returning"):
+            # Separate id ranges so both flows see the same kind of user
+            for offset, name, flow in ((0, "separate calls", separate_calls), (1, "bootstrap", bootstrap_call)):
+                users = [
+                    {"id": 950_000_000 + offset * 10_000_000 + i, "first_name": "Bench"}
+                    for i in range(args.users)
+                ]
+                latencies, trips = await measure(client, flow, users)
+                report(f"{name} ({opening})", latencies, trips)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
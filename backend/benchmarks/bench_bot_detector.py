@@ -0,0 +1,55 @@
+"""
+CPU time the bot detector adds to each /tap, and the bytes its statistics
+take in a profile hash.
+
+No Redis needed: the statistics travel with the profile process_tap already
+reads and writes, so the only added cost is BotDetector.observe / throttle
+and the extra field bytes in the HSET.
+
+    python -m benchmarks.bench_bot_detector --requests 200000
+"""
+import argparse
+import random
+import time
+
+from app.services.bot_detector import BotDetector
+
+
+def stream(requests: int, regular: bool) -> list:
+    """(taps, time) of tap requests two seconds apart, as the client sends them."""
+    rng = random.Random(requests)
+    now = time.time()
+    events = []
+    for _ in range(requests):
+        now += 2.0 if regular else rng.uniform(1.99, 2.05)
+        events.append((20 if regular else rng.randint(3, 18), now))
+    return events
+
+
+def time_observe(events: list) -> tuple[float, int]:
+    """µs per request, and bytes of the bot_* fields at the end."""
+    data = {}
+    started = time.perf_counter()
+    for taps, now in events:
+        BotDetector.throttle(data, taps, now)
+        fields, _ = BotDetector.observe(data, taps, now)
+        # As Redis returns them
+        data.update({k: str(v) for k, v in fields.items()})
+    per_request = (time.perf_counter() - started) / len(events)
+    size = sum(len(k) + len(str(v)) for k, v in data.items())
+    return per_request * 1e6, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'stream':<10} {'us/request':>11} {'profile bytes':>14}")
+    for name, regular in (("human", False), ("clicker", True)):
+        per_request, size = time_observe(stream(args.requests, regular))
+        print(f"{name:<10} {per_request:>11.2f} {size:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Requests/sec of the hot endpoints with FastAPI's validated responses and
+with FAST_JSON_RESPONSES (app/core/responses.py).
+
+Requests go through the ASGI app in-process, one at a time. The first table
+is the real endpoints, Redis round trips included. The second times only
+what the switch changes, on each endpoint's captured service output:
+FastAPI's response validation and encoding against projection and orjson. Needs a disposable Redis:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_json_responses --requests 3000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from httpx import ASGITransport, AsyncClient
+
+from app import schemas
+from app.core import responses
+from app.services.bootstrap_service import BootstrapService
+from app.services.game_service import GameService
+from app.services.leaderboard_service import LeaderboardService
+from app.services.referral_service import ReferralService
+from app.services.task_service import TaskService
+from main import app
+
+USER_ID = 990_000_001
+FRIENDS = 30
+
+
+async def seed(client):
+    await client.post("/api/bootstrap", json={"id": USER_ID, "first_name": "Bench"})
+    await client.get("/api/referral/", params={"user_id": USER_ID})
+    for i in range(FRIENDS):
+        await client.post("/api/bootstrap", json={"id": USER_ID + 1 + i, "first_name": f"Friend {i}"})
+
+
+def endpoints():
+    return {
+        "POST /tap": lambda c: c.post("/api/tap", json={"user_id": USER_ID, "taps": 1}),
+        "GET /tasks": lambda c: c.get(f"/api/tasks/{USER_ID}"),
+        "GET /referral": lambda c: c.get("/api/referral/", params={"user_id": USER_ID}),
+        "GET /leaderboard": lambda c: c.get("/api/leaderboard", params={"user_id": USER_ID, "limit": 100}),
+        "POST /bootstrap": lambda c: c.post("/api/bootstrap", json={"id": USER_ID, "first_name": "Bench"}),
+    }
+
+
+async def captured_outputs() -> dict:
+    """name -> (service output, response model)"""
+    user = schemas.UserData(id=USER_ID, first_name="Bench")
+    return {
+        "POST /tap": (await GameService.process_tap(USER_ID, 1), schemas.TapResponse),
+        "GET /tasks": (await TaskService.get_overview(str(USER_ID)), schemas.UserTasksResponse),
+        "GET /referral": (await ReferralService.get_referral_info(str(USER_ID)), schemas.ReferralResponse),
+        "GET /leaderboard": (
+            await LeaderboardService.get_leaderboard(0, 100, USER_ID, "all"), schemas.LeaderboardResponse
+        ),
+        "POST /bootstrap": (await BootstrapService.bootstrap(user), schemas.BootstrapResponse),
+    }
+
+
+async def time_serialization(outputs: dict, rounds: int):
+    """µs per response: FastAPI's validate + encode against fast_json's project + encode."""
+    print(f"{'endpoint':<18} {'validated us':>13} {'fast us':>9} {'speedup':>8}")
+    for name, (payload, model) in outputs.items():
+        field = create_model_field(name="Response", type_=model, mode="serialization")
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await serialize_response(field=field, response_content=payload, dump_json=True)
+        slow = (time.perf_counter() - started) / rounds
+
+        project = responses.compile_model(model)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            responses.FastJSONResponse(project(payload))
+        fast = (time.perf_counter() - started) / rounds
+        print(f"{name:<18} {slow * 1e6:>13.1f} {fast * 1e6:>9.1f} {slow / fast:>7.2f}x")
+
+
+async def compare(client, calls: dict, requests: int):
+    print(f"{'endpoint':<18} {'validated req/s':>16} {'fast req/s':>12} {'speedup':>8}")
+    for name, call in calls.items():
+        responses.FAST_JSON_RESPONSES = False
+        slow = await rate(client, call, requests)
+        responses.FAST_JSON_RESPONSES = True
+        fast = await rate(client, call, requests)
+        print(f"{name:<18} {slow:>16,.0f} {fast:>12,.0f} {fast / slow:>7.2f}x")
+
+
+async def rate(client, call, requests: int) -> float:
+    for _ in range(min(200, requests)):
+        await call(client)
+    started = time.perf_counter()
+    for _ in range(requests):
+        res = await call(client)
+    assert res.status_code == 200, res.text
+    return requests / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if responses.orjson is not None else 'stdlib json'}")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        await seed(client)
+        print("\nend to end")
+        await compare(client, endpoints(), args.requests)
+
+    print("\nserialization only")
+    await time_serialization(await captured_outputs(), args.requests * 5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
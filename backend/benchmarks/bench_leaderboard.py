@@ -0,0 +1,59 @@
+"""
+Rank lookup latency vs leaderboard size.
+
+Needs a disposable Redis (it writes to its own key and deletes it afterwards):
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_leaderboard --max-users 5000000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+
+from app.core.database import new_redis_client
+
+BENCH_KEY = "bench:leaderboard"
+
+
+async def fill(client, start: int, stop: int, chunk: int = 10_000):
+    for lo in range(start, stop, chunk):
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(BENCH_KEY, {str(i): random.randint(0, 10_000_000) for i in range(lo, min(lo + chunk, stop))})
+        await pipe.execute()
+
+
+async def time_ranks(client, size: int, lookups: int) -> float:
+    ids = [str(random.randrange(size)) for _ in range(lookups)]
+    started = time.perf_counter()
+    for user_id in ids:
+        await client.zrevrank(BENCH_KEY, user_id)
+    return (time.perf_counter() - started) / lookups
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=5_000)
+    args = parser.parse_args()
+
+    client = new_redis_client()
+    await client.delete(BENCH_KEY)
+    try:
+        sizes = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n < args.max_users]
+        sizes.append(args.max_users)
+
+        size = 0
+        print(f"{'members':>12} {'ZREVRANK us/op':>16}")
+        for target in sizes:
+            await fill(client, size, target)
+            size = target
+            per_op = await time_ranks(client, size, args.lookups)
+            print(f"{size:>12,} {per_op * 1e6:>16.1f}")
+    finally:
+        await client.delete(BENCH_KEY)
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Merkle build time and proof lookup latency on a synthetic allocation set.
+
+    python -m benchmarks.bench_merkle --leaves 5000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.airdrop.merkle import ProofFile, build_tree, verify_proof
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leaves", type=int, default=5_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    ids = np.sort(rng.choice(10 * args.leaves, args.leaves, replace=False)).astype(np.int64) + 100_000_000
+    amounts = rng.integers(1, 10**15, args.leaves, dtype=np.int64)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "proofs.bin")
+        started = time.perf_counter()
+        root = build_tree(ids, amounts, path)
+        built = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+        proofs = ProofFile(path)
+        sample = rng.choice(ids, args.lookups)
+        started = time.perf_counter()
+        results = [proofs.lookup(int(telegram_id)) for telegram_id in sample]
+        per_lookup = (time.perf_counter() - started) / args.lookups
+
+        assert all(verify_proof(r["leaf"], r["proof"], root) for r in results[:100])
+
+    print(
+        f"{args.leaves:,} leaves: build {built:.1f}s ({args.leaves / built:,.0f} leaves/s), "
+        f"file {size / 1e6:,.0f} MB, proof lookup {per_lookup * 1e6:.0f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
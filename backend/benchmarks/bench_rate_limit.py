@@ -0,0 +1,70 @@
+"""
+What the rate limiter adds to POST /tap.
+
+Requests go through the ASGI app in-process, one at a time, with a session
+so both the user and the IP bucket are checked:
+
+- off: no limits on the route
+- allowed: limits high enough that every request passes (one script call each)
+- flood: limits already exhausted, so requests are refused from the worker's
+  memory after the first one
+
+Needs a disposable Redis:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_rate_limit --requests 3000
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from httpx import ASGITransport, AsyncClient
+
+from app.core import sessions
+from app.core.rate_limit import rate_limiter
+from main import app
+
+USER_ID = 990_000_101
+
+# One line per request otherwise
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def time_taps(client, headers: dict, requests: int) -> tuple[float, dict]:
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        res = await client.post("/api/tap", json={"user_id": USER_ID, "taps": 1}, headers=headers)
+        statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+    return (time.perf_counter() - started) / requests, statuses
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    sessions.SESSION_SECRET = sessions.SESSION_SECRET or "bench-secret"
+    headers = {"Authorization": f"Bearer {sessions.issue_session(USER_ID)[0]}"}
+    modes = {
+        "off": {},
+        "allowed": {"/api/tap": {"user": (1e6, 1e6), "ip": (1e6, 1e6)}},
+        "flood": {"/api/tap": {"user": (0.001, 1), "ip": (1e6, 1e6)}},
+    }
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        await client.post("/api/bootstrap", json={"id": USER_ID, "first_name": "Bench"})
+        baseline = None
+        print(f"{'mode':<8} {'us/request':>11} {'overhead us':>12}  statuses")
+        for mode, limits in modes.items():
+            rate_limiter.limits = limits
+            rate_limiter._empty_until = OrderedDict()
+            await time_taps(client, headers, 50)
+            per_request, statuses = await time_taps(client, headers, args.requests)
+            baseline = per_request if baseline is None else baseline
+            print(f"{mode:<8} {per_request * 1e6:>11.1f} {(per_request - baseline) * 1e6:>12.1f}  {statuses}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
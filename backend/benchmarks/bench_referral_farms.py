@@ -0,0 +1,80 @@
+"""
+Time to find and score referral farms in a synthetic referral graph.
+
+Organic users join over 90 days; 70% were referred by a random earlier
+user. Planted farms are stars and chains of silent, same-named accounts
+created within minutes. Only the analysis is timed (no Redis or Postgres):
+
+    python -m benchmarks.bench_referral_farms --edges 1000000 10000000
+"""
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from app.airdrop.referral_farms import EDGE_COLUMNS, score_clusters
+from app.core.config import REFERRAL_FARM_CONFIG
+
+FARM_SIZE = 50
+START = 1_700_000_000
+
+
+def synthetic_graph(edges: int, farms: int, rng) -> tuple[dict, np.ndarray]:
+    """Edge columns, and the root of every planted farm."""
+    organic = edges - farms * FARM_SIZE
+    users = int(organic / 0.7)
+    referred = np.flatnonzero(rng.random(users) < 0.7)[:organic]
+    referred = referred[referred > 0]
+    # Telegram-like ids, in no particular order
+    tg = (np.arange(users, dtype=np.int64) * 2_654_435_761) % (1 << 33) + 1_000_000_000
+    columns = {
+        "referrer": tg[(rng.random(len(referred)) * referred).astype(np.int64)],
+        "referee": tg[referred],
+        "joined_at": START + referred * (90 * 86400) // users,
+        "name": rng.integers(1, 5000, len(referred)),
+        "taps": np.where(rng.random(len(referred)) < 0.7, rng.integers(1, 10_000, len(referred)), 0),
+    }
+
+    # Farms: half stars (one referrer), half chains (each account refers the next)
+    first = (1 << 40) + np.arange(farms, dtype=np.int64)[:, None] * (FARM_SIZE + 1)
+    accounts = first + np.arange(FARM_SIZE + 1)
+    star = np.arange(farms) % 2 == 0
+    referrer = np.where(star[:, None], accounts[:, :1], accounts[:, :-1])
+    joined = START + rng.integers(0, 80 * 86400, farms)[:, None] + np.arange(FARM_SIZE) * 20
+    planted = {
+        "referrer": referrer.ravel(),
+        "referee": accounts[:, 1:].ravel(),
+        "joined_at": joined.ravel(),
+        "name": np.repeat(rng.integers(1, 5000, farms), FARM_SIZE),
+        "taps": np.zeros(farms * FARM_SIZE, dtype=np.int64),
+    }
+    graph = {name: np.concatenate([columns[name], planted[name]]).astype(np.int64) for name in EDGE_COLUMNS}
+    return graph, accounts[:, 0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, nargs="+", default=[10_000_000])
+    parser.add_argument("--farms", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    print(f"{'edges':>12} {'accounts':>12} {'clusters':>11} {'flagged':>8} {'farms found':>12} {'seconds':>8}")
+    for edges in args.edges:
+        graph, farm_roots = synthetic_graph(edges, args.farms, rng)
+        started = time.perf_counter()
+        result = score_clusters(graph, REFERRAL_FARM_CONFIG)
+        elapsed = time.perf_counter() - started
+        found = np.isin(farm_roots, result["root"]).sum()
+        print(
+            f"{len(graph['referrer']):>12,} {result['accounts']:>12,} {result['clusters']:>11,} "
+            f"{len(result['root']):>8,} {found:>5,}/{args.farms:<6,} {elapsed:>8.1f}"
+        )
+        del graph, result
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak RSS {peak_mb:,.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Memory of the referral indexes: the two single hashes used before vs
+ReferralIndex's buckets (REFERRAL_INDEX_BUCKETS of each).
+
+Needs a disposable Redis (it FLUSHDBs it between layouts):
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_referral_index --users 1000000 10000000
+"""
+import argparse
+import asyncio
+import random
+import string
+import time
+from collections import Counter
+
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app.core.config import REFERRAL_INDEX_BUCKETS
+from app.core.database import new_redis_client
+from app.services.base import LEGACY_REFERRAL_CODES_KEY, LEGACY_REFERRAL_LINKS_KEY, RedisKeys
+from app.services.referral_index import ReferralIndex
+
+CHUNK = 10_000
+CODE_CHARS = string.ascii_uppercase + string.digits
+
+
+def make_users(count: int) -> list:
+    """(code, user id) pairs; ids are spread like Telegram's."""
+    rng = random.Random(count)
+    ids = rng.sample(range(100_000_000, 8_000_000_000), count)
+    return [("".join(rng.choices(CODE_CHARS, k=8)), user_id) for user_id in ids]
+
+
+async def used_memory(client) -> int:
+    return (await client.info("memory"))["used_memory"]
+
+
+async def load(client, users: list, bucketed: bool):
+    for lo in range(0, len(users), CHUNK):
+        pipe = client.pipeline(transaction=False)
+        for code, user_id in users[lo:lo + CHUNK]:
+            if bucketed:
+                ReferralIndex.queue_add(pipe, code, user_id)
+            else:
+                pipe.hset(LEGACY_REFERRAL_CODES_KEY, code, user_id)
+                pipe.hset(LEGACY_REFERRAL_LINKS_KEY, user_id, code)
+        await pipe.execute()
+
+
+async def time_lookups(client, users: list, bucketed: bool, lookups: int = 5_000) -> float:
+    sample = random.sample(users, min(lookups, len(users)))
+    started = time.perf_counter()
+    for code, _ in sample:
+        await client.hget(RedisKeys.referral_code_bucket(code) if bucketed else LEGACY_REFERRAL_CODES_KEY, code)
+    return (time.perf_counter() - started) / len(sample)
+
+
+async def time_blocking(client, *command) -> float:
+    """Runs a command that blocks the server (DEL of a big key, FLUSHDB) and times it."""
+    started = time.perf_counter()
+    try:
+        await client.execute_command(*command)
+    except RedisTimeoutError:
+        # Longer than the client's socket timeout: wait for the server to answer again
+        while True:
+            try:
+                await client.ping()
+                break
+            except RedisTimeoutError:
+                pass
+    return time.perf_counter() - started
+
+
+async def measure(client, users: list, bucketed: bool) -> dict:
+    await time_blocking(client, "FLUSHDB")
+    before = await used_memory(client)
+    await load(client, users, bucketed)
+    after = await used_memory(client)
+
+    if bucketed:
+        fullest = Counter(RedisKeys.referral_link_bucket(user_id) for _, user_id in users).most_common(1)[0][0]
+        sample_key = fullest
+    else:
+        sample_key = LEGACY_REFERRAL_LINKS_KEY
+    return {
+        "bytes_per_user": (after - before) / len(users),
+        "total_mb": (after - before) / 2 ** 20,
+        "largest_hash": await client.hlen(sample_key),
+        "encoding": await client.object("encoding", sample_key),
+        "lookup_us": await time_lookups(client, users, bucketed) * 1e6,
+        "delete_largest_ms": await time_blocking(client, "DEL", sample_key) * 1e3,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000_000])
+    args = parser.parse_args()
+
+    client = new_redis_client()
+    try:
+        print(f"{REFERRAL_INDEX_BUCKETS:,} buckets per index")
+        print(f"{'users':>12} {'layout':>8} {'MB':>9} {'B/user':>8} {'largest':>10} "
+              f"{'encoding':>10} {'HGET us':>8} {'DEL ms':>8}")
+        for count in args.users:
+            users = make_users(count)
+            for bucketed in (False, True):
+                r = await measure(client, users, bucketed)
+                print(f"{count:>12,} {'buckets' if bucketed else 'single':>8} {r['total_mb']:>9.1f} "
+                      f"{r['bytes_per_user']:>8.1f} {r['largest_hash']:>10,} {r['encoding']:>10} "
+                      f"{r['lookup_us']:>8.1f} {r['delete_largest_ms']:>8.2f}")
+            del users
+        await time_blocking(client, "FLUSHDB")
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Fan-out cost of the per-worker event hub.
+
+Connects N in-memory clients (what one uvicorn worker would hold), publishes
+balance events through Redis pub/sub and reports push latency and memory.
+Needs a disposable Redis:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_sse_fanout --clients 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from app.core.database import redis_client
+from app.services.base import BALANCE_EVENTS_CHANNEL, RedisKeys
+from app.services.event_hub import EventHub, FANOUT_SECONDS, PUSHES
+
+
+async def drain(client, received: list):
+    while True:
+        state = await client.next_state(3600)
+        if state:
+            received.append(time.perf_counter())
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    hub = EventHub()
+    user_ids = [str(900_000_000 + i) for i in range(args.clients)]
+    clients = [hub.connect(uid) for uid in user_ids]
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"connected={len(clients)} hub memory={peak / 1024 / 1024:.1f} MiB "
+          f"({peak / len(clients):.0f} B/client)")
+
+    received = []
+    readers = [asyncio.create_task(drain(c, received)) for c in clients]
+
+    # Publish at a steady rate, bumping balances so every event changes state
+    interval = args.seconds / args.events
+    started = time.perf_counter()
+    for _ in range(args.events):
+        uid = random.choice(user_ids)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hincrby(RedisKeys.user(uid), "points", 1)
+        pipe.publish(BALANCE_EVENTS_CHANNEL, uid)
+        await pipe.execute()
+        await asyncio.sleep(interval)
+    await asyncio.sleep(2)
+    elapsed = time.perf_counter() - started
+
+    summary = FANOUT_SECONDS.summary()
+    print(f"events={args.events} pushes={PUSHES.get():.0f} in {elapsed:.1f}s "
+          f"({args.events / elapsed:,.0f} events/s)")
+    print(f"avg fan-out latency={summary['avg'] * 1000:.1f} ms "
+          f"(includes up to one push interval of coalescing)")
+
+    for task in readers:
+        task.cancel()
+    await hub.stop()
+    await redis_client.delete(*(RedisKeys.user(uid) for uid in user_ids))
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Bytes on the wire and server-side parse/encode time of /tap and
+/sync-passive in JSON and in the binary frames of app/core/wire.py.
+
+No Redis needed: the request bodies and service outputs are representative
+values, and only the work that differs between the two encodings is timed
+(request body to validated payload, service output to response body).
+
+    python -m benchmarks.bench_wire --rounds 200000
+"""
+import argparse
+import json
+import time
+
+from app.core import responses, wire
+from app.schemas import PassiveEarnResponse, TapPayload, TapResponse, UserPayload
+
+USER_ID = 6_123_456_789
+
+TAP_STATE = {
+    "points": 1_234_567, "energy": 4_321, "maxEnergy": 5_000, "level": 7, "multitapLevel": 5,
+    "energyLimitLevel": 4, "rechargeSpeedLevel": 3, "tapBotLevel": 1, "profitPerHour": 12_500,
+    "stateVersion": (1 << 24) + 9,
+}
+PASSIVE_RESULT = {
+    "earned": 3_472, "points": 1_238_039, "profit_per_hour": 12_500, "stateVersion": (1 << 24) + 9,
+}
+
+# HTTP/1.1 framing that differs between the two (Content-Type and Content-Length lines)
+JSON_HEADERS = len("Content-Type: application/json\r\nContent-Length: 000\r\n")
+WIRE_HEADERS = len(f"Content-Type: {wire.WIRE_MEDIA_TYPE}\r\nContent-Length: 00\r\n")
+
+
+def cases() -> dict:
+    """name -> (json request, json response, wire request, wire response with state, without)"""
+    version = TAP_STATE["stateVersion"]
+    return {
+        "/tap": (
+            json.dumps({"user_id": USER_ID, "taps": 12}).encode(),
+            responses.FastJSONResponse(responses.compile_model(TapResponse)(TAP_STATE)).body,
+            wire.TAP_REQUEST.pack(USER_ID, 12, version),
+            wire.encode_tap_response(TAP_STATE, 0),
+            wire.encode_tap_response(TAP_STATE, version),
+        ),
+        "/sync-passive": (
+            json.dumps({"user_id": USER_ID}).encode(),
+            responses.FastJSONResponse(responses.compile_model(PassiveEarnResponse)(PASSIVE_RESULT)).body,
+            wire.PASSIVE_REQUEST.pack(USER_ID, version),
+            wire.encode_passive_response(PASSIVE_RESULT, 0),
+            wire.encode_passive_response(PASSIVE_RESULT, version),
+        ),
+    }
+
+
+def print_sizes():
+    print(f"{'endpoint':<14} {'json req':>9} {'json res':>9} {'wire req':>9} {'wire res':>9} {'delta res':>10} {'saved/call':>11}")
+    for name, (json_req, json_res, wire_req, wire_full, wire_delta) in cases().items():
+        json_total = len(json_req) + len(json_res) + 2 * JSON_HEADERS
+        wire_total = len(wire_req) + len(wire_delta) + 2 * WIRE_HEADERS
+        print(
+            f"{name:<14} {len(json_req):>9} {len(json_res):>9} {len(wire_req):>9} "
+            f"{len(wire_full):>9} {len(wire_delta):>10} {json_total - wire_total:>10} B"
+        )
+
+
+def per_call(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def print_times(rounds: int):
+    version = TAP_STATE["stateVersion"]
+    (tap_json, _, tap_wire, _, _), (passive_json, _, passive_wire, _, _) = cases().values()
+    tap_project = responses.compile_model(TapResponse)
+    passive_project = responses.compile_model(PassiveEarnResponse)
+
+    def tap_from_wire():
+        user_id, taps, _ = wire.decode_tap_request(tap_wire)
+        TapPayload.model_validate({"user_id": user_id, "taps": taps})
+
+    def passive_from_wire():
+        user_id, _ = wire.decode_passive_request(passive_wire)
+        UserPayload.model_validate({"user_id": user_id})
+
+    timings = {
+        "parse /tap": (lambda: TapPayload.model_validate_json(tap_json), tap_from_wire),
+        "parse /sync-passive": (lambda: UserPayload.model_validate_json(passive_json), passive_from_wire),
+        "encode /tap": (
+            lambda: responses._dumps(tap_project(TAP_STATE)),
+            lambda: wire.encode_tap_response(TAP_STATE, version),
+        ),
+        "encode /sync-passive": (
+            lambda: responses._dumps(passive_project(PASSIVE_RESULT)),
+            lambda: wire.encode_passive_response(PASSIVE_RESULT, version),
+        ),
+    }
+    print(f"{'step':<22} {'json us':>8} {'wire us':>8} {'speedup':>8}")
+    for name, (as_json, as_wire) in timings.items():
+        slow, fast = per_call(as_json, rounds), per_call(as_wire, rounds)
+        print(f"{name:<22} {slow:>8.2f} {fast:>8.2f} {slow / fast:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"json encoder: {'orjson' if responses.orjson is not None else 'stdlib json'}\n")
+    print("bytes (body; saved/call includes the Content-Type/Length header lines)")
+    print_sizes()
+    print()
+    print_times(args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
-from fastapi import FastAPI
+import hmac
+import ipaddress
+import os
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.database import redis_client
-from app.api import auth, game, tasks, referral
+from app.core.metrics import render_prometheus
+from app.core.rate_limit import rate_limiter
+from app.core.replicas import replica_set
+from app.services.event_hub import event_hub
+from app.services.season_service import SeasonService
+from app.api import auth, game, tasks, referral, leaderboard, events, admin, stats, airdrop
 
 app = FastAPI()
 
+# Bearer token Prometheus scrapes /metrics with; without one only direct
+# requests from loopback / private addresses are answered
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 origins = [
     "http://localhost:3000",  # Common React port
     "http://localhost:5173",  # Common Vite port
     "*"                       # Allow all (easiest for dev)
 ]
 
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    # Added before CORS so that 429s carry its headers and the client can read Retry-After
+    return await rate_limiter.check(request) or await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,       # Who can call the API
@@ -19,11 +39,22 @@ app.add_middleware(
     allow_headers=["*"],         # Allow "Content-Type", "Authorization"
 )
 
+@app.middleware("http")
+async def current_season(request: Request, call_next):
+    # Reads Redis at most once per SEASON_REFRESH_INTERVAL
+    await SeasonService.refresh()
+    return await call_next(request)
+
 # Include Routers with /api prefix
 app.include_router(auth.router, prefix="/api", tags=["Auth"])
 app.include_router(game.router, prefix="/api", tags=["Game"])
 app.include_router(tasks.router, prefix="/api", tags=["Tasks"])
 app.include_router(referral.router, prefix="/api", tags=["Referral"])
+app.include_router(leaderboard.router, prefix="/api", tags=["Leaderboard"])
+app.include_router(events.router, prefix="/api", tags=["Events"])
+app.include_router(stats.router, prefix="/api", tags=["Stats"])
+app.include_router(airdrop.router, prefix="/api", tags=["Airdrop"])
+app.include_router(admin.router, prefix="/api", tags=["Admin"])
 
 @app.on_event("startup")
 async def startup_event():
@@ -33,6 +64,33 @@ async def startup_event():
     except Exception as e:
         print(f"Redis Connection Error: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await event_hub.stop()
+    await replica_set.stop()
+
 @app.get("/")
 def root():
     return {"message": "API Running"}
+
+def require_internal(request: Request, authorization: Optional[str] = Header(None)):
+    """Sync lag and queue sizes are not for the public API."""
+    if METRICS_TOKEN:
+        allowed = bool(authorization) and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+    else:
+        # Anything a reverse proxy forwarded came from outside
+        try:
+            allowed = (
+                "x-forwarded-for" not in request.headers
+                and request.client is not None
+                and ipaddress.ip_address(request.client.host).is_private
+            )
+        except ValueError:
+            allowed = False
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(require_internal)])
+def metrics():
+    # Per-process values: each uvicorn worker reports its own counters
+    return render_prometheus()
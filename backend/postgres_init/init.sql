@@ -4,9 +4,54 @@ CREATE TABLE IF NOT EXISTS users (
     energy INT DEFAULT 1000,
     level INT DEFAULT 1,
     profit_per_hour INT DEFAULT 0,
+    total_clicks BIGINT DEFAULT 0,
     raw_state JSONB,
     last_db_sync TIMESTAMP DEFAULT NOW(),
     created_at TIMESTAMP DEFAULT NOW()
 );
 
 CREATE INDEX IF NOT EXISTS idx_leaderboard ON users (points DESC);
+
+-- Databases created before the click buffer existed
+ALTER TABLE users ADD COLUMN IF NOT EXISTS total_clicks BIGINT DEFAULT 0;
+
+-- Final standings of closed daily / weekly leaderboards
+CREATE TABLE IF NOT EXISTS leaderboard_results (
+    period TEXT NOT NULL,
+    rank INT NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    points BIGINT NOT NULL,
+    frozen_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (period, rank)
+);
+
+-- Every balance change, written by app/core/ledger_worker.py.
+-- Monthly partitions are created by the writer as entries arrive.
+CREATE TABLE IF NOT EXISTS points_ledger (
+    telegram_id BIGINT NOT NULL,
+    delta BIGINT NOT NULL,
+    reason SMALLINT NOT NULL,
+    ref TEXT,
+    created_at TIMESTAMPTZ NOT NULL
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_points_ledger_user ON points_ledger (telegram_id, created_at);
+
+-- Redis buffer batches already written, so a retried batch isn't written twice
+CREATE TABLE IF NOT EXISTS points_ledger_batches (
+    batch_id BIGINT PRIMARY KEY,
+    shard INT NOT NULL,
+    entries INT NOT NULL,
+    written_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Final state of every user in each finished season (app/core/season_worker.py)
+CREATE TABLE IF NOT EXISTS user_seasons (
+    season INT NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    points BIGINT NOT NULL,
+    level INT NOT NULL,
+    raw_state JSONB,
+    archived_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (season, telegram_id)
+);
@@ -1,89 +1,121 @@
-import redis
-import psycopg2
-from psycopg2.extras import execute_values
-import time
+import asyncio
 import logging
+import os
 
-# Configuration
-REDIS_CONFIG = {
-    'host': 'localhost',
-    'port': 6379,
-    'db': 0,
-    'decode_responses': True
-}
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from redis.exceptions import ResponseError
 
-POSTGRES_CONFIG = "dbname=postgres_password user=postgres password=postgres_password host=localhost"
+from app.core.config import CLICK_BUFFER_SHARDS
+from app.core.database import redis_client, POSTGRES_URL
+from app.services.base import RedisKeys
+
+# Configuration
+POSTGRES_CONFIG = POSTGRES_URL or "dbname=postgres_password user=postgres password=postgres_password host=localhost"
 
 # Constants
-BUFFER_KEY = "user_clicks_buffer"
-PROCESSING_KEY = "user_clicks_processing"
-SYNC_INTERVAL = 30  # Seconds
+SYNC_INTERVAL = int(os.getenv("CLICK_SYNC_INTERVAL", "30"))  # Seconds
+HSCAN_COUNT = int(os.getenv("CLICK_SYNC_SCAN_COUNT", "1000"))  # Fields per Postgres batch
+PG_CONNECTIONS = int(os.getenv("CLICK_SYNC_PG_CONNECTIONS", "4"))
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def sync_data():
-    # Connect to Redis and Postgres
-    r = redis.Redis(**REDIS_CONFIG)
-    conn = None
-    
+_pool = None
+
+
+def run_click_upsert(updates):
+    """Adds a batch of [(user_id, clicks), ...] deltas to Postgres (blocking)."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(1, PG_CONNECTIONS, POSTGRES_CONFIG)
+
+    conn = _pool.getconn()
     try:
-        # 1. Check if there is data to process
-        if not r.exists(BUFFER_KEY):
-            return
-
-        # 2. Atomic Snapshot: Move buffer to processing key
-        # This prevents losing clicks that come in while we are talking to Postgres
-        r.rename(BUFFER_KEY, PROCESSING_KEY)
-        
-        # 3. Get all data from the processing key
-        data = r.hgetall(PROCESSING_KEY)
-        if not data:
-            return
-
-        # Prepare data for Bulk Upsert: List of tuples [(user_id, clicks), ...]
-        # We convert clicks to int and ensure user_id is handled correctly
-        updates = [(user_id, int(clicks)) for user_id, clicks in data.items()]
-
-        logging.info(f"Syncing {len(updates)} users to PostgreSQL...")
-
-        # 4. Connect to Postgres and perform Bulk UPSERT
-        conn = psycopg2.connect(POSTGRES_CONFIG)
-        cur = conn.cursor()
-
-        upsert_query = """
-            INSERT INTO users (telegram_id, balance, total_clicks, updated_at)
-            VALUES %s
-            ON CONFLICT (telegram_id) 
-            DO UPDATE SET 
-                balance = users.balance + EXCLUDED.balance,
-                total_clicks = users.total_clicks + EXCLUDED.total_clicks,
-                updated_at = NOW();
-        """
-
-        # execute_values is the fastest way to do bulk updates in psycopg2
-        execute_values(cur, upsert_query, updates)
-        
+        with conn.cursor() as cur:
+            upsert_query = """
+                INSERT INTO users (telegram_id, total_clicks)
+                VALUES %s
+                ON CONFLICT (telegram_id)
+                DO UPDATE SET
+                    total_clicks = users.total_clicks + EXCLUDED.total_clicks;
+            """
+            # execute_values is the fastest way to do bulk updates in psycopg2
+            execute_values(cur, upsert_query, updates)
         conn.commit()
-        cur.close()
-
-        # 5. Only delete from Redis if Postgres commit was successful
-        r.delete(PROCESSING_KEY)
-        logging.info("Sync complete.")
-
-    except redis.exceptions.ResponseError as e:
-        # Handle case where key might have been deleted/moved by another process
-        logging.error(f"Redis error: {e}")
-    except Exception as e:
-        logging.error(f"Error during sync: {e}")
-        if conn:
-            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
     finally:
-        if conn:
-            conn.close()
+        _pool.putconn(conn)
 
-if __name__ == "__main__":
-    logging.info("Starting Redis-to-Postgres sync worker...")
+
+async def drain_processing_key(shard: int, pg_slots: asyncio.Semaphore) -> int:
+    """
+    Streams one shard's processing hash to Postgres with HSCAN.
+
+    Fields are deleted only after their batch has been committed, so a crash
+    leaves the remainder in place for the next run. Returns users synced.
+    """
+    processing_key = RedisKeys.click_processing(shard)
+    synced = 0
+    cursor = 0
+    while True:
+        cursor, data = await redis_client.hscan(processing_key, cursor, count=HSCAN_COUNT)
+        if data:
+            updates = [(int(user_id), int(clicks)) for user_id, clicks in data.items()]
+            async with pg_slots:
+                await asyncio.to_thread(run_click_upsert, updates)
+            await redis_client.hdel(processing_key, *data.keys())
+            synced += len(updates)
+        if cursor == 0:
+            return synced
+
+
+async def sync_shard(shard: int, pg_slots: asyncio.Semaphore) -> int:
+    buffer_key = RedisKeys.click_buffer(shard)
+    processing_key = RedisKeys.click_processing(shard)
+
+    # 1. Recover whatever a failed run left behind before taking a new snapshot
+    synced = await drain_processing_key(shard, pg_slots)
+
+    # 2. Atomic Snapshot: Move buffer to processing key
+    # This prevents losing clicks that come in while we are talking to Postgres.
+    # RENAMENX never overwrites a processing key that reappeared meanwhile.
+    try:
+        if not await redis_client.renamenx(buffer_key, processing_key):
+            return synced
+    except ResponseError:
+        # Buffer is empty (no such key)
+        return synced
+
+    # 3. Stream the snapshot to Postgres
+    return synced + await drain_processing_key(shard, pg_slots)
+
+
+async def sync_data():
+    pg_slots = asyncio.Semaphore(PG_CONNECTIONS)
+    results = await asyncio.gather(
+        *(sync_shard(shard, pg_slots) for shard in range(CLICK_BUFFER_SHARDS)),
+        return_exceptions=True,
+    )
+
+    synced = 0
+    for shard, result in enumerate(results):
+        if isinstance(result, Exception):
+            logging.error(f"Error during sync of shard {shard}: {result}")
+        else:
+            synced += result
+    if synced:
+        logging.info(f"Synced clicks for {synced} users to PostgreSQL.")
+
+
+async def main():
+    logging.info(f"Starting Redis-to-Postgres click sync worker ({CLICK_BUFFER_SHARDS} shards)...")
     while True:
-        sync_data()
-        time.sleep(SYNC_INTERVAL)
+        await sync_data()
+        await asyncio.sleep(SYNC_INTERVAL)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
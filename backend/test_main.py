@@ -1,6 +1,7 @@
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
+import fakeredis
 import fakeredis.aioredis
 import time
 import json
@@ -16,8 +17,8 @@ async def mock_redis(monkeypatch):
     Creates a FakeRedis instance and replaces the real redis_client 
     in ALL modules where it is imported.
     """
-    # 1. Create Fake Redis
-    fake = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    # 1. Create Fake Redis (on an explicit server, for jobs that open their own client)
+    fake = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
     
     # 2. Patch the DEFINITION (Source)
     monkeypatch.setattr("app.core.database.redis_client", fake)
@@ -28,10 +29,24 @@ async def mock_redis(monkeypatch):
     monkeypatch.setattr("app.services.game_service.redis_client", fake)
     monkeypatch.setattr("app.services.task_service.redis_client", fake)
     monkeypatch.setattr("app.services.referral_service.redis_client", fake) # Add this
+    monkeypatch.setattr("app.services.tiering_service.redis_client", fake)
+    monkeypatch.setattr("app.services.leaderboard_service.redis_client", fake)
+    monkeypatch.setattr("app.services.activity_service.redis_client", fake)
+    monkeypatch.setattr("app.services.stats_service.redis_client", fake)
+    monkeypatch.setattr("app.services.season_service.redis_client", fake)
+    monkeypatch.setattr("app.services.bootstrap_service.redis_client", fake)
+    monkeypatch.setattr("app.services.referral_index.redis_client", fake)
+    monkeypatch.setattr("app.services.bot_detector.redis_client", fake)
     
     # 4. Patch Main (for startup event)
     monkeypatch.setattr("main.redis_client", fake)
     
+    # Pages are cached per process; don't leak them between tests
+    monkeypatch.setattr("app.services.leaderboard_service.LeaderboardService._page_cache", {})
+    # Every test starts in season 0, re-read from Redis on the first request
+    monkeypatch.setattr("app.services.base._current_season", 0)
+    monkeypatch.setattr("app.services.season_service.SeasonService._checked_at", 0.0)
+
     yield fake
     
     # 5. Cleanup to prevent "Event loop is closed" errors
@@ -56,9 +71,10 @@ async def test_login_creates_user(client):
     assert data["gameState"]["energy"] == 1000
 
 @pytest.mark.asyncio
-async def test_tapping_math(client):
+async def test_tapping_math(client, mock_redis):
     # 1. Login
     await client.post("/api/auth", json={"id": 999, "first_name": "Tapper"})
+    assert await mock_redis.hget("user:999", "total_taps") == "0"
 
     # 2. Tap
     tap_payload = {"user_id": 999, "taps": 10}
@@ -68,6 +84,7 @@ async def test_tapping_math(client):
     data = response.json()
     assert data["points"] == 10
     assert data["energy"] == 990
+    assert await mock_redis.hget("user:999", "total_taps") == "10"
 
 @pytest.mark.asyncio
 async def test_buy_upgrade(client, mock_redis):
@@ -645,3 +662,1039 @@ async def test_buy_mining_card_insufficient_funds(client, mock_redis):
     
     assert response.status_code == 400
     assert response.json()["detail"] == "Insufficient funds"
+
+# --- COLD USER TIERING TESTS ---
+
+@pytest.mark.asyncio
+async def test_idle_synced_user_is_evicted_and_rehydrated(client, mock_redis, monkeypatch):
+    from app.services.base import RedisKeys
+    from app.services.tiering_service import TieringService
+
+    user_id = 12345
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Sleepy"})
+    await client.post("/api/tap", json={"user_id": user_id, "taps": 5})
+
+    # Pretend the sync worker already persisted the user and they went idle
+    snapshot_pipe = mock_redis.pipeline()
+    TieringService.queue_snapshot_reads(snapshot_pipe, user_id)
+    persisted = TieringService.build_snapshot(await snapshot_pipe.execute())
+    monkeypatch.setattr(
+        TieringService, "load_raw_states",
+        staticmethod(lambda ids: {str(i): persisted for i in ids if str(i) == str(user_id)})
+    )
+    await mock_redis.delete(RedisKeys.sync_queue(RedisKeys.sync_shard(user_id)))
+    await mock_redis.zadd("users_last_seen", {str(user_id): 0})
+
+    examined, evicted = await TieringService.evict_idle_users(idle_seconds=60)
+    assert (examined, evicted) == (1, 1)
+    assert not await mock_redis.exists(f"user:{user_id}", f"user:{user_id}:tasks")
+
+    # Next access transparently reloads the user instead of starting from zero
+    response = await client.post("/api/tap", json={"user_id": user_id, "taps": 1})
+    assert response.status_code == 200
+    assert response.json()["points"] == 6
+    assert await mock_redis.zscore("users_last_seen", str(user_id)) > 0
+
+@pytest.mark.asyncio
+async def test_unsynced_user_is_not_evicted(client, mock_redis, monkeypatch):
+    from app.services.base import RedisKeys
+    from app.services.tiering_service import TieringService
+
+    user_id = 12346
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Dirty"})
+    monkeypatch.setattr(TieringService, "load_raw_states", staticmethod(lambda ids: {}))
+    await mock_redis.zadd("users_last_seen", {str(user_id): 0})
+
+    # Still queued for sync
+    _, evicted = await TieringService.evict_idle_users(idle_seconds=60)
+    assert evicted == 0
+
+    # Not queued anymore, but Postgres has no matching snapshot
+    await mock_redis.delete(RedisKeys.sync_queue(RedisKeys.sync_shard(user_id)))
+    _, evicted = await TieringService.evict_idle_users(idle_seconds=60)
+    assert evicted == 0
+    assert await mock_redis.exists(f"user:{user_id}")
+
+@pytest.mark.asyncio
+async def test_referral_data_without_a_profile_is_not_evicted_unsynced(client, mock_redis, monkeypatch):
+    from app.services.base import RedisKeys
+    from app.services.tiering_service import TieringService
+
+    # Has a referral code but never opened the game, so the sync worker skips them
+    user_id = 12347
+    code = (await client.get(f"/api/referral/?user_id={user_id}")).json()["referral_info"]["referral_code"]
+    assert not await mock_redis.exists(f"user:{user_id}")
+    await mock_redis.delete(RedisKeys.sync_queue(RedisKeys.sync_shard(user_id)))
+    await mock_redis.zadd("users_last_seen", {str(user_id): 0})
+
+    monkeypatch.setattr(TieringService, "load_raw_states", staticmethod(lambda ids: {}))
+    assert await TieringService.evict_idle_users(idle_seconds=60) == (1, 0)
+    stale = {"referral_summary": {"user_id": str(user_id)}, "friends": {}}
+    monkeypatch.setattr(TieringService, "load_raw_states", staticmethod(lambda ids: {str(user_id): stale}))
+    assert await TieringService.evict_idle_users(idle_seconds=60) == (1, 0)
+    assert await mock_redis.hget(RedisKeys.user_referral(user_id), "referral_code") == code
+
+    # Evicted once Postgres has the same referral data
+    summary = await mock_redis.hgetall(RedisKeys.user_referral(user_id))
+    persisted = {"referral_summary": summary, "friends": {}}
+    monkeypatch.setattr(TieringService, "load_raw_states", staticmethod(lambda ids: {str(user_id): persisted}))
+    assert await TieringService.evict_idle_users(idle_seconds=60) == (1, 1)
+
+@pytest.mark.asyncio
+async def test_bulk_restore_rebuilds_user(client, mock_redis):
+    from app.core.redis_restore import queue_user_restore
+    from app.services.activity_service import ActivityService
+    from app.services.referral_index import ReferralIndex
+
+    state = {
+        "profile": {"points": "4200", "energy": "1000", "max_energy": "1000", "level": "1",
+                    "multitap_level": "1", "last_sync_time": str(int(time.time())), "uidx": "40"},
+        "tasks": {}, "daily_rewards": {}, "stats": {},
+        "referral_summary": {"user_id": "31337", "referral_code": "ABCD1234"},
+        "friends": {},
+    }
+    pipe = mock_redis.pipeline(transaction=False)
+    assert queue_user_restore(pipe, 31337, state) == 40
+    ActivityService.queue_raise_index(pipe, 40)
+    # Batches finish out of order; the sequence never goes back down
+    ActivityService.queue_raise_index(pipe, 7)
+    await pipe.execute()
+
+    assert await ReferralIndex.lookup("ABCD1234") == "31337"
+    response = await client.post("/api/auth", json={"id": 31337, "first_name": "Restored"})
+    assert response.json()["gameState"]["points"] == 4200
+    assert await ActivityService.previous_index(31337) == 40
+
+    # New users get indexes no restored user holds
+    await client.post("/api/auth", json={"id": 31338, "first_name": "New"})
+    assert await mock_redis.hget("user:31338", "uidx") == "41"
+
+# --- CLICK BUFFER OFFLOAD TESTS ---
+
+@pytest.mark.asyncio
+async def test_click_buffer_drain_recovers_leftovers(client, mock_redis, monkeypatch):
+    import redis_offload
+    from app.services.base import RedisKeys
+
+    synced = []
+    monkeypatch.setattr(redis_offload, "redis_client", mock_redis)
+    monkeypatch.setattr(redis_offload, "run_click_upsert", lambda updates: synced.extend(updates))
+
+    user_id = 4242
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Clicker"})
+    await client.post("/api/tap", json={"user_id": user_id, "taps": 7})
+
+    shard = RedisKeys.click_buffer_shard(user_id)
+    # Leftover from a crashed run must be merged, not overwritten by the rename
+    await mock_redis.hset(RedisKeys.click_processing(shard), "1", 3)
+
+    await redis_offload.sync_data()
+
+    assert sorted(synced) == sorted([(1, 3), (user_id, 7)])
+    assert not await mock_redis.exists(RedisKeys.click_buffer(shard), RedisKeys.click_processing(shard))
+
+# --- SYNC WORKER TESTS ---
+
+@pytest.mark.asyncio
+async def test_sync_batch_upserts_and_requeues_on_failure(client, mock_redis, monkeypatch):
+    from app.core import sync_worker
+    from app.services.base import RedisKeys
+
+    user_id = 5150
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Synced"})
+    await client.post("/api/tap", json={"user_id": user_id, "taps": 3})
+    shard = RedisKeys.sync_shard(user_id)
+    queued_at = await mock_redis.zscore(RedisKeys.sync_queue(shard), str(user_id))
+
+    def failing_upsert(conn, payloads):
+        raise RuntimeError("postgres down")
+
+    monkeypatch.setattr(sync_worker, "run_upsert", failing_upsert)
+    with pytest.raises(RuntimeError):
+        await sync_worker.sync_batch(mock_redis, None, shard)
+    # Nothing is lost, and the original change time is kept
+    assert await mock_redis.zscore(RedisKeys.sync_queue(shard), str(user_id)) == queued_at
+
+    written = []
+    monkeypatch.setattr(sync_worker, "run_upsert", lambda conn, payloads: written.extend(payloads))
+    assert await sync_worker.sync_batch(mock_redis, None, shard) == 1
+
+    telegram_id, points, *_, raw_state = written[0]
+    assert (telegram_id, points) == (user_id, 3)
+    assert json.loads(raw_state)["profile"]["points"] == "3"
+    assert await mock_redis.zcard(RedisKeys.sync_queue(shard)) == 0
+
+@pytest.mark.asyncio
+async def test_sync_queue_metrics(client, mock_redis):
+    from app.core import metrics, sync_worker
+    from app.services.base import RedisKeys
+
+    user_id = 5151
+    shard = RedisKeys.sync_shard(user_id)
+    await mock_redis.zadd(RedisKeys.sync_queue(shard), {str(user_id): int(time.time()) - 120})
+
+    await sync_worker.sample_queues(mock_redis, [shard])
+
+    assert sync_worker.QUEUE_DEPTH.get(shard=shard) == 1
+    assert 119 <= sync_worker.OLDEST_PENDING.get(shard=shard) <= 122
+    assert f'sync_queue_depth{{shard="{shard}"}} 1' in metrics.render_prometheus()
+
+@pytest.mark.asyncio
+async def test_api_metrics_are_internal_only(client, monkeypatch):
+    import main
+
+    # The test client connects from 127.0.0.1
+    assert (await client.get("/metrics")).status_code == 200
+    assert (await client.get("/metrics", headers={"X-Forwarded-For": "203.0.113.9"})).status_code == 403
+
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+    assert (await client.get("/metrics")).status_code == 403
+    res = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert res.status_code == 200 and "# TYPE" in res.text
+
+# --- LEADERBOARD TESTS ---
+
+@pytest.mark.asyncio
+async def test_leaderboard_tracks_every_points_change(client, mock_redis):
+    await client.post("/api/auth", json={"id": 7001, "first_name": "Alice"})
+    await client.post("/api/auth", json={"id": 7002, "first_name": "Bob"})
+    await client.post("/api/tap", json={"user_id": 7001, "taps": 20})
+    await client.post("/api/tap", json={"user_id": 7002, "taps": 5})
+
+    # Task claims are credited too
+    tasks = (await client.get("/api/tasks/7002")).json()["tasks"]
+    task_id = tasks[0]["id"]
+    await client.post(f"/api/tasks/7002/{task_id}/complete")
+    await client.post(f"/api/tasks/7002/{task_id}/claim")
+
+    response = await client.get("/api/leaderboard", params={"limit": 10, "user_id": 7001})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [e["user_id"] for e in data["entries"]] == ["7002", "7001"]
+    assert data["entries"][0]["first_name"] == "Bob"
+    assert data["entries"][0]["points"] == 5 + tasks[0]["reward"]
+    assert data["me"] == {"rank": 2, "points": 20}
+
+    # Spending points lowers the score as well
+    score = await mock_redis.zscore("leaderboard:points", "7002")
+    await mock_redis.hset("user:7002", "points", 5000)
+    await client.post("/api/upgrade", json={"user_id": 7002, "upgrade_type": "multitap"})
+    spent = 5000 - int(await mock_redis.hget("user:7002", "points"))
+    assert spent > 0 and await mock_redis.zscore("leaderboard:points", "7002") == score - spent
+
+@pytest.mark.asyncio
+async def test_leaderboard_keeps_credits_that_land_mid_request(client, mock_redis, monkeypatch):
+    from app.services.bootstrap_service import BootstrapService
+    from app.services.game_service import GameService
+    from app.services.points_service import PointsService
+
+    await client.post("/api/auth", json={"id": 7003, "first_name": "Carol"})
+    load_user, read = GameService.load_user, BootstrapService._read
+
+    def then_referral_bonus(load):
+        # A referral bonus lands after the request read the balance
+        async def wrapped(user_id):
+            data = await load(user_id)
+            pipe = mock_redis.pipeline()
+            PointsService.credit(pipe, user_id, 2500, "referral_reward", ref=1)
+            await pipe.execute()
+            return data
+        return staticmethod(wrapped)
+
+    monkeypatch.setattr(GameService, "load_user", then_referral_bonus(load_user))
+    monkeypatch.setattr(BootstrapService, "_read", then_referral_bonus(read))
+    await client.post("/api/tap", json={"user_id": 7003, "taps": 10})
+    await client.post("/api/bootstrap", json={"id": 7003, "first_name": "Carol"})
+
+    points = int(await mock_redis.hget("user:7003", "points"))
+    assert points == 10 + 2 * 2500
+    assert await mock_redis.zscore("leaderboard:points", "7003") == points
+
+    # Users from before the board existed are seeded at their balance
+    await mock_redis.zrem("leaderboard:points", "7003")
+    monkeypatch.setattr(GameService, "load_user", staticmethod(load_user))
+    await client.post("/api/tap", json={"user_id": 7003, "taps": 1})
+    assert await mock_redis.zscore("leaderboard:points", "7003") == points + 1
+
+@pytest.mark.asyncio
+async def test_periodic_leaderboards_count_points_earned(client, mock_redis):
+    from app.services.leaderboard_service import LeaderboardService
+
+    await client.post("/api/auth", json={"id": 7101, "first_name": "Rich"})
+    await mock_redis.hset("user:7101", "points", 50000)
+    await client.post("/api/tap", json={"user_id": 7101, "taps": 4})
+    # Spending doesn't reduce what was earned this period
+    await client.post("/api/upgrade", json={"user_id": 7101, "upgrade_type": "multitap"})
+
+    daily = LeaderboardService.current_period("daily")
+    data = (await client.get("/api/leaderboard", params={"period": "daily", "user_id": 7101})).json()
+    assert data["period"] == daily
+    assert data["me"] == {"rank": 1, "points": 4}
+    assert await mock_redis.ttl(f"leaderboard:{daily}") > 0
+
+    weekly = (await client.get("/api/leaderboard", params={"period": "weekly"})).json()
+    assert weekly["entries"][0]["points"] == 4
+
+# --- LIVE EVENTS TESTS ---
+
+@pytest.mark.asyncio
+async def test_event_hub_coalesces_balance_pushes(client, mock_redis, monkeypatch):
+    from app.services.event_hub import EventHub
+    monkeypatch.setattr("app.services.event_hub.redis_client", mock_redis)
+
+    hub = EventHub()
+    # Flushes are driven by hand below
+    monkeypatch.setattr(hub, "start", lambda: None)
+
+    await client.post("/api/auth", json={"id": 7201, "first_name": "Watcher"})
+    viewer = hub.connect(7201)
+    await hub.flush()
+    assert (await viewer.next_state(0.1))["points"] == 0
+
+    # Several events between two flushes produce a single push with the latest state
+    await mock_redis.hincrby("user:7201", "points", 100)
+    hub.mark_dirty("7201")
+    await mock_redis.hincrby("user:7201", "points", 50)
+    hub.mark_dirty("7201")
+    await hub.flush()
+    assert (await viewer.next_state(0.1))["points"] == 150
+    assert await viewer.next_state(0.05) is None
+
+    # Unchanged state isn't pushed again
+    hub.mark_dirty("7201")
+    await hub.flush()
+    assert await viewer.next_state(0.05) is None
+
+    hub.disconnect(viewer)
+    assert hub.clients == {}
+
+# --- ANALYTICS TESTS ---
+
+@pytest.mark.asyncio
+async def test_activity_bitmaps_and_admin_analytics(client, mock_redis, monkeypatch):
+    from datetime import timedelta
+    from app.services.activity_service import ActivityService
+    monkeypatch.setattr("app.api.admin.ADMIN_TOKEN", "secret")
+
+    await client.post("/api/auth", json={"id": 7301, "first_name": "Active"})
+    await client.post("/api/auth", json={"id": 7302, "first_name": "Idle"})
+    await client.post("/api/tap", json={"user_id": 7301, "taps": 3})
+    # Logging in counts as activity but isn't a tap sample
+    assert not await mock_redis.hexists("user:7302", "bot_last")
+    assert await mock_redis.hexists("user:7301", "bot_last")
+
+    # A user from yesterday's cohort who came back today
+    today = ActivityService.today()
+    yesterday = today - timedelta(days=1)
+    await mock_redis.setbit(ActivityService.day_key("signups", yesterday), 42, 1)
+    await mock_redis.setbit(ActivityService.day_key("signups", yesterday), 43, 1)
+    await mock_redis.setbit(ActivityService.day_key("dau", today), 42, 1)
+
+    assert (await client.get("/api/admin/analytics")).status_code == 403
+    response = await client.get("/api/admin/analytics", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["dau"] == 3
+    assert data["new_users"] == 2
+    assert data["unique_tappers"] == 1
+    assert data["d1_retention"] == {
+        "cohort": f"{yesterday:%Y-%m-%d}", "cohort_size": 2, "retained": 1, "rate": 0.5
+    }
+    assert data["d7_retention"]["cohort_size"] == 0
+
+    # Users created before indexes existed get one on their next tap
+    await mock_redis.hdel("user:7302", "uidx")
+    await client.post("/api/tap", json={"user_id": 7302, "taps": 1})
+    assert await mock_redis.hget("user:7302", "uidx") == "3"
+
+@pytest.mark.asyncio
+async def test_global_stats_from_sharded_counters(client, mock_redis):
+    from app.services.stats_service import STATS_SUMMARY_KEY
+
+    await client.post("/api/auth", json={"id": 7401, "first_name": "One"})
+    await client.post("/api/auth", json={"id": 7402, "first_name": "Two"})
+    await client.post("/api/tap", json={"user_id": 7401, "taps": 3})
+    await client.post("/api/tap", json={"user_id": 7402, "taps": 2})
+
+    data = (await client.get("/api/stats")).json()
+    assert data["players"] == 2
+    assert data["taps"] == 5
+    assert data["points_minted"] == 5
+    # The two users landed on different shards
+    assert len(await mock_redis.keys("stats:global:[0-9]*")) == 2
+
+    # Reads are served from the cached summary until it expires
+    await client.post("/api/tap", json={"user_id": 7401, "taps": 1})
+    assert (await client.get("/api/stats")).json()["taps"] == 5
+    await mock_redis.delete(STATS_SUMMARY_KEY)
+    assert (await client.get("/api/stats")).json()["taps"] == 6
+
+# --- AIRDROP TESTS ---
+
+@pytest.mark.asyncio
+async def test_snapshot_export_from_redis_resumes(client, mock_redis, tmp_path):
+    import gzip
+    import hashlib
+    from app.airdrop.snapshot import export_snapshot, redis_batches
+
+    for uid in (7501, 7502, 7503):
+        await client.post("/api/auth", json={"id": uid, "first_name": "Holder"})
+    await client.post("/api/tap", json={"user_id": 7502, "taps": 4})
+    task_id = next(iter(await mock_redis.hkeys("user:7503:tasks")))
+    await client.post(f"/api/tasks/7503/{task_id}/complete")
+    await client.post(f"/api/tasks/7503/{task_id}/claim")
+
+    output = str(tmp_path / "snapshot.ndjson.gz")
+
+    # The first run dies after its first chunk ...
+    def crashing(position):
+        async def batches():
+            async for rows, pos in redis_batches(mock_redis, position, 1):
+                yield rows, pos
+                if rows:
+                    raise RuntimeError("worker killed")
+        return batches()
+
+    with pytest.raises(RuntimeError):
+        await export_snapshot(crashing, output, compress=True, chunk_rows=1)
+
+    # ... and the second continues from its checkpoint
+    manifest = await export_snapshot(
+        lambda position: redis_batches(mock_redis, position, 1), output, compress=True, chunk_rows=1
+    )
+
+    with gzip.open(output, "rt") as f:
+        rows = {row["telegram_id"]: row for row in map(json.loads, f)}
+    assert manifest["rows"] == len(rows) == 3
+    assert rows[7502]["points"] == 4
+    assert rows[7503]["tasks_completed"] == 1
+    with open(output, "rb") as f:
+        assert manifest["sha256"] == hashlib.sha256(f.read()).hexdigest()
+
+def test_allocation_conserves_supply_under_caps(tmp_path):
+    from app.airdrop.allocation import allocate, load_snapshot, write_allocations, load_allocations
+    from app.core.config import ALLOCATION_CONFIG
+
+    snapshot = tmp_path / "snapshot.csv"
+    snapshot.write_text(
+        "telegram_id,points,level,friends_count,tasks_completed,is_premium\n"
+        "1,100000000,9,0,0,0\n"  # whale, capped
+        "2,40000,6,10,2,1\n"
+        "3,40000,6,0,0,0\n"
+        "4,999,2,3,1,0\n"  # below min_points
+        "5,7001,5,0,0,0\n"
+    )
+    columns = load_snapshot(str(snapshot))
+    config = {**ALLOCATION_CONFIG, "total_supply": 1_000_003, "max_share": 0.5}
+    allocation, summary = allocate(columns, config)
+
+    assert summary["allocated"] == allocation.sum() == 1_000_003
+    assert allocation[0] == 500_001
+    assert allocation[3] == 0
+    # Referrals, tasks and premium raise an otherwise equal user's share
+    assert allocation[1] > allocation[2] > allocation[4] > 0
+
+    # Caps too tight to hand out the supply leave the rest unallocated, not lost
+    allocation, summary = allocate(columns, {**config, "max_share": 0.1})
+    assert summary["allocated"] == 4 * 100_000 and summary["unallocated"] == 600_003
+
+    write_allocations(str(tmp_path / "alloc.npz"), columns["telegram_id"], allocation, summary)
+    ids, amounts, saved = load_allocations(str(tmp_path / "alloc.npz"))
+    assert list(ids) == [1, 2, 3, 4, 5] and saved == summary
+
+@pytest.mark.asyncio
+async def test_merkle_proofs_served_from_file(client, tmp_path, monkeypatch):
+    import hashlib
+    import numpy as np
+    from app.airdrop.merkle import build_tree, verify_proof
+
+    # Odd leaf count: the last node is promoted without a sibling
+    ids = np.array([11, 22, 33, 44, 55], dtype=np.int64)
+    amounts = np.array([5, 10**17, 7, 1, 3], dtype=np.int64)
+    path = str(tmp_path / "proofs.bin")
+    root = build_tree(ids, amounts, path)
+
+    assert (await client.get("/api/airdrop/proof/22")).status_code == 503
+    monkeypatch.setattr("app.api.airdrop.AIRDROP_PROOF_FILE", path)
+
+    for telegram_id, amount in zip(ids, amounts):
+        data = (await client.get(f"/api/airdrop/proof/{telegram_id}")).json()
+        assert data["amount"] == str(amount)
+        assert data["root"] == "0x" + root.hex()
+        leaf = bytes.fromhex(data["leaf"][2:])
+        assert verify_proof(leaf, [bytes.fromhex(p[2:]) for p in data["proof"]], root)
+        # The leaf encoding the claim contract recomputes
+        assert leaf == hashlib.sha256(
+            int(telegram_id).to_bytes(8, "big") + int(amount).to_bytes(32, "big")
+        ).digest()
+
+    assert (await client.get("/api/airdrop/proof/23")).status_code == 404
+
+# --- LEDGER TESTS ---
+
+@pytest.mark.asyncio
+async def test_ledger_records_every_balance_change(client, mock_redis, monkeypatch):
+    from app.core import ledger_worker
+    from app.services.base import RedisKeys
+    from app.services.ledger_service import LEDGER_REASONS
+
+    user_id = 7601
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Audited"})
+    await client.post("/api/tap", json={"user_id": user_id, "taps": 5})
+    tasks = (await client.get(f"/api/tasks/{user_id}")).json()["tasks"]
+    await client.post(f"/api/tasks/{user_id}/{tasks[0]['id']}/complete")
+    await client.post(f"/api/tasks/{user_id}/{tasks[0]['id']}/claim")
+    await mock_redis.hincrby(f"user:{user_id}", "points", 1000)  # Outside the game, unrecorded
+    await client.post("/api/upgrade", json={"user_id": user_id, "upgrade_type": "multitap"})
+
+    buffer = RedisKeys.ledger_buffer(RedisKeys.ledger_shard(user_id))
+    entries = [line.split("\t") for line in await mock_redis.lrange(buffer, 0, -1)]
+    assert [int(e[2]) for e in entries] == [
+        LEDGER_REASONS["tap"], LEDGER_REASONS["task_reward"], LEDGER_REASONS["upgrade"]
+    ]
+    assert entries[1][3] == tasks[0]["id"]
+    balance = int(await mock_redis.hget(f"user:{user_id}", "points"))
+    assert sum(int(e[1]) for e in entries) == balance - 1000
+
+    # The writer drains the buffer; a batch that fails stays pending and is retried
+    written = []
+    def persist(conn, batch_id, shard, lines):
+        if not written:
+            written.append(None)
+            raise RuntimeError("postgres down")
+        written.append((batch_id, lines))
+        return True
+    monkeypatch.setattr(ledger_worker, "persist_batch", persist)
+
+    shard = RedisKeys.ledger_shard(user_id)
+    with pytest.raises(RuntimeError):
+        await ledger_worker.flush_shard(mock_redis, None, shard)
+    assert not await mock_redis.exists(buffer)
+    assert await ledger_worker.flush_shard(mock_redis, None, shard) == 3
+    assert len(written[1][1]) == 3
+    assert not await mock_redis.smembers(ledger_worker.pending_key(shard))
+
+# --- SEASON TESTS ---
+
+@pytest.mark.asyncio
+async def test_new_season_starts_fresh_and_archives_old_keys(client, mock_redis, monkeypatch):
+    from app.core import season_worker
+    from app.services.base import RedisKeys
+    from app.services.season_service import SeasonService
+
+    referrer, friend = 7701, 7702
+    await client.post("/api/auth", json={"id": referrer, "first_name": "Veteran"})
+    await client.post("/api/auth", json={"id": friend, "first_name": "Friend"})
+    await client.post("/api/tap", json={"user_id": referrer, "taps": 20})
+    await mock_redis.hset(RedisKeys.user_referral(referrer), mapping={"friends_count": 1, "total_earned": 2500})
+    old_points = int(await mock_redis.hget(f"user:{referrer}", "points"))
+    assert old_points > 0
+    board = (await client.get("/api/leaderboard", params={"limit": 10})).json()
+    assert board["entries"][0]["points"] == old_points
+
+    assert await SeasonService.start_new_season(mock_redis) == 1
+
+    # Same id, fresh keys; the referral graph is shared between seasons
+    res = await client.post("/api/auth", json={"id": referrer, "first_name": "Veteran"})
+    assert res.status_code == 200
+    assert await mock_redis.exists(f"user:1:{referrer}")
+    assert int(await mock_redis.hget(f"user:1:{referrer}", "points")) == 0
+    assert await mock_redis.hget(RedisKeys.user_referral(referrer), "friends_count") == "1"
+    assert await mock_redis.zscore(RedisKeys.leaderboard(), str(referrer)) == 0
+    # Not the previous season's page from the cache
+    board = (await client.get("/api/leaderboard", params={"limit": 10})).json()
+    assert [(e["user_id"], e["points"]) for e in board["entries"]] == [(str(referrer), 0)]
+
+    # Season 0 is untouched until the archiver runs
+    assert int(await mock_redis.hget(f"user:{referrer}", "points")) == old_points
+    assert await mock_redis.zscore("leaderboard:points", str(referrer)) == old_points
+
+    archived = []
+    monkeypatch.setattr(season_worker, "write_archive_rows", lambda conn, rows: archived.extend(rows))
+    assert await season_worker.archive_redis_pass(mock_redis, None, 0, rate=1e9) == 2
+
+    by_id = {row[1]: row for row in archived}
+    assert by_id[referrer][2] == old_points
+    assert json.loads(by_id[referrer][4])["season"] == 0
+    assert not await mock_redis.exists(f"user:{referrer}", f"user:{referrer}:tasks", "leaderboard:points")
+    assert await mock_redis.exists(RedisKeys.user_referral(referrer), f"user:1:{referrer}") == 2
+
+@pytest.mark.asyncio
+async def test_returning_players_keep_their_activity_index(client, mock_redis, monkeypatch):
+    from app.core import season_worker
+    from app.services.activity_service import ActivityService
+    from app.services.base import RedisKeys
+    from app.services.season_service import SeasonService
+    from app.services.stats_service import StatsService
+    from app.services.tiering_service import TieringService
+
+    resident, evicted = 7801, 7802
+    await client.post("/api/auth", json={"id": resident, "first_name": "Resident"})
+    uidx = await mock_redis.hget(f"user:{resident}", "uidx")
+    # Both played season 0 before the index was kept outside the profile
+    await mock_redis.delete(RedisKeys.user_index_bucket(resident))
+    snapshot = {"season": 0, "profile": {"points": "900", "uidx": "500"}, "referral_summary": {}, "friends": {}}
+    monkeypatch.setattr(
+        TieringService, "load_raw_states",
+        staticmethod(lambda ids: {str(i): snapshot for i in ids if str(i) == str(evicted)})
+    )
+
+    assert await SeasonService.start_new_season(mock_redis) == 1
+    monkeypatch.setattr(season_worker, "write_archive_rows", lambda conn, rows: None)
+    assert await season_worker.archive_redis_pass(mock_redis, None, 0, rate=1e9) == 1
+
+    await client.post("/api/auth", json={"id": resident, "first_name": "Resident"})
+    await client.post("/api/bootstrap", json={"id": evicted, "first_name": "Evicted"})
+    assert await mock_redis.hget(f"user:1:{resident}", "uidx") == uidx
+    assert await mock_redis.hget(f"user:1:{evicted}", "uidx") == "500"
+
+    # Neither is a new player or signup again
+    assert (await StatsService.aggregate())["players"] == 1
+    assert await mock_redis.bitcount(ActivityService.day_key("signups", ActivityService.today())) == 1
+    assert await mock_redis.getbit(ActivityService.day_key("dau", ActivityService.today()), 500) == 1
+
+@pytest.mark.asyncio
+async def test_referral_after_a_season_bump_creates_the_referrers_profile(client, mock_redis):
+    from app.services.season_service import SeasonService
+
+    referrer, friend = 7901, 7902
+    await client.post("/api/auth", json={"id": referrer, "first_name": "Veteran"})
+    uidx = await mock_redis.hget(f"user:{referrer}", "uidx")
+    code = (await client.get(f"/api/referral/?user_id={referrer}")).json()["referral_info"]["referral_code"]
+
+    assert await SeasonService.start_new_season(mock_redis) == 1
+    res = await client.post(
+        "/api/referral/process", params={"referrer_code": code, "new_user_id": friend, "first_name": "Friend"}
+    )
+    assert res.status_code == 200
+
+    # A whole profile with the old index, not a hash holding only the reward
+    profile = await mock_redis.hgetall(f"user:1:{referrer}")
+    assert profile["points"] == "2500" and profile["max_energy"] == "1000"
+    assert profile["uidx"] == uidx
+
+    res = await client.post("/api/auth", json={"id": referrer, "first_name": "Veteran"})
+    assert res.json()["gameState"]["points"] == 2500
+    assert res.json()["gameState"]["energy"] == 1000
+
+# --- BOOTSTRAP TESTS ---
+
+@pytest.mark.asyncio
+async def test_bootstrap_returns_everything_for_app_open(client, mock_redis):
+    user_id = 7801
+    res = await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Opener"})
+    assert res.status_code == 200
+    data = res.json()
+    assert data["gameState"]["points"] == 0
+    assert data["referral"] == {"referral_code": None, "link": None, "friends_count": 0, "total_earned": 0}
+    # Same tasks and rewards as the dedicated endpoint creates
+    overview = (await client.get(f"/api/tasks/{user_id}")).json()
+    assert sorted(t["id"] for t in data["tasks"]["tasks"]) == sorted(t["id"] for t in overview["tasks"])
+    assert data["tasks"]["daily_rewards"] == overview["daily_rewards"]
+
+    # Returning after an hour offline: passive income and energy regen are applied
+    await mock_redis.hset(f"user:{user_id}", mapping={
+        "profit_per_hour": 3600, "last_passive_sync": int(time.time()) - 3600,
+        "energy": 0, "last_sync_time": int(time.time()) - 100,
+    })
+    await client.get("/api/referral/", params={"user_id": user_id})
+    data = (await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Opener"})).json()
+    assert data["passive"]["earned"] == data["gameState"]["points"]
+    assert 3599 <= data["passive"]["earned"] <= 3601
+    assert 100 <= data["gameState"]["energy"] <= 101
+    assert data["referral"]["link"].endswith(data["referral"]["referral_code"])
+    assert int(await mock_redis.hget(f"user:{user_id}", "points")) == data["gameState"]["points"]
+    assert await mock_redis.zscore("leaderboard:points", str(user_id)) == data["gameState"]["points"]
+
+# --- SESSION TESTS ---
+
+def signed_init_data(bot_token: str, user: dict, auth_date: int) -> str:
+    import hashlib, hmac
+    from urllib.parse import urlencode
+    fields = {"auth_date": str(auth_date), "query_id": "AAE", "user": json.dumps(user)}
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+@pytest.mark.asyncio
+async def test_sessions_from_verified_init_data(client, mock_redis, monkeypatch):
+    from app.core import sessions
+    monkeypatch.setattr(sessions, "BOT_TOKEN", "123:abc")
+    monkeypatch.setattr(sessions, "SESSION_SECRET", "session-secret")
+    monkeypatch.setattr(sessions, "TELEGRAM_AUTH_REQUIRED", True)
+
+    user = {"id": 7901, "first_name": "Signed", "is_premium": True}
+    init_data = signed_init_data("123:abc", user, int(time.time()))
+    body = {"id": 1, "first_name": "Impostor"}
+
+    # Unsigned / tampered initData is refused
+    assert (await client.post("/api/bootstrap", json=body)).status_code == 401
+    tampered = init_data.replace("Signed", "Forged")
+    res = await client.post("/api/bootstrap", json=body, headers={"X-Telegram-Init-Data": tampered})
+    assert res.status_code == 401
+
+    # The signed profile wins over the body
+    res = await client.post("/api/bootstrap", json=body, headers={"X-Telegram-Init-Data": init_data})
+    assert res.status_code == 200
+    data = res.json()
+    assert data["user"]["id"] == 7901 and data["user"]["is_premium"] is True
+    token = data["session"]
+    assert sessions.verify_session(token) == 7901
+
+    auth = {"Authorization": f"Bearer {token}"}
+    assert (await client.post("/api/tap", json={"user_id": 7901, "taps": 1}, headers=auth)).status_code == 200
+    assert (await client.post("/api/tap", json={"user_id": 7902, "taps": 1}, headers=auth)).status_code == 403
+    assert (await client.post("/api/tap", json={"user_id": 7901, "taps": 1})).status_code == 401
+    assert (await client.get("/api/tasks/7901", headers=auth)).status_code == 200
+
+    forged = token.replace("7901.", "7902.", 1)
+    res = await client.post("/api/tap", json={"user_id": 7902, "taps": 1}, headers={"Authorization": f"Bearer {forged}"})
+    assert res.status_code == 401
+    assert sessions.verify_session(token, now=int(time.time()) + sessions.SESSION_TTL_SECONDS + 1) is None
+
+    # Forged tokens are not cached, so they can't push out the ones in use
+    monkeypatch.setattr(sessions, "SESSION_CACHE_SIZE", 4)
+    for i in range(10):
+        assert sessions.verify_session(f"{i}.{i}.forged") is None
+    assert (token, "session-secret") in sessions._verified
+
+# --- FAST JSON TESTS ---
+
+@pytest.mark.asyncio
+async def test_fast_json_responses_match_validated_ones(client, mock_redis, monkeypatch):
+    from app.core import responses
+    from app.schemas import TapResponse
+
+    user_id = 8001
+    await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Fast"})
+    await client.get("/api/referral/", params={"user_id": user_id})
+    # Sorted-set / task timestamps don't change between the two reads
+    paths = [
+        ("get", f"/api/tasks/{user_id}", None),
+        ("get", "/api/referral/", {"user_id": user_id}),
+        ("get", "/api/leaderboard", {"user_id": user_id}),
+    ]
+
+    async def fetch_all():
+        return [
+            (await client.request(method, path, params=params)).json()
+            for method, path, params in paths
+        ]
+
+    validated = await fetch_all()
+    monkeypatch.setattr(responses, "FAST_JSON_RESPONSES", True)
+    assert await fetch_all() == validated
+
+    # Extra keys returned by the service are dropped, as response_model did
+    res = await client.post("/api/tap", json={"user_id": user_id, "taps": 3})
+    assert res.headers["content-type"] == "application/json"
+    assert set(res.json()) == set(TapResponse.model_fields)
+
+# --- BINARY WIRE TESTS ---
+
+@pytest.mark.asyncio
+async def test_binary_tap_protocol_sends_state_deltas(client, mock_redis):
+    from app.core import wire
+
+    user_id = 8101
+    await client.post("/api/auth", json={"id": user_id, "first_name": "Compact"})
+    headers = {"Content-Type": wire.WIRE_MEDIA_TYPE}
+
+    async def tap(taps, ack):
+        res = await client.post("/api/tap", content=wire.TAP_REQUEST.pack(user_id, taps, ack), headers=headers)
+        assert res.headers["content-type"] == wire.WIRE_MEDIA_TYPE
+        return res.content
+
+    # First call: no acknowledged version, so the full state comes along
+    frame = await tap(5, 0)
+    flags, version = wire.RESPONSE_HEADER.unpack_from(frame)
+    points, energy = wire.TAP_BODY.unpack_from(frame, wire.RESPONSE_HEADER.size)
+    assert flags & wire.HAS_STATE and points == 5 and energy == 995
+    state = wire.TAP_STATE.unpack_from(frame, wire.RESPONSE_HEADER.size + wire.TAP_BODY.size)
+    assert state == (1000, 1, 1, 1, 1, 0, 0)
+    assert len(frame) == wire.RESPONSE_HEADER.size + wire.TAP_BODY.size + wire.TAP_STATE.size
+
+    # Acknowledged: only points and energy
+    frame = await tap(5, version)
+    assert len(frame) == wire.RESPONSE_HEADER.size + wire.TAP_BODY.size
+    assert wire.TAP_BODY.unpack_from(frame, wire.RESPONSE_HEADER.size)[0] == 10
+
+    # An upgrade bumps the version, so the next response carries the new levels
+    await mock_redis.hset(f"user:{user_id}", "points", 10_000)
+    await client.post("/api/upgrade", json={"user_id": user_id, "upgrade_type": "multitap"})
+    frame = await tap(1, version)
+    flags, new_version = wire.RESPONSE_HEADER.unpack_from(frame)
+    assert flags & wire.HAS_STATE and new_version != version
+    assert wire.TAP_STATE.unpack_from(frame, wire.RESPONSE_HEADER.size + wire.TAP_BODY.size)[2] == 2
+
+    res = await client.post("/api/sync-passive", content=wire.PASSIVE_REQUEST.pack(user_id, new_version), headers=headers)
+    flags, _ = wire.RESPONSE_HEADER.unpack_from(res.content)
+    assert not flags & wire.HAS_STATE and len(res.content) == wire.RESPONSE_HEADER.size + wire.PASSIVE_BODY.size
+
+    # Profit per hour is whatever the cards add up to, beyond 32 bits or below zero
+    await client.post("/api/buy-card", json={"user_id": user_id, "cost": 0, "profit_increase": -(2 ** 33)})
+    res = await client.post("/api/sync-passive", content=wire.PASSIVE_REQUEST.pack(user_id, new_version), headers=headers)
+    assert wire.PASSIVE_STATE.unpack_from(res.content, wire.RESPONSE_HEADER.size + wire.PASSIVE_BODY.size) == (-(2 ** 33),)
+    frame = await tap(1, 0)
+    assert wire.TAP_STATE.unpack_from(frame, wire.RESPONSE_HEADER.size + wire.TAP_BODY.size)[-1] == -(2 ** 33)
+
+    assert (await client.post("/api/tap", content=b"\x01\x02", headers=headers)).status_code == 400
+    res = await client.post("/api/tap", content=wire.TAP_REQUEST.pack(user_id, 5000, 0), headers=headers)
+    assert res.status_code == 422
+
+# --- CLUSTER KEY LAYOUT TESTS ---
+
+@pytest.mark.asyncio
+async def test_hash_tagged_layout_keeps_each_user_in_one_slot(client, mock_redis, monkeypatch):
+    from redis.crc import key_slot
+    from app.services.base import RedisKeys
+    from app.services.referral_index import ReferralIndex
+
+    monkeypatch.setattr("app.services.base._hash_tags", True)
+    referrer, friend = 8201, 8202
+    await client.post("/api/bootstrap", json={"id": referrer, "first_name": "Tagged"})
+    info = await client.get("/api/referral/", params={"user_id": referrer})
+    code = info.json()["referral_info"]["referral_code"]
+    await client.post("/api/bootstrap", json={"id": friend, "first_name": "Friend"})
+    res = await client.post(
+        "/api/referral/process",
+        params={"referrer_code": code, "new_user_id": friend, "first_name": "Friend"},
+    )
+    assert res.status_code == 200, res.text
+    await client.post("/api/tap", json={"user_id": friend, "taps": 3})
+
+    keys = await mock_redis.keys("*")
+    assert "referral_code_to_user" not in keys and "referral_links" not in keys
+    assert await ReferralIndex.lookup(code) == str(referrer)
+    for user_id in (referrer, friend):
+        user_keys = [k for k in keys if k.startswith("user:") and f"{{{user_id}}}" in k]
+        assert {k.rsplit(":", 1)[-1] for k in user_keys} >= {f"{{{user_id}}}", "tasks", "stats", "referral"}
+        assert len({key_slot(k.encode()) for k in user_keys}) == 1
+    assert not [k for k in keys if k.startswith("user:") and "{" not in k]
+
+    assert RedisKeys.profile_user_id(RedisKeys.user(friend)) == str(friend)
+    assert RedisKeys.profile_user_id(RedisKeys.user_tasks(friend)) is None
+    assert RedisKeys.tagged("user:7:tasks") == "user:{7}:tasks"
+    assert RedisKeys.tagged("user:3:7:stats") == "user:3:{7}:stats"
+
+# --- READ REPLICA TESTS ---
+
+@pytest.mark.asyncio
+async def test_reads_use_a_replica_only_once_it_has_the_users_writes(client, mock_redis, monkeypatch):
+    from app.core.replicas import HEARTBEAT_KEY, Replica, replica_set
+    from app.services.task_service import TaskService
+
+    replica_server = fakeredis.FakeServer()
+    replica = Replica("replica-0", fakeredis.aioredis.FakeRedis(server=replica_server, decode_responses=True))
+    monkeypatch.setattr(replica_set, "replicas", [replica])
+    monkeypatch.setattr(replica_set, "start", lambda: None)
+
+    user_id = 8301
+    await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Replicated"})
+    await client.get(f"/api/tasks/{user_id}")
+    # "Replicate" the user, with a balance that shows where reads are served from
+    for key in TaskService.get_keys(user_id).values():
+        await replica.client.hset(key, mapping=await mock_redis.hgetall(key))
+    await replica.client.hset(TaskService.get_keys(user_id)["user"], "points", 4242)
+    await replica.client.set(HEARTBEAT_KEY, f"{time.time():.6f}")
+    await replica_set.check()
+    assert replica.heartbeat is not None
+
+    # Wrote just now: the replica may not have it yet
+    assert (await client.get(f"/api/tasks/{user_id}")).json()["coins"] == 0
+
+    # Last write well before the replica's heartbeat
+    await mock_redis.zadd("users_last_seen", {str(user_id): int(time.time()) - 30})
+    assert (await client.get(f"/api/tasks/{user_id}")).json()["coins"] == 4242
+
+    # A failing replica is dropped and the primary answers
+    replica_server.connected = False
+    assert (await client.get(f"/api/tasks/{user_id}")).json()["coins"] == 0
+    assert replica.heartbeat is None
+
+    # A lagging one stays out after the next check
+    replica_server.connected = True
+    await replica.client.set(HEARTBEAT_KEY, f"{time.time() - 60:.6f}")
+    await replica_set.check()
+    assert replica.heartbeat is None
+
+# --- REFERRAL INDEX TESTS ---
+
+@pytest.mark.asyncio
+async def test_referral_index_buckets_and_migrates_the_legacy_hashes(client, mock_redis, monkeypatch):
+    from app.services.base import RedisKeys
+    from app.services.referral_index import ReferralIndex
+
+    monkeypatch.setattr("app.services.referral_index.REFERRAL_INDEX_BUCKETS", 4)
+    monkeypatch.setattr("app.services.base.REFERRAL_INDEX_BUCKETS", 4)
+
+    # Written before the buckets existed: still found, then moved in batches
+    for user_id in range(100, 110):
+        await mock_redis.hset("referral_code_to_user", f"CODE{user_id}", user_id)
+        await mock_redis.hset("referral_links", user_id, f"CODE{user_id}")
+    assert await ReferralIndex.lookup("CODE105") == "105"
+
+    assert await ReferralIndex.migrate_legacy(mock_redis, batch_size=3) == 20
+    assert not await mock_redis.exists("referral_code_to_user", "referral_links")
+    assert await ReferralIndex.lookup("CODE105") == "105"
+    assert await ReferralIndex.lookup("NOPE") is None
+    # Ids are bucketed by id % buckets and stored under id // buckets
+    assert await mock_redis.hget(RedisKeys.referral_link_bucket(105), 105 // 4) == "CODE105"
+    assert len(await mock_redis.keys("reflink:*")) == 4
+
+    # New codes go straight to the buckets
+    info = await client.get("/api/referral/", params={"user_id": 8401})
+    code = info.json()["referral_info"]["referral_code"]
+    assert await mock_redis.hget(RedisKeys.referral_code_bucket(code), code) == "8401"
+    assert not await mock_redis.exists("referral_code_to_user")
+
+# --- RATE LIMIT TESTS ---
+
+@pytest.mark.asyncio
+async def test_rate_limits_per_user_and_ip(client, mock_redis, monkeypatch):
+    from collections import OrderedDict
+    from app.core import sessions
+    from app.core.rate_limit import LIMITED, rate_limiter
+
+    monkeypatch.setattr(sessions, "SESSION_SECRET", "session-secret")
+    monkeypatch.setattr(rate_limiter, "limits", {"/api/tap": {"user": (1, 2), "ip": (0.1, 3)}})
+    monkeypatch.setattr(rate_limiter, "_empty_until", OrderedDict())
+    alice, bob = 8501, 8502
+    auth = {}
+    for user_id in (alice, bob):
+        await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Limited"})
+        auth[user_id] = {"Authorization": f"Bearer {sessions.issue_session(user_id)[0]}"}
+
+    async def tap(user_id):
+        return await client.post("/api/tap", json={"user_id": user_id, "taps": 1}, headers=auth[user_id])
+
+    assert [(await tap(alice)).status_code for _ in range(2)] == [200, 200]
+    res = await tap(alice)
+    assert res.status_code == 429 and res.headers["Retry-After"] == "1"
+    # Answered without Redis until the bucket refills
+    local = LIMITED.get(route="/api/tap", where="local")
+    assert (await tap(alice)).status_code == 429
+    assert LIMITED.get(route="/api/tap", where="local") == local + 1
+
+    # Bob has their own user bucket but shares the IP's, which has one token left
+    assert (await tap(bob)).status_code == 200
+    assert (await tap(bob)).status_code == 429
+    # The refused request took nothing from Bob's bucket
+    bucket = await mock_redis.hgetall(f"ratelimit:/api/tap:user:{bob}")
+    assert 1 <= float(bucket["tokens"]) < 1.1
+
+    assert (await client.get(f"/api/tasks/{bob}", headers=auth[bob])).status_code == 200
+
+# --- BOT DETECTION TESTS ---
+
+@pytest.mark.asyncio
+async def test_regular_tapper_is_flagged_and_throttled(client, mock_redis, monkeypatch):
+    from app.services import bot_detector
+    from app.services.bot_detector import BotDetector
+
+    # A human sends varying taps; an auto-clicker the same taps every 2 seconds
+    now = time.time() - 1000
+    human, clicker = {}, {}
+    for i in range(100):
+        for data, taps in ((human, 5 + i * 7 % 11), (clicker, 20)):
+            fields, flagged = BotDetector.observe(data, taps, now + i * 2)
+            data.update({k: str(v) for k, v in fields.items()})
+    assert "bot_flag" not in human
+    assert clicker["bot_flag"] == "regular"
+    assert len(clicker["bot_hours"]) == 48 and len(clicker["bot_tps"]) == 16
+
+    # One request short of being flagged, via the tap endpoint
+    user_id = 8601
+    await client.post("/api/bootstrap", json={"id": user_id, "first_name": "Clicker"})
+    del clicker["bot_flag"]
+    await mock_redis.hset(f"user:{user_id}", mapping={**clicker, "bot_repeats": 28})
+
+    async def tap_after(seconds):
+        await mock_redis.hset(f"user:{user_id}", "bot_last", int((time.time() - seconds) * 1000))
+        return (await client.post("/api/tap", json={"user_id": user_id, "taps": 20})).json()["points"]
+
+    points = await tap_after(2)
+    assert await mock_redis.hget(f"user:{user_id}", "bot_flag") is None
+    assert await tap_after(2) == points + 20
+    assert await mock_redis.zscore(bot_detector.BOT_REVIEW_KEY, str(user_id)) is not None
+
+    # Flagged and throttled: at most BOT_THROTTLE_TPS per second since the last request
+    monkeypatch.setattr(bot_detector, "BOT_THROTTLE_TPS", 1.5)
+    assert await tap_after(2) == points + 20 + 3
+
+    monkeypatch.setattr("app.api.admin.ADMIN_TOKEN", "admin-secret")
+    admin = {"X-Admin-Token": "admin-secret"}
+    flagged = (await client.get("/api/admin/bots", headers=admin)).json()
+    assert [(f["user_id"], f["reasons"]) for f in flagged] == [(user_id, ["regular"])]
+    assert (await client.delete(f"/api/admin/bots/{user_id}", headers=admin)).status_code == 200
+    assert not await mock_redis.hexists(f"user:{user_id}", "bot_repeats")
+    assert (await client.delete(f"/api/admin/bots/{user_id}", headers=admin)).status_code == 404
+
+# --- REFERRAL FARM TESTS ---
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("season", [0, 1])
+async def test_referral_farms_are_flagged_from_the_graph(mock_redis, monkeypatch, season):
+    from app.airdrop import referral_farms
+    from app.services.base import CURRENT_SEASON_KEY, RedisKeys
+
+    day = 86400
+    start = int(time.time()) - 30 * day
+    # The job reads the season from Redis, like every other process
+    await mock_redis.set(CURRENT_SEASON_KEY, season)
+    server = mock_redis.connection_pool.connection_kwargs["server"]
+    monkeypatch.setattr(
+        referral_farms, "new_redis_client", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+
+    async def refer(referrer, referee, joined_at, name, tapped):
+        log = {"user_id": referee, "first_name": name, "earned": 2500, "joined_at": joined_at}
+        await mock_redis.hset(RedisKeys.user_referrals(referrer), referee, json.dumps(log))
+        profile = {"level": 1, "total_taps": 40 if tapped else 0}
+        await mock_redis.hset(RedisKeys.user(referee, season), mapping=profile)
+
+    # Organic: friends over weeks, with names of their own, who play
+    for i, name in enumerate(["Ali", "Sara", "Reza", "Mina", "Omid", "Neda", "Kian", "Lena"]):
+        await refer(1000, 1001 + i, start + i * 3 * day, name, tapped=i % 3 != 0)
+    # Star: 20 silent "user<n>" accounts in ten minutes
+    for i in range(20):
+        await refer(2000, 2001 + i, start + i * 30, f"user{i}", tapped=False)
+    # Chain: each fake account refers the next one within the hour
+    for i in range(8):
+        await refer(3000 + i, 3001 + i, start + i * 60, f"Bot_{i}", tapped=False)
+    # Too small to judge
+    await refer(4000, 4001, start, "x1", tapped=False)
+
+    edges = await referral_farms.load_edges(referral_farms.redis_edges(mock_redis, 5))
+    result = referral_farms.score_clusters(edges)
+    assert sorted(result["root"].tolist()) == [2000, 3000]
+    assert sorted(result["size"].tolist()) == [9, 21]
+
+    summary = await referral_farms.run("redis", 5, False, referral_farms.REFERRAL_FARM_CONFIG)
+    assert summary["edges"] == 8 + 20 + 8 + 1
+    assert (summary["clusters"], summary["flagged_clusters"]) == (4, 2)
+    assert await mock_redis.zscore(referral_farms.FARM_USERS_KEY, "3005") == 3000
+    assert await mock_redis.zscore(referral_farms.FARM_USERS_KEY, "1003") is None
+    farm = await mock_redis.hgetall(referral_farms.farm_key(2000))
+    assert farm["size"] == "21" and float(farm["zero_taps"]) == 1.0 and float(farm["names"]) == 1.0
+
+    # The next run's flags replace these; clusters no longer flagged are dropped
+    star = result["root"] == 2000
+    in_star = result["member_roots"] == 2000
+    only_star = {
+        **{name: result[name][star] for name in ("root", "size", "score", "burst", "zero_taps", "names")},
+        "members": result["members"][in_star], "member_roots": result["member_roots"][in_star],
+    }
+    await referral_farms.write_flags(mock_redis, only_star)
+    assert await mock_redis.zrange(referral_farms.FARM_CLUSTERS_KEY, 0, -1) == ["2000"]
+    assert await mock_redis.zscore(referral_farms.FARM_USERS_KEY, "2005") == 2000
+    assert await mock_redis.zscore(referral_farms.FARM_USERS_KEY, "3005") is None
+    assert not await mock_redis.exists(referral_farms.farm_key(3000), f"{referral_farms.FARM_USERS_KEY}:next")
+
+    await referral_farms.write_flags(mock_redis, referral_farms.score_clusters(referral_farms.concat([])))
+    assert not await mock_redis.exists(
+        referral_farms.FARM_USERS_KEY, referral_farms.FARM_CLUSTERS_KEY, referral_farms.farm_key(2000)
+    )
@@ -41,26 +41,26 @@ function AppContent() {
     expand();
   }, [expand]);
 
-  // 2. PASSIVE INCOME SYNC (Runs Once on Mount)
+  // 2. APP OPEN: login, regen and passive income sync in one request (Runs Once on Mount)
   useEffect(() => {
     // Only run if we have a user and haven't synced yet
     if (user?.id && !hasSyncedPassive.current) {
       hasSyncedPassive.current = true;
 
       api
-        .syncPassive(user.id)
+        .bootstrap(user)
         .then((data) => {
           // Update the store with the new points/profit info
-          setGameState(data);
+          setGameState(data.gameState);
 
           // If the user earned coins while offline, show the modal
-          if (data.earned > 0) {
-            setPassiveMod({ isOpen: true, earned: data.earned });
+          if (data.passive.earned > 0) {
+            setPassiveMod({ isOpen: true, earned: data.passive.earned });
           }
         })
-        .catch((e) => console.error("Passive Sync Error:", e));
+        .catch((e) => console.error("Bootstrap Error:", e));
     }
-  }, [user?.id, setGameState]);
+  }, [user, setGameState]);
 
   // 3. SET GAME READY (Delays Level Up checks)
   useEffect(() => {
@@ -1,4 +1,5 @@
 import axios from "axios";
+import WebApp from "@twa-dev/sdk";
 import type {
   UserTasksResponse,
   TaskUpdateResponse,
@@ -6,6 +7,8 @@ import type {
   DailyRewardClaimResponse,
   CoinsResponse,
   ReferralResponse,
+  GlobalStats,
+  BootstrapResponse,
 } from "../types";
 
 const VITE_API_URL = import.meta.env.VITE_API_URL;
@@ -21,18 +24,88 @@ const apiClient = axios.create({
   },
 });
 
+// Session token issued by /auth or /bootstrap against Telegram's signed initData
+let sessionToken: string | null = null;
+let markSessionReady: () => void = () => {};
+// Settles once the app-open request has answered, with or without a session
+const sessionReady = new Promise<void>((resolve) => (markSessionReady = resolve));
+
+apiClient.interceptors.request.use((config) => {
+  if (sessionToken) {
+    config.headers.Authorization = `Bearer ${sessionToken}`;
+  }
+  return config;
+});
+
+// --- Compact binary frames for /tap and /sync-passive (backend app/core/wire.py) ---
+const WIRE_MEDIA_TYPE = "application/x-airdrop-tap";
+const HAS_STATE = 0x01;
+// Last state version each endpoint sent; its state block is only resent when it changes
+const ackVersions: Record<string, number> = { "/tap": 0, "/sync-passive": 0 };
+
+const postWire = async (url: string, body: ArrayBuffer): Promise<DataView> => {
+  const response = await apiClient.post(url, body, {
+    headers: { "Content-Type": WIRE_MEDIA_TYPE },
+    responseType: "arraybuffer",
+  });
+  const view = new DataView(response.data);
+  // Header: flags u8, state_version u32 (little-endian throughout)
+  ackVersions[url] = view.getUint32(1, true);
+  return view;
+};
+
+// Empty outside Telegram (local development)
+const initDataHeaders = () =>
+  WebApp.initData ? { "X-Telegram-Init-Data": WebApp.initData } : {};
+
 export const api = {
   login: async (user: any) => {
-    const response = await apiClient.post("/auth", user);
-    return response.data;
+    try {
+      const response = await apiClient.post("/auth", user, {
+        headers: initDataHeaders(),
+      });
+      sessionToken = response.data.session ?? sessionToken;
+      return response.data;
+    } finally {
+      markSessionReady();
+    }
   },
 
+  // Game state, passive income, tasks and referral summary in one round trip
+  bootstrap: async (user: any): Promise<BootstrapResponse> => {
+    try {
+      const response = await apiClient.post("/bootstrap", user, {
+        headers: initDataHeaders(),
+      });
+      sessionToken = response.data.session ?? sessionToken;
+      return response.data;
+    } finally {
+      markSessionReady();
+    }
+  },
+
+  // Returns the changed part of the GameState (levels only when they changed)
   syncTaps: async (userId: number, taps: number) => {
-    const response = await apiClient.post("/tap", {
-      user_id: userId,
-      taps: taps,
-    });
-    return response.data; // This is the updated GameState
+    const request = new DataView(new ArrayBuffer(14));
+    request.setBigUint64(0, BigInt(userId), true);
+    request.setUint16(8, taps, true);
+    request.setUint32(10, ackVersions["/tap"], true);
+    const view = await postWire("/tap", request.buffer);
+
+    const state: Record<string, number> = {
+      points: Number(view.getBigInt64(5, true)),
+      energy: view.getUint32(13, true),
+    };
+    if (view.getUint8(0) & HAS_STATE) {
+      state.maxEnergy = view.getUint32(17, true);
+      state.level = view.getUint16(21, true);
+      state.multitapLevel = view.getUint16(23, true);
+      state.energyLimitLevel = view.getUint16(25, true);
+      state.rechargeSpeedLevel = view.getUint16(27, true);
+      state.tapBotLevel = view.getUint16(29, true);
+      state.profitPerHour = Number(view.getBigInt64(31, true));
+    }
+    return state;
   },
 
   buyUpgrade: async (userId: number, upgradeType: string) => {
@@ -108,14 +181,45 @@ export const api = {
     return response.data;
   },
   syncPassive: async (userId: number) => {
-    const response = await apiClient.post(`/sync-passive`, {
-      user_id: userId,
+    const request = new DataView(new ArrayBuffer(12));
+    request.setBigUint64(0, BigInt(userId), true);
+    request.setUint32(8, ackVersions["/sync-passive"], true);
+    const view = await postWire("/sync-passive", request.buffer);
+
+    const result: { earned: number; points: number; profitPerHour?: number } = {
+      earned: Number(view.getBigInt64(5, true)),
+      points: Number(view.getBigInt64(13, true)),
+    };
+    if (view.getUint8(0) & HAS_STATE) {
+      result.profitPerHour = Number(view.getBigInt64(21, true));
+    }
+    return result;
+  },
+  getGlobalStats: async (): Promise<GlobalStats> => {
+    const response = await apiClient.get("/stats");
+    return response.data;
+  },
+  // Live balance / rank pushes (Server-Sent Events). Returns an unsubscribe function.
+  subscribeEvents: (
+    userId: number,
+    onState: (state: { points: number; rank: number | null }) => void,
+  ) => {
+    let source: EventSource | null = null;
+    let closed = false;
+    sessionReady.then(() => {
+      if (closed) return;
+      // EventSource can't send headers; the session goes in the query string
+      const query = sessionToken
+        ? `?session=${encodeURIComponent(sessionToken)}`
+        : "";
+      source = new EventSource(`${VITE_API_URL}/events/${userId}${query}`);
+      source.addEventListener("state", (event) => {
+        onState(JSON.parse((event as MessageEvent).data));
+      });
     });
-    // Map snake_case from backend to camelCase for frontend
-    return {
-      earned: response.data.earned,
-      points: response.data.points,
-      profitPerHour: response.data.profit_per_hour, // Important mapping
+    return () => {
+      closed = true;
+      source?.close();
     };
   },
   // NEW METHOD
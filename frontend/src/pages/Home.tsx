@@ -6,9 +6,11 @@ import { api } from "../api/client";
 import { Coin } from "../components/Coin";
 import { Boost } from "./Boost";
 import { ModernTicker } from "../components/ModernTicker";
+import type { GlobalStats } from "../types";
 
 export const Home = () => {
   const [currentView, setCurrentView] = useState<"game" | "boost">("game");
+  const [globalStats, setGlobalStats] = useState<GlobalStats | null>(null);
   const balanceControls = useAnimation();
   const { user, expand, hapticFeedback } = useTelegram();
 
@@ -49,13 +51,15 @@ export const Home = () => {
     }
   }, [expand]);
 
+  // Balance changes from referrals and task claims are pushed by the server
   useEffect(() => {
-    if (user?.id) {
-      api
-        .login(user)
-        .then((data) => setGameState(data.gameState))
-        .catch(console.error);
-    }
+    if (!user?.id) return;
+    return api.subscribeEvents(user.id, (state) => {
+      // Local taps not yet synced would be overwritten by the pushed balance
+      if (unsyncedTaps.current === 0 && Date.now() - lastTapRef.current > 2000) {
+        setGameState({ points: state.points });
+      }
+    });
   }, [user?.id, setGameState]);
 
   useEffect(() => {
@@ -76,6 +80,15 @@ export const Home = () => {
     return () => clearInterval(interval);
   }, [user?.id, setGameState]);
 
+  // Game-wide totals; the server only re-aggregates them every few seconds
+  useEffect(() => {
+    const load = () =>
+      api.getGlobalStats().then(setGlobalStats).catch(console.error);
+    load();
+    const interval = setInterval(load, 30000);
+    return () => clearInterval(interval);
+  }, []);
+
   useEffect(() => {
     const timer = setInterval(() => {
       if (energyRef.current < maxEnergy) restoreEnergy(energyRegen);
@@ -109,6 +122,13 @@ export const Home = () => {
     });
   }, [incrementPoints, decrementEnergy, balanceControls, hapticFeedback]);
 
+  const formatCount = (num: number) => {
+    if (num >= 1000000000) return `${(num / 1000000000).toFixed(1)}B`;
+    if (num >= 1000000) return `${(num / 1000000).toFixed(1)}M`;
+    if (num >= 1000) return `${(num / 1000).toFixed(1)}k`;
+    return `${num}`;
+  };
+
   const formatProfit = (num: number) => {
     if (num >= 1000000) return `+${(num / 1000000).toFixed(2)}M`;
     if (num >= 1000) return `+${(num / 1000).toFixed(1)}k`;
@@ -178,6 +198,13 @@ export const Home = () => {
                     <ModernTicker value={points} />
                   </motion.div>
                 </div>
+                {globalStats && (
+                  <span className="text-[10px] text-gray-400 mt-1">
+                    {formatCount(globalStats.players)} players ·{" "}
+                    {formatCount(globalStats.points_minted)} coins mined ·{" "}
+                    {formatCount(globalStats.taps)} taps
+                  </span>
+                )}
               </div>
             </div>
 
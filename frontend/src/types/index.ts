@@ -137,3 +137,29 @@ export interface ReferralResponse {
   friends: FriendInfo[];
   total_earned: number;
 }
+
+export interface GlobalStats {
+  taps: number;
+  points_minted: number;
+  players: number;
+  updated_at: number;
+}
+
+// Everything the app shows on open, from one request
+export interface BootstrapResponse {
+  user: User;
+  gameState: GameState;
+  passive: {
+    earned: number;
+    points: number;
+    profit_per_hour: number;
+  };
+  tasks: UserTasksResponse;
+  referral: {
+    referral_code: string | null;
+    link: string | null;
+    friends_count: number;
+    total_earned: number;
+  };
+  session: string | null;
+}